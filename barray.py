@@ -0,0 +1,145 @@
+"""
+连续存储的数值数组：Array[Int]、Array[Float]、Array[Bool]
+装了numpy就用ndarray，否则用array模块的缓冲区，外面包一层memoryview
+逐元素运算、比较和归约都是对整个数组的一次调用，不用在Butterfly里逐个元素地循环
+切片返回共享存储的视图，不拷贝
+运算符照常注册在方法表里，数组和数组、数组和标量都可以运算
+"""
+import operator
+from array import array
+from itertools import repeat
+from typing import Any, Callable, Iterable
+
+from berror import BValueError
+from bio import output
+from btype import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Kind:
+    """一种元素类型的数组：对应的TypeDetail、元素类型和存储格式"""
+
+    def __init__(self, elem: TypeDetail, typecode: str, dtype: str, py: type):
+        self.elem, self.typecode, self.dtype, self.py = elem, typecode, dtype, py
+        self.name = "Array[{}]".format(elem.name)
+        self.tp = TypeDetail(self.name, {}, {}, [])
+
+    def make(self, items: Iterable) -> Value:
+        # items可能是惰性的逐元素运算，除零和溢出在这里才抛出来
+        try:
+            if numpy is not None:
+                return Value(self.tp, numpy.fromiter(items, self.dtype))
+            return Value(self.tp, memoryview(array(self.typecode, items)))
+        except ZeroDivisionError:
+            raise BValueError("division by zero in array operation") from None
+        except OverflowError:
+            raise BValueError("{} element out of range".format(self.name)) from None
+
+    def wrap(self, buf: Any) -> Value:
+        # numpy运算的结果类型由numpy决定，这里统一转成这种数组的dtype
+        if numpy is not None and buf.dtype != self.dtype:
+            buf = buf.astype(self.dtype)
+        return Value(self.tp, buf)
+
+    def item(self, x: Any) -> Value:
+        # numpy的标量和array('b')的0/1都转成Python的值
+        return Value(self.elem, self.py(x))
+
+
+def elementwise(fn: Callable, a: Any, b: Any, scalar: bool, res: Kind) -> Value:
+    if not scalar and len(a) != len(b):
+        raise BValueError("array length mismatch: {} and {}".format(len(a), len(b)))
+    if numpy is not None:
+        return res.wrap(fn(a, b))
+    return res.make(map(fn, a, repeat(b) if scalar else b))
+
+
+def binary(op: str, res: Kind, scalar: bool) -> Callable[[Value, Value], Value]:
+    fn = getattr(operator, op)
+    return lambda a, b: elementwise(fn, a.val, b.val, scalar, res)
+
+
+def negate(kind: Kind) -> Callable[[Value], Value]:
+    if numpy is not None:
+        return lambda a: kind.wrap(-a.val)
+    return lambda a: kind.make(map(operator.neg, a.val))
+
+
+def reduce(kind: Kind, fn: Callable, name: str) -> Callable[[Value], Value]:
+    def run(a: Value) -> Value:
+        if not len(a.val):
+            raise BValueError("{}() of an empty array".format(name))
+        # ndarray自己的min()/max()不用逐个元素转成Python对象
+        return kind.item(getattr(a.val, name)() if numpy is not None else fn(a.val))
+    return run
+
+
+def total(kind: Kind) -> Callable[[Value], Value]:
+    if numpy is not None:
+        return lambda a: kind.item(a.val.sum())
+    return lambda a: kind.item(sum(a.val))
+
+
+def index(a: Value, i: Value) -> int:
+    if not -len(a.val) <= i.val < len(a.val):
+        raise BValueError("array index {} out of range".format(i.val))
+    return i.val
+
+
+def toList(buf: Any) -> list:
+    return buf.tolist()
+
+
+arithmetic = {'+': '__add__', '-': '__sub__', '*': '__mul__', '/': '__truediv__'}
+comparison = {'==': '__eq__', '!=': '__ne__', '>': '__gt__', '<': '__lt__', '>=': '__ge__', '<=': '__le__'}
+
+
+def install(scope: Scope, elems: dict[str, TypeDetail]):
+    """在scope里注册数组类型、运算符和批量操作的内置函数，elems是Int/Float/Bool的TypeDetail"""
+    kinds = {
+        'Int': Kind(elems['Int'], 'q', 'int64', int),
+        'Float': Kind(elems['Float'], 'd', 'float64', float),
+        'Bool': Kind(elems['Bool'], 'b', 'bool', bool),
+    }
+    IntType, NoneType = BasicType('Int'), BasicType('None')
+    Int = elems['Int']
+    for name, kind in kinds.items():
+        tp, array_type, elem_type = kind.tp, BasicType(kind.name), BasicType(name)
+        scope.types[kind.name] = tp
+        tp.method['operator init', ()] = (array_type, lambda this, kind=kind: kind.make(()))
+        if name != 'Bool':
+            for op, pyop in arithmetic.items():
+                # Int数组的/和Int一样得到Float
+                res = kinds['Float'] if op == '/' else kind
+                tp.method['operator' + op, (array_type,)] = (BasicType(res.name), binary(pyop, res, False))
+                tp.method['operator' + op, (elem_type,)] = (BasicType(res.name), binary(pyop, res, True))
+            tp.method['operator-', ()] = (array_type, negate(kind))
+            mask = kinds['Bool']
+            for op, pyop in comparison.items():
+                tp.method['operator' + op, (array_type,)] = (BasicType(mask.name), binary(pyop, mask, False))
+                tp.method['operator' + op, (elem_type,)] = (BasicType(mask.name), binary(pyop, mask, True))
+            scope.defineFunc(('min', (array_type,)), (elem_type, reduce(kind, min, 'min')))
+            scope.defineFunc(('max', (array_type,)), (elem_type, reduce(kind, max, 'max')))
+            scope.defineFunc(('fill', (IntType, elem_type)),
+                             (array_type, lambda n, v, kind=kind: kind.make(repeat(v.val, n.val))))
+        # Bool数组求和就是数True的个数
+        res = kinds['Int'] if name == 'Bool' else kind
+        scope.defineFunc(('sum', (array_type,)), (BasicType(res.elem.name), total(res)))
+        scope.defineFunc(('len', (array_type,)), (IntType, lambda a: Value(Int, len(a.val))))
+        scope.defineFunc(('get', (array_type, IntType)),
+                         (elem_type, lambda a, i, kind=kind: kind.item(a.val[index(a, i)])))
+        scope.defineFunc(('set', (array_type, IntType, elem_type)), (NoneType, setItem))
+        scope.defineFunc(('slice', (array_type, IntType, IntType)),
+                         (array_type, lambda a, i, j, tp=tp: Value(tp, a.val[i.val:j.val])))
+        scope.defineFunc(('copy', (array_type,)), (array_type, lambda a, kind=kind: kind.make(toList(a.val))))
+        scope.defineFunc(('print', (array_type,)), (NoneType, lambda a, kind=kind: output.write("{}\n".format(list(map(kind.py, toList(a.val)))))))
+    scope.defineFunc(('range', (IntType,)), (BasicType(kinds['Int'].name),
+                                             lambda n: kinds['Int'].make(range(n.val))))
+
+
+def setItem(a: Value, i: Value, v: Value):
+    a.val[index(a, i)] = v.val
@@ -3,55 +3,16 @@ from btype import *
 from btype import Scope, Type, Value
 
 
-class Scope:
-    def __init__(self, parent: "Scope | None" = None):
-        self.parent = parent
-        self.variables: dict[str, Any] = {}
-        self.types: dict[str, TypeDetail] = {}
-        self.funcs: dict[str, FuncDetail] = {}
-
-    def findVar(self, name: str):
-        if name in self.variables:
-            return self.variables[name]
-        elif self.parent:
-            return self.parent.findVar(name)
-        else:
-            raise BNameError("undefined variable '{}'".format(name))
-
-    def findFunc(self, name: str):
-        if name in self.funcs:
-            return self.funcs[name]
-        elif self.parent:
-            return self.parent.findFunc(name)
-        else:
-            raise BNameError("undefined function '{}'".format(name))
+break_signal = RunSignal(RunSignal.BREAK)
+continue_signal = RunSignal(RunSignal.CONTINUE)
 
-    def findType(self, name: str):
-        if name in self.types:
-            return self.types[name]
-        elif self.parent:
-            return self.parent.findType(name)
-        else:
-            raise BNameError("undefined function '{}'".format(name))
-
-    def setVar(self, name: str, value):
-        if name in self.types:
-            self.types[name] = value
-        elif self.parent:
-            self.parent.setVar(name, value)
-        else:
-            raise BNameError("undefined variable '{}'".format(name))
-
-
-class RunSignal:
-    RETURN, BREAK, CONTINUE = 0, 1, 2
-
-    def __init__(self, signal, ret_value=None):
-        self.signal, self.ret_value = signal, ret_value
+# 树解释器里Const/BinaryOp/FuncCall执行这么多次后换成特化的版本，类型守卫失败就换回来
+QUICKEN_AT = 16
+quick_stats = {'quickened': 0, 'deoptimized': 0}
 
 
 class Stmt:
-    def __init__(self, pos: tuple[int, int] | None):
+    def __init__(self, pos: int | None):
         self.pos = pos
 
     def check(self, scope: Scope) -> Type | None:
@@ -60,9 +21,13 @@ class Stmt:
     def visit(self, scope: Scope) -> RunSignal | None:
         ...
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        # 没有专门实现的节点退回解释执行
+        return self.visit
+
 
 class Expr:
-    def __init__(self, pos: tuple[int, int] | None):
+    def __init__(self, pos: int | None):
         self.pos = pos
 
     def check(self, scope: Scope) -> Type:
@@ -71,11 +36,40 @@ class Expr:
     def visit(self, scope: Scope) -> Value:
         ...
 
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        return self.visit
+
+    def compileRaw(self, scope: Scope) -> Callable[[Scope], Any]:
+        """编译成直接返回Python值的函数，check已经确定是基本类型时中间结果不装箱"""
+        code = self.compile(scope)
+        return lambda scope: code(scope).val
+
 
 class Block(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, stmts: list[Stmt]):
+    def __init__(self, pos: int | None, stmts: list[Stmt]):
         super().__init__(pos)
         self.stmts = stmts
+        # 作为If/While/函数体时需要的槽数，检查时确定
+        self.nslots = 0
+        # 没有声明变量和函数的If/While体不单独建作用域
+        self.scoped = True
+
+    def declares(self) -> bool:
+        # 裸块和外层共用作用域要算进来，If/While/函数体有自己的作用域不用看
+        for stmt in self.stmts:
+            if isinstance(stmt, (VarDecl, FuncDef)) or isinstance(stmt, Block) and stmt.declares():
+                return True
+        return False
+
+    def checkNested(self, scope: Scope) -> Type | None:
+        self.scoped = self.declares()
+        if not self.scoped:
+            self.nslots = 0
+            return self.check(scope)
+        inner = Scope(scope)
+        ret_type = self.check(inner)
+        self.nslots = len(inner.slots)
+        return ret_type
 
     def check(self, scope: Scope) -> Type | None:
         ret_type = None
@@ -94,14 +88,82 @@ class Block(Stmt):
             if ret:
                 return ret
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        stmts = [stmt.compile(scope) for stmt in self.stmts]
+        if not stmts:
+            return lambda scope: None
+        if len(stmts) == 1:
+            return stmts[0]
+        if len(stmts) == 2:
+            first, second = stmts
+
+            def run(scope: Scope) -> RunSignal | None:
+                return first(scope) or second(scope)
+            return run
+
+        def run(scope: Scope) -> RunSignal | None:
+            for stmt in stmts:
+                ret = stmt(scope)
+                if ret:
+                    return ret
+        return run
+
+
+class LazyBlock(Block):
+    """
+    从预编译文件读出的函数体，第一次用到stmts时才解码
+    nslots和scoped在创建Func时就要用，随外层一起解码
+    """
+
+    def __init__(self, pos: int | None, loader: Callable[[], list[Stmt]], nslots: int, scoped: bool):
+        Stmt.__init__(self, pos)
+        self.loader: Callable[[], list[Stmt]] | None = loader
+        self._stmts: list[Stmt] | None = None
+        self.nslots, self.scoped = nslots, scoped
+        # 解码后要对函数体做的事，比如给里面的函数装缓存，见eachFuncDef
+        self.onload: list[Callable[[Block], None]] = []
+
+    @property
+    def loaded(self) -> bool:
+        return self.loader is None
+
+    @property
+    def stmts(self) -> list[Stmt]:
+        if self.loader is not None:
+            self.stmts = self.loader()
+        return self._stmts
+
+    @stmts.setter
+    def stmts(self, stmts: list[Stmt]):
+        self._stmts, self.loader = stmts, None
+        hooks, self.onload = self.onload, []
+        for hook in hooks:
+            hook(self)
+
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        if self.loaded:
+            return super().compile(scope)
+        # 函数第一次被调用时才解码、编译
+        code = None
+
+        def run(inner: Scope) -> RunSignal | None:
+            nonlocal code
+            if code is None:
+                code = Block.compile(self, scope)
+            return code(inner)
+        return run
+
 
 class NoOp(Stmt):
-    def __init__(self, pos: tuple[int, int] | None):
+    def __init__(self, pos: int | None):
         super().__init__(pos)
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        return lambda scope: None
+
 
 class ExprStmt(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, expr: Expr):
+    def __init__(self, pos: int | None, expr: Expr):
         super().__init__(pos)
         self.expr = expr
 
@@ -113,33 +175,55 @@ class ExprStmt(Stmt):
         self.expr.visit(scope)
         return
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        expr = self.expr.compile(scope)
+
+        def run(scope: Scope) -> RunSignal | None:
+            expr(scope)
+        return run
+
 
 class VarDecl(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, vardecls: list[tuple[str, Type, Expr]]):
+    def __init__(self, pos: int | None, vardecls: list[tuple[str, Type, Expr]]):
         super().__init__(pos)
         self.vardecls = vardecls
+        self.slots: list[int] = []
 
     def check(self, scope: Scope) -> Type | None:
-        for name, tp, _ in self.vardecls:
+        self.slots.clear()
+        for name, tp, val in self.vardecls:
             if isinstance(tp, BasicType):
                 scope.findType(tp.name)
-            scope.variables[name] = tp
+            if val is not None and val.check(scope) != tp:
+                raise BTypeError("conflicted type", self.pos)
+            self.slots.append(scope.declare(name, tp))
         return
 
     def visit(self, scope: Scope) -> RunSignal | None:
-        for name, tp, val in self.vardecls:
+        for (name, tp, val), slot in zip(self.vardecls, self.slots):
             if isinstance(tp, BasicType):
-                tpdetail: TypeDetail = scope.findType(tp.name)
                 if val is None:
-                    v = tpdetail.new()
+                    v = scope.findType(tp.name).new()
                 else:
                     v = val.visit(scope)
-                scope.variables[name] = Value(tpdetail, v)
+                scope.slots[slot] = v
         return
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        decls = []
+        for (name, tp, val), slot in zip(self.vardecls, self.slots):
+            if isinstance(tp, BasicType):
+                decls.append((slot, None if val is None else val.compile(scope), tp.name))
+
+        def run(scope: Scope) -> RunSignal | None:
+            slots = scope.slots
+            for slot, val, tp in decls:
+                slots[slot] = scope.findType(tp).new() if val is None else val(scope)
+        return run
+
 
 class If(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, cases: list[tuple[Expr, Block]], default: Block):
+    def __init__(self, pos: int | None, cases: list[tuple[Expr, Block]], default: Block):
         super().__init__(pos)
         self.cases, self.default = cases, default
 
@@ -147,174 +231,778 @@ class If(Stmt):
         ret_type = None
         for cond, body in self.cases:
             cond.check(scope)
-            ret = body.check(Scope(scope))
+            ret = body.checkNested(scope)
             if ret:
                 if not ret_type:
                     ret_type = ret
-                else:
+                elif ret_type != ret:
                     raise BTypeError("conflicted type", self.pos)
-        ret = self.default.check(scope)
+        ret = self.default.checkNested(scope)
         if ret:
             if not ret_type:
                 ret_type = ret
-            else:
+            elif ret_type != ret:
                 raise BTypeError("conflicted type", self.pos)
         return ret_type
 
     def visit(self, scope: Scope) -> RunSignal | None:
         for cond, body in self.cases:
-            if cond.visit(scope):
-                return body.visit(Scope(scope))
-        return self.default.visit(Scope(scope))
+            if cond.visit(scope).val:
+                return body.visit(Scope(scope, body.nslots) if body.scoped else scope)
+        default = self.default
+        return default.visit(Scope(scope, default.nslots) if default.scoped else scope)
+
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        # 槽数为None表示直接在外层作用域里执行
+        cases = [(cond.compileRaw(scope), body.compile(scope), body.nslots if body.scoped else None)
+                 for cond, body in self.cases]
+        default, default_slots = self.default.compile(scope), self.default.nslots if self.default.scoped else None
+        if len(cases) == 1 and not self.default.stmts:
+            (cond, body, nslots), = cases
+            if nslots is None:
+                return lambda scope: body(scope) if cond(scope) else None
+
+            def run(scope: Scope) -> RunSignal | None:
+                if cond(scope):
+                    return body(Scope(scope, nslots))
+            return run
+
+        def run(scope: Scope) -> RunSignal | None:
+            for cond, body, nslots in cases:
+                if cond(scope):
+                    return body(scope if nslots is None else Scope(scope, nslots))
+            return default(scope if default_slots is None else Scope(scope, default_slots))
+        return run
 
 
 class While(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, cond: Expr, body: Block):
+    def __init__(self, pos: int | None, cond: Expr, body: Block):
         super().__init__(pos)
         self.cond, self.body = cond, body
 
     def check(self, scope: Scope) -> Type | None:
         self.cond.check(scope)
-        return self.body.check(Scope(scope))
+        return self.body.checkNested(scope)
 
     def visit(self, scope: Scope) -> RunSignal | None:
-        while self.cond.visit(scope):
-            ret = self.body.visit(Scope(scope))
+        # 循环体的作用域每次执行循环只建一个，各轮复用：变量总是先经VarDecl赋值才会被读到
+        inner = Scope(scope, self.body.nslots) if self.body.scoped else scope
+        while self.cond.visit(scope).val:
+            ret = self.body.visit(inner)
             if isinstance(ret, RunSignal):
-                if ret.signal == RunSignal.RETURN:
-                    return ret
                 if ret.signal == RunSignal.BREAK:
                     break
+                if ret.signal != RunSignal.CONTINUE:
+                    return ret
         return
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        cond, body, nslots = self.cond.compileRaw(scope), self.body.compile(scope), self.body.nslots
+        scoped = self.body.scoped
+        BREAK, CONTINUE = RunSignal.BREAK, RunSignal.CONTINUE
+
+        def run(scope: Scope) -> RunSignal | None:
+            inner = Scope(scope, nslots) if scoped else scope
+            while cond(scope):
+                ret = body(inner)
+                if ret:
+                    if ret.signal == BREAK:
+                        break
+                    if ret.signal != CONTINUE:
+                        return ret
+        return run
+
 
 class FuncDef(Stmt):
-    def __init__(self, pos: tuple[int, int] | None, name: str, params: list[str], param_types: list[Type], ret_type: Type, body: Block):
+    def __init__(self, pos: int | None, name: str, params: list[str], param_types: list[Type], ret_type: Type, body: Block):
         super().__init__(pos)
         self.name, self.params, self.param_types, self.ret_type, self.body = name, params, param_types, ret_type, body
+        # check推断出的纯函数才能缓存结果；memo由bmemo按需装上，用来包装运行时创建的Func
+        self.pure = False
+        self.memo: Callable[[Func], Func] | None = None
+        # 函数体里有没有尾调用，记在这里，不用为了这个解码函数体
+        self.tailcalls = False
 
     def check(self, scope: Scope) -> Type | None:
         for param_type in self.param_types:
             if isinstance(param_type, BasicType):
                 scope.findType(param_type.name)
-        register_name = self.name + " " + ' '.join(map(str, self.param_types))
-        scope.funcs[register_name] = (self.ret_type, Func(self.params, self.body, scope))
+        key = self.name, tuple(self.param_types)
+        func = Func(self.params, self.body, scope)
+        # 递归调用自己时先当作纯函数
+        func.pure = True
+        scope.defineFunc(key, (self.ret_type, func))
         check_scope = Scope(scope)
-        check_scope.variables = dict(zip(self.params, self.param_types))
+        for name, tp in zip(self.params, self.param_types):
+            check_scope.declare(name, tp)
         ret_type = self.body.check(check_scope)
+        self.body.nslots = len(check_scope.slots)
+        # 没写返回类型的函数里可以写return;
+        if self.ret_type is None and ret_type == BasicType('None'):
+            ret_type = None
         if ret_type != self.ret_type:
             raise BTypeError("conflicted type", self.pos)
+        self.tailcalls = markTailCalls(self.body)
+        self.pure = func.pure = isPure(self, check_scope)
         return
 
     def visit(self, scope: Scope) -> RunSignal | None:
-        register_name = self.name + " " + ' '.join(map(str, self.param_types))
-        scope.funcs[register_name] = (self.ret_type, Func(self.params, self.body, scope))
+        func = Func(self.params, self.body, scope)
+        scope.defineFunc((self.name, tuple(self.param_types)), (self.ret_type, self.memo(func) if self.memo else func))
         return
 
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        key = self.name, tuple(self.param_types)
+        params, body, ret_type, memo = self.params, self.body, self.ret_type, self.memo
+        code = body.compile(scope)
+
+        def run(scope: Scope) -> RunSignal | None:
+            func = Func(params, body, scope, code)
+            scope.defineFunc(key, (ret_type, memo(func) if memo else func))
+        return run
+
+
+def eachFuncDef(node: Stmt, fn: Callable[[FuncDef], None]):
+    """对所有函数定义调用fn，还没解码的函数体等解码时再处理，不会因此提前解码"""
+    if isinstance(node, LazyBlock) and not node.loaded:
+        node.onload.append(lambda body: eachFuncDef(body, fn))
+    elif isinstance(node, Block):
+        for i in node.stmts:
+            eachFuncDef(i, fn)
+    elif isinstance(node, If):
+        for _, body in node.cases:
+            eachFuncDef(body, fn)
+        eachFuncDef(node.default, fn)
+    elif isinstance(node, While):
+        eachFuncDef(node.body, fn)
+    elif isinstance(node, FuncDef):
+        fn(node)
+        eachFuncDef(node.body, fn)
+
+
+def funcdefs(node: Stmt) -> list[FuncDef]:
+    """语法树里所有的函数定义，包括嵌套的"""
+    if isinstance(node, Block):
+        return [j for i in node.stmts for j in funcdefs(i)]
+    elif isinstance(node, If):
+        return [j for _, body in node.cases for j in funcdefs(body)] + funcdefs(node.default)
+    elif isinstance(node, While):
+        return funcdefs(node.body)
+    elif isinstance(node, FuncDef):
+        return [node] + funcdefs(node.body)
+    return []
+
+
+primitive_types = {'Int', 'Float', 'Bool', 'String'}
+
+
+def isPure(node: FuncDef, scope: Scope) -> bool:
+    """
+    参数都是基本类型，不读写函数外的变量，只调用纯函数，结果就只取决于参数的值
+    只读外层变量也不行，外层变量改了以后缓存的结果就不对了
+    返回值也得是基本类型（或者没有），不然每次调用拿到的是同一个可变对象
+    """
+    for tp in node.param_types:
+        if not isinstance(tp, BasicType) or tp.name not in primitive_types:
+            return False
+    if node.ret_type is not None and (not isinstance(node.ret_type, BasicType)
+                                      or node.ret_type.name not in primitive_types):
+        return False
+    return pureStmt(node.body, 0, scope)
+
+
+def pureStmt(node: Stmt, level: int, scope: Scope) -> bool:
+    # level是相对函数作用域嵌套了几层，层数超过level的变量在函数外面
+    if isinstance(node, Block):
+        return all(pureStmt(i, level, scope) for i in node.stmts)
+    elif isinstance(node, ExprStmt):
+        return pureExpr(node.expr, level, scope)
+    elif isinstance(node, VarDecl):
+        return all(pureExpr(val, level, scope) for _, _, val in node.vardecls if val is not None)
+    elif isinstance(node, If):
+        return (all(pureExpr(cond, level, scope) and pureStmt(body, level + body.scoped, scope)
+                    for cond, body in node.cases)
+                and pureStmt(node.default, level + node.default.scoped, scope))
+    elif isinstance(node, While):
+        return pureExpr(node.cond, level, scope) and pureStmt(node.body, level + node.body.scoped, scope)
+    elif isinstance(node, Return):
+        return node.val is None or pureExpr(node.val, level, scope)
+    # 嵌套的函数定义保守地当作不纯
+    return isinstance(node, (NoOp, Break, Continue))
+
+
+def pureExpr(node: Expr, level: int, scope: Scope) -> bool:
+    if isinstance(node, Const):
+        return True
+    elif isinstance(node, Variable):
+        return node.depth <= level
+    elif isinstance(node, Assign):
+        return node.depth <= level and pureExpr(node.val, level, scope)
+    elif isinstance(node, (BinaryOp, UnaryOp)):
+        if not getattr(node.impl, 'pure', hasattr(node.impl, 'pyop')):
+            return False
+        children = (node.left, node.right) if isinstance(node, BinaryOp) else (node.val,)
+        return all(pureExpr(i, level, scope) for i in children)
+    elif isinstance(node, FuncCall):
+        if not all(pureExpr(i, level, scope) for i in node.args):
+            return False
+        if node.impl is not None:
+            # 内置运算是纯的，其他内置函数（比如print）要标记pure才算
+            return getattr(node.impl, 'pure', hasattr(node.impl, 'pyop'))
+        if node.depth < level:
+            return False
+        for _ in range(node.depth - level):
+            scope = scope.parent
+        func = scope.funcs.get(node.key)
+        return func is not None and getattr(func[1], 'pure', False)
+    return False
+
+
+def markTailCalls(body: Stmt) -> bool:
+    """函数体里return用户函数调用的地方是尾调用，嵌套的函数由它自己的check处理，返回有没有尾调用"""
+    if isinstance(body, Block):
+        return any([markTailCalls(stmt) for stmt in body.stmts])
+    elif isinstance(body, If):
+        return any([markTailCalls(case) for _, case in body.cases]) | markTailCalls(body.default)
+    elif isinstance(body, While):
+        return markTailCalls(body.body)
+    elif isinstance(body, Return):
+        body.tail = isinstance(body.val, FuncCall) and body.val.key is not None
+        return body.tail
+    return False
+
+
+class Return(Stmt):
+    def __init__(self, pos: int | None, val: Expr | None):
+        super().__init__(pos)
+        self.val = val
+        self.signal = RunSignal(RunSignal.RETURN)
+        # 尾调用不在这里调用，把函数和参数交给外层的Func.__call__
+        self.tail = False
+        self.tail_signal = RunSignal(RunSignal.TAILCALL)
+
+    def check(self, scope: Scope) -> Type | None:
+        if self.val is None:
+            return BasicType('None')
+        return self.val.check(scope)
+
+    def visit(self, scope: Scope) -> RunSignal | None:
+        if self.tail:
+            call = self.val
+            args = [i.visit(scope) for i in call.args]
+            func = call.target(scope, args)
+            if type(func) is Func:
+                signal = self.tail_signal
+                signal.ret_value = (func, args)
+                return signal
+            val = func(*args)
+        else:
+            # 先求值再写入，求值时递归执行到同一个return也不会互相覆盖
+            val = None if self.val is None else self.val.visit(scope)
+        signal = self.signal
+        signal.ret_value = val
+        return signal
+
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        signal = self.signal
+        if self.val is None:
+            return lambda scope: signal
+        if self.tail:
+            args, target, tail_signal = [i.compile(scope) for i in self.val.args], self.val.target, self.tail_signal
+
+            def run(scope: Scope) -> RunSignal:
+                vals = [arg(scope) for arg in args]
+                func = target(scope, vals)
+                if type(func) is Func:
+                    tail_signal.ret_value = (func, vals)
+                    return tail_signal
+                signal.ret_value = func(*vals)
+                return signal
+            return run
+        val = self.val.compile(scope)
+
+        def run(scope: Scope) -> RunSignal:
+            signal.ret_value = val(scope)
+            return signal
+        return run
+
+
+class Break(Stmt):
+    # 循环外的break/continue一直传到Func.call，当作没有返回值的return，结束当前函数
+    # 其他后端都照这个语义实现
+
+    def __init__(self, pos: int | None):
+        super().__init__(pos)
+
+    def visit(self, scope: Scope) -> RunSignal | None:
+        return break_signal
+
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        return lambda scope: break_signal
+
+
+class Continue(Stmt):
+    def __init__(self, pos: int | None):
+        super().__init__(pos)
+
+    def visit(self, scope: Scope) -> RunSignal | None:
+        return continue_signal
+
+    def compile(self, scope: Scope) -> Callable[[Scope], RunSignal | None]:
+        return lambda scope: continue_signal
+
+
+const_types = {
+    int: BasicType('Int'),
+    float: BasicType('Float'),
+    bool: BasicType('Bool'),
+    str: BasicType('String'),
+}
+
 
 class Const(Expr):
-    def __init__(self, pos: tuple[int, int] | None, val: Any):
+    def __init__(self, pos: int | None, val: Any):
         super().__init__(pos)
         self.val = val
+        self.hits = 0
 
     def check(self, scope: Scope) -> Type:
-        tp = type(self.val).__name__
-        return {
-            'int': BasicType('Int'),
-            'float': BasicType('Float'),
-            'bool': BasicType('Bool'),
-            'str': BasicType('String'),
-        }[tp]
+        return const_types[type(self.val)]
     
     def visit(self, scope: Scope) -> Value:
-        tp = type(self.val).__name__
-        tp = {
-            'int': 'Int',
-            'float': 'Float',
-            'bool': 'Bool',
-            'str': 'String',
-        }[tp]
-        return Value(scope.findType(tp), self.val)
-    
+        val = Value(scope.findType(const_types[type(self.val)].name), self.val)
+        self.hits += 1
+        if self.hits == QUICKEN_AT:
+            # 常量的类型不会变，记下装好箱的值，以后不用再查类型
+            self.value = val
+            self.__class__ = QuickConst
+            quick_stats['quickened'] += 1
+        return val
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        try:
+            val = self.visit(scope)
+        except BNameError:
+            # 类型未注册，留到运行时再报错
+            return self.visit
+        return lambda scope: val
+
+    def compileRaw(self, scope: Scope) -> Callable[[Scope], Any]:
+        val = self.val
+        return lambda scope: val
+
+
+class QuickConst(Const):
+    def visit(self, scope: Scope) -> Value:
+        return self.value
+
 
 class Variable(Expr):
-    def __init__(self, pos: tuple[int, int] | None, name: str):
+    def __init__(self, pos: int | None, name: str):
         super().__init__(pos)
         self.name = name
+        # 由check解析成(层数, 槽号)
+        self.depth: int | None = None
+        self.slot: int | None = None
 
     def check(self, scope: Scope) -> Type:
-        return scope.findVar(self.name)
+        self.depth, self.slot, tp = scope.resolve(self.name)
+        return tp
     
     def visit(self, scope: Scope) -> Value:
-        return scope.findVar(self.name)
-    
+        for _ in range(self.depth):
+            scope = scope.parent
+        return scope.slots[self.slot]
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        depth, slot = self.depth, self.slot
+        if depth == 0:
+            return lambda scope: scope.slots[slot]
+        if depth == 1:
+            return lambda scope: scope.parent.slots[slot]
+        if depth == 2:
+            return lambda scope: scope.parent.parent.slots[slot]
+        return self.visit
+
+    def compileRaw(self, scope: Scope) -> Callable[[Scope], Any]:
+        depth, slot = self.depth, self.slot
+        if depth == 0:
+            return lambda scope: scope.slots[slot].val
+        if depth == 1:
+            return lambda scope: scope.parent.slots[slot].val
+        return super().compileRaw(scope)
+
+
+class Assign(Expr):
+    def __init__(self, pos: int | None, name: str, val: Expr):
+        super().__init__(pos)
+        self.name, self.val = name, val
+        self.depth: int | None = None
+        self.slot: int | None = None
+
+    def check(self, scope: Scope) -> Type:
+        tp = self.val.check(scope)
+        self.depth, self.slot, var_tp = scope.resolve(self.name)
+        if tp != var_tp:
+            raise BTypeError("conflicted type", self.pos)
+        return tp
+
+    def visit(self, scope: Scope) -> Value:
+        val = self.val.visit(scope)
+        for _ in range(self.depth):
+            scope = scope.parent
+        scope.slots[self.slot] = val
+        return val
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        depth, slot, val = self.depth, self.slot, self.val.compile(scope)
+        if depth == 0:
+            def run(scope: Scope) -> Value:
+                v = scope.slots[slot] = val(scope)
+                return v
+            return run
+
+        def run(scope: Scope) -> Value:
+            v = val(scope)
+            frame = scope
+            for _ in range(depth):
+                frame = frame.parent
+            frame.slots[slot] = v
+            return v
+        return run
+
+
+def bindFunc(node: Expr, scope: Scope, key: FuncKey) -> Type:
+    """
+    check时解析函数，内置函数直接把实现记在node.impl上；
+    用户函数运行时才会创建Func，只能记下所在作用域层数和键名
+    """
+    depth, (ret_type, impl) = scope.lookupFunc(key)
+    if isinstance(impl, Func):
+        node.impl, node.depth, node.key = None, depth, key
+    else:
+        node.impl, node.depth, node.key = impl, None, None
+    return ret_type
+
+
+def boundFunc(node: Expr, scope: Scope) -> Callable | None:
+    if node.impl is not None:
+        return node.impl
+    if node.key is None:
+        return None
+    for _ in range(node.depth):
+        scope = scope.parent
+    func = scope.funcs.get(node.key)
+    return func and func[1]
+
+
+def typeDetail(tp: Type, scope: Scope) -> "TypeDetail | None":
+    # 只用于运行时的类型守卫，类型未注册时守卫总是失败，走慢路径
+    try:
+        return tp.getDetail(scope)
+    except BNameError:
+        return None
+
 
 class BinaryOp(Expr):
-    def __init__(self, pos: tuple[int, int] | None, op: str, left: Expr, right: Expr):
+    def __init__(self, pos: int | None, op: str, left: Expr, right: Expr):
         super().__init__(pos)
         self.op, self.left, self.right = op, left, right
+        # check时解析出的实现，运行时操作数类型与之一致就直接调用
+        self.impl: Callable | None = None
+        self.depth: int | None = None
+        self.key: FuncKey | None = None
+        self.left_tp: TypeDetail | None = None
+        self.right_tp: TypeDetail | None = None
+        # check得到的静态类型
+        self.tp: Type | None = None
+        self.hits = 0
 
     def check(self, scope: Scope) -> Type:
         op = self.op
         left = self.left.check(scope)
         right = self.right.check(scope)
         left_detail = left.getDetail(scope)
-        # right_detail = right.getDetail(scope)
-        opname = "operator" + op + " this " + str(right)
-        if left_detail.hasMethod(opname):
-            return left_detail.getMethod(opname)[0]
-        opname = "operator" + op + " " + str(left) + " " + str(right)
-        return scope.findFunc(opname)[0]
+        self.left_tp, self.right_tp = left_detail, typeDetail(right, scope)
+        method = left_detail.findMethod(("operator" + op, (right,)), [self.right_tp])
+        if method is not None:
+            self.tp, self.impl = method
+            self.depth = self.key = None
+            return self.tp
+        self.tp = bindFunc(self, scope, ("operator" + op, (left, right)))
+        return self.tp
 
     def visit(self, scope: Scope) -> Value:
-        op = self.op
         left = self.left.visit(scope)
         right = self.right.visit(scope)
-        opname = "operator" + op + " this " + str(right.tp.toType())
-        if left.tp.hasMethod(opname):
-            return left.tp.getMethod(opname)[1](left, right)
-        opname = "operator" + op + " " + str(left.tp.toType()) + " " + str(right.tp.toType)
-        return scope.findFunc(opname)[1](left, right)
-    
+        self.hits += 1
+        if self.hits == QUICKEN_AT:
+            self.quicken()
+        if left.tp is self.left_tp and right.tp is self.right_tp:
+            impl = boundFunc(self, scope)
+            if impl is not None:
+                return impl(left, right)
+        return self.dispatch(scope, left, right)
+
+    def quicken(self):
+        # 只有内置的基本类型运算能特化，去掉后只会再执行通用版本
+        if hasattr(self.impl, 'pyfn'):
+            self.pyfn, self.box = self.impl.pyfn, self.impl.box
+            self.__class__ = QuickBinaryOp
+            quick_stats['quickened'] += 1
+
+    def dispatch(self, scope: Scope, left: Value, right: Value) -> Value:
+        name = "operator" + self.op
+        method = left.tp.findMethod((name, (right.tp.toType(),)), [right.tp])
+        if method is not None:
+            return method[1](left, right)
+        return scope.findFunc((name, (left.tp.toType(), right.tp.toType())))[1](left, right)
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        if hasattr(self.impl, 'pyfn'):
+            # 内置的基本类型运算：操作数不装箱，只把结果装箱一次
+            raw, box = self.compileRaw(scope), self.impl.box
+            return lambda scope: box(raw(scope))
+        left, right, dispatch = self.left.compile(scope), self.right.compile(scope), self.dispatch
+        impl, left_tp, right_tp = self.impl, self.left_tp, self.right_tp
+        if impl is None:
+            def run(scope: Scope) -> Value:
+                l, r = left(scope), right(scope)
+                if l.tp is left_tp and r.tp is right_tp:
+                    func = boundFunc(self, scope)
+                    if func is not None:
+                        return func(l, r)
+                return dispatch(scope, l, r)
+            return run
+
+        def run(scope: Scope) -> Value:
+            l, r = left(scope), right(scope)
+            if l.tp is left_tp and r.tp is right_tp:
+                return impl(l, r)
+            return dispatch(scope, l, r)
+        return run
+
+    def compileRaw(self, scope: Scope) -> Callable[[Scope], Any]:
+        pyfn = getattr(self.impl, 'pyfn', None)
+        if pyfn is None:
+            return super().compileRaw(scope)
+        # 内置运算的两边类型由check保证，不需要运行时守卫
+        left, right = self.left.compileRaw(scope), self.right.compileRaw(scope)
+        return lambda scope: pyfn(left(scope), right(scope))
+
+
+class QuickBinaryOp(BinaryOp):
+    """热点的内置运算，守卫通过后直接用Python运算符算出结果再装箱"""
+
+    def visit(self, scope: Scope) -> Value:
+        left = self.left.visit(scope)
+        right = self.right.visit(scope)
+        if left.tp is self.left_tp and right.tp is self.right_tp:
+            return self.box(self.pyfn(left.val, right.val))
+        self.__class__ = BinaryOp
+        quick_stats['deoptimized'] += 1
+        return self.dispatch(scope, left, right)
+
 
 class UnaryOp(Expr):
-    def __init__(self, pos: tuple[int, int], op: str, val: Expr):
+    def __init__(self, pos: int | None, op: str, val: Expr):
         super().__init__(pos)
         self.op, self.val = op, val
+        self.impl: Callable | None = None
+        self.depth: int | None = None
+        self.key: FuncKey | None = None
+        self.val_tp: TypeDetail | None = None
+        self.tp: Type | None = None
 
     def check(self, scope: Scope) -> Type:
         op = self.op
         val = self.val.check(scope)
         val_detail = val.getDetail(scope)
-        opname = "operator" + op + " this"
-        if val_detail.hasMethod(opname):
-            return val_detail.getMethod(opname)[0]
-        opname = "operator" + op + " " + str(val)
-        return scope.findFunc(opname)[0]
+        self.val_tp = val_detail
+        method = val_detail.findMethod(("operator" + op, ()))
+        if method is not None:
+            self.tp, self.impl = method
+            self.depth = self.key = None
+            return self.tp
+        self.tp = bindFunc(self, scope, ("operator" + op, (val,)))
+        return self.tp
     
     def visit(self, scope: Scope) -> Value:
-        op = self.op
         val = self.val.visit(scope)
-        opname = "operator" + op + " this"
-        if val.tp.hasMethod(opname):
-            return val.tp.getMethod(opname)[1](val)
-        opname = "operator" + op + " " + str(val.tp.toType())
-        return scope.findFunc(opname)[1](val)
+        if val.tp is self.val_tp:
+            impl = boundFunc(self, scope)
+            if impl is not None:
+                return impl(val)
+        return self.dispatch(scope, val)
+
+    def dispatch(self, scope: Scope, val: Value) -> Value:
+        name = "operator" + self.op
+        method = val.tp.findMethod((name, ()))
+        if method is not None:
+            return method[1](val)
+        return scope.findFunc((name, (val.tp.toType(),)))[1](val)
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        if hasattr(self.impl, 'pyfn'):
+            raw, box = self.compileRaw(scope), self.impl.box
+            return lambda scope: box(raw(scope))
+        val, dispatch = self.val.compile(scope), self.dispatch
+        impl, val_tp = self.impl, self.val_tp
+        if impl is None:
+            def run(scope: Scope) -> Value:
+                v = val(scope)
+                if v.tp is val_tp:
+                    func = boundFunc(self, scope)
+                    if func is not None:
+                        return func(v)
+                return dispatch(scope, v)
+            return run
+
+        def run(scope: Scope) -> Value:
+            v = val(scope)
+            if v.tp is val_tp:
+                return impl(v)
+            return dispatch(scope, v)
+        return run
+
+    def compileRaw(self, scope: Scope) -> Callable[[Scope], Any]:
+        pyfn = getattr(self.impl, 'pyfn', None)
+        if pyfn is None:
+            return super().compileRaw(scope)
+        val = self.val.compileRaw(scope)
+        return lambda scope: pyfn(val(scope))
 
 
 class FuncCall(Expr):
-    def __init__(self, pos: tuple[int, int], func: str, args: list[Expr]):
+    def __init__(self, pos: int | None, func: str, args: list[Expr]):
         super().__init__(pos)
         self.func, self.args = func, args
+        self.impl: Callable | None = None
+        self.depth: int | None = None
+        self.key: FuncKey | None = None
+        self.arg_tps: list[TypeDetail | None] = []
+        self.tp: Type | None = None
+        self.hits = 0
 
     def check(self, scope: Scope) -> Type:
         args = [i.check(scope) for i in self.args]
-        funcname = self.func + " " + " ".join(map(str, args))
-        func = scope.findFunc(funcname)
-        return func[0]
+        self.tp = bindFunc(self, scope, (self.func, tuple(args)))
+        self.arg_tps = [typeDetail(i, scope) for i in args]
+        return self.tp
     
     def visit(self, scope: Scope) -> Value:
         args = [i.visit(scope) for i in self.args]
-        arg_types = [i.tp.toType() for i in args]
-        funcname = self.func + " " + " ".join(arg_types)
-        return scope.findFunc(funcname)[1](args)
+        self.hits += 1
+        if self.hits == QUICKEN_AT and len(args) == len(self.arg_tps):
+            self.__class__ = QuickFuncCall
+            quick_stats['quickened'] += 1
+        if len(args) == len(self.arg_tps):
+            for arg, tp in zip(args, self.arg_tps):
+                if arg.tp is not tp:
+                    break
+            else:
+                impl = boundFunc(self, scope)
+                if impl is not None:
+                    return impl(*args)
+        return self.dispatch(scope, args)
+
+    def dispatch(self, scope: Scope, args: list[Value]) -> Value:
+        return scope.findFunc((self.func, tuple(i.tp.toType() for i in args)))[1](*args)
+
+    def target(self, scope: Scope, args: list[Value]) -> Callable:
+        """运行时要调用的实现，类型守卫失败时按实参类型重新查找"""
+        if len(args) == len(self.arg_tps):
+            for arg, tp in zip(args, self.arg_tps):
+                if arg.tp is not tp:
+                    break
+            else:
+                impl = boundFunc(self, scope)
+                if impl is not None:
+                    return impl
+        return scope.findFunc((self.func, tuple(i.tp.toType() for i in args)))[1]
+
+    def compile(self, scope: Scope) -> Callable[[Scope], Value]:
+        args, arg_tps, dispatch = [i.compile(scope) for i in self.args], self.arg_tps, self.dispatch
+        impl, depth, key = self.impl, self.depth, self.key
+        nargs = len(args)
+        if len(arg_tps) != nargs:
+            return lambda scope: dispatch(scope, [arg(scope) for arg in args])
+        if impl is not None:
+            if nargs == 1:
+                (arg,), (tp,) = args, arg_tps
+
+                def run(scope: Scope) -> Value:
+                    v = arg(scope)
+                    return impl(v) if v.tp is tp else dispatch(scope, [v])
+                return run
+
+            def run(scope: Scope) -> Value:
+                vals = [arg(scope) for arg in args]
+                for v, tp in zip(vals, arg_tps):
+                    if v.tp is not tp:
+                        return dispatch(scope, vals)
+                return impl(*vals)
+            return run
+
+        def find(scope: Scope) -> Func | None:
+            for _ in range(depth):
+                scope = scope.parent
+            func = scope.funcs.get(key)
+            return func and func[1]
+
+        # 用户函数：参数列表直接成为被调函数作用域的slots
+        if nargs == 1:
+            (arg,), (tp,) = args, arg_tps
+
+            def run(scope: Scope) -> Value:
+                vals = [arg(scope)]
+                if vals[0].tp is tp:
+                    func = find(scope)
+                    if func is not None:
+                        return func.call(vals)
+                return dispatch(scope, vals)
+            return run
+        if nargs == 2:
+            (arg0, arg1), (tp0, tp1) = args, arg_tps
+
+            def run(scope: Scope) -> Value:
+                vals = [arg0(scope), arg1(scope)]
+                if vals[0].tp is tp0 and vals[1].tp is tp1:
+                    func = find(scope)
+                    if func is not None:
+                        return func.call(vals)
+                return dispatch(scope, vals)
+            return run
+
+        def run(scope: Scope) -> Value:
+            vals = [arg(scope) for arg in args]
+            for v, tp in zip(vals, arg_tps):
+                if v.tp is not tp:
+                    return dispatch(scope, vals)
+            func = find(scope)
+            if func is None:
+                return dispatch(scope, vals)
+            return func.call(vals)
+        return run
+
+
+class QuickFuncCall(FuncCall):
+    """热点的调用：跳过boundFunc，用户函数直接把参数列表交给Func.call"""
+
+    def visit(self, scope: Scope) -> Value:
+        args = [i.visit(scope) for i in self.args]
+        for arg, tp in zip(args, self.arg_tps):
+            if arg.tp is not tp:
+                break
+        else:
+            if self.impl is not None:
+                return self.impl(*args)
+            s = scope
+            for _ in range(self.depth):
+                s = s.parent
+            func = s.funcs.get(self.key)
+            if func is not None:
+                return func[1].call(args)
+        self.__class__ = FuncCall
+        quick_stats['deoptimized'] += 1
+        return self.dispatch(scope, args)
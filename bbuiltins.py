@@ -1,58 +1,117 @@
+import operator
+
+from barray import install as install_arrays
+from bio import install as install_io, output
+from bstring import install as install_strings
 from btype import *
 
 
 def printFn(val: Value):
-    print(val.val)
+    output.write("{}\n".format(val.val))
 
 
 def operator_init_value_based(tp: TypeDetail):
     return lambda val: Value(tp, val)
 
 def operator_init(tp: TypeDetail, val: Any):
-    return lambda: Value(tp, val)
+    # 构造函数的第一个参数是新建的对象，基本类型直接换成初值
+    return lambda this: Value(tp, val)
+
+def boxInt(val: int) -> Value:
+    # 小整数复用同一个Value
+    if -5 <= val <= 256:
+        return small_ints[val + 5]
+    return Value(Int, val)
+
+
+def boxer(tp: TypeDetail, op: str) -> Callable[[Any], Value]:
+    # Int的/得到的是float，不能走小整数缓存
+    if tp is Int and op != '__truediv__':
+        return boxInt
+    return lambda val: Value(tp, val)
+
 
 def binary_operator(tp: TypeDetail, op: str):
-    return lambda a, b: Value(tp, getattr(a, op)(b))
+    pyfn, box = getattr(operator, op), boxer(tp, op)
+    fn = lambda a, b: box(pyfn(a.val, b.val))
+    # 记下对应的Python运算和装箱方式，供转译或编译成不装箱的原生运算
+    fn.pyop, fn.pyfn, fn.box = op, pyfn, box
+    return fn
 
 
 def unary_operator(tp: TypeDetail, op: str):
-    return lambda a: Value(tp, getattr(a, op)())
+    pyfn, box = getattr(operator, op), boxer(tp, op)
+    fn = lambda a: box(pyfn(a.val))
+    fn.pyop, fn.pyfn, fn.box = op, pyfn, box
+    return fn
 
 
+IntType, BoolType, NoneType = BasicType('Int'), BasicType('Bool'), BasicType('None')
+FloatType, StringType = BasicType('Float'), BasicType('String')
 Bool = TypeDetail('Bool', {}, {}, [])
+Float = TypeDetail('Float', {}, {}, [])
+String = TypeDetail('String', {}, {}, [])
 Int = TypeDetail('Int', {}, {}, [])
-Int.method['operator init '] = (BasicType('Int'), operator_init(Int, 0))
-Int.method['operator init Int'] = (BasicType('Int'), operator_init_value_based(Int))
-Int.method['operator init String'] = (BasicType('Int'), lambda a: Value(Int, int(a)))
-Int.method['operator+ this Int'] = (BasicType('Int'), binary_operator(Int, '__add__'))
-Int.method['operator- this Int'] = (BasicType('Int'), binary_operator(Int, '__sub__'))
-Int.method['operator* this Int'] = (BasicType('Int'), binary_operator(Int, '__mul__'))
-Int.method['operator/ this Int'] = (BasicType('Int'), binary_operator(Int, '__truediv__'))
-Int.method['operator% this Int'] = (BasicType('Int'), binary_operator(Int, '__mod__'))
-Int.method['operator== this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__eq__'))
-Int.method['operator!= this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__ne__'))
-Int.method['operator> this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__gt__'))
-Int.method['operator< this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__lt__'))
-Int.method['operator>= this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__ge__'))
-Int.method['operator<= this Bool'] = (BasicType('Bool'), binary_operator(Bool, '__le__'))
-Int.method['operator<< this Int'] = (BasicType('Int'), binary_operator(Int, '__lshift__'))
-Int.method['operator>> this Int'] = (BasicType('Int'), binary_operator(Int, '__rshift__'))
-Int.method['operator& this Int'] = (BasicType('Int'), binary_operator(Int, '__and__'))
-Int.method['operator| this Int'] = (BasicType('Int'), binary_operator(Int, '__or__'))
-Int.method['operator^ this Int'] = (BasicType('Int'), binary_operator(Int, '__xor__'))
-Int.method['operator+ this'] = (BasicType('Int'), unary_operator(Int, '__pos__'))
-Int.method['operator- this'] = (BasicType('Int'), unary_operator(Int, '__neg__'))
-Int.method['operator~ this'] = (BasicType('Int'), unary_operator(Int, '__invert__'))
+small_ints = [Value(Int, i) for i in range(-5, 257)]
+Int.method['operator init', ()] = (IntType, operator_init(Int, 0))
+Int.method['operator init', (IntType,)] = (IntType, operator_init_value_based(Int))
+Int.method['operator init', (BasicType('String'),)] = (IntType, lambda a: Value(Int, int(a)))
+Int.method['operator+', (IntType,)] = (IntType, binary_operator(Int, '__add__'))
+Int.method['operator-', (IntType,)] = (IntType, binary_operator(Int, '__sub__'))
+Int.method['operator*', (IntType,)] = (IntType, binary_operator(Int, '__mul__'))
+Int.method['operator/', (IntType,)] = (IntType, binary_operator(Int, '__truediv__'))
+Int.method['operator%', (IntType,)] = (IntType, binary_operator(Int, '__mod__'))
+Int.method['operator==', (IntType,)] = (BoolType, binary_operator(Bool, '__eq__'))
+Int.method['operator!=', (IntType,)] = (BoolType, binary_operator(Bool, '__ne__'))
+Int.method['operator>', (IntType,)] = (BoolType, binary_operator(Bool, '__gt__'))
+Int.method['operator<', (IntType,)] = (BoolType, binary_operator(Bool, '__lt__'))
+Int.method['operator>=', (IntType,)] = (BoolType, binary_operator(Bool, '__ge__'))
+Int.method['operator<=', (IntType,)] = (BoolType, binary_operator(Bool, '__le__'))
+Int.method['operator<<', (IntType,)] = (IntType, binary_operator(Int, '__lshift__'))
+Int.method['operator>>', (IntType,)] = (IntType, binary_operator(Int, '__rshift__'))
+Int.method['operator&', (IntType,)] = (IntType, binary_operator(Int, '__and__'))
+Int.method['operator|', (IntType,)] = (IntType, binary_operator(Int, '__or__'))
+Int.method['operator^', (IntType,)] = (IntType, binary_operator(Int, '__xor__'))
+Int.method['operator+', ()] = (IntType, unary_operator(Int, '__pos__'))
+Int.method['operator-', ()] = (IntType, unary_operator(Int, '__neg__'))
+Int.method['operator~', ()] = (IntType, unary_operator(Int, '__invert__'))
+
+Float.method['operator init', ()] = (FloatType, operator_init(Float, 0.0))
+Float.method['operator init', (FloatType,)] = (FloatType, operator_init_value_based(Float))
+for op, pyop in (('+', '__add__'), ('-', '__sub__'), ('*', '__mul__'), ('/', '__truediv__'), ('%', '__mod__')):
+    Float.method['operator' + op, (FloatType,)] = (FloatType, binary_operator(Float, pyop))
+Float.method['operator+', ()] = (FloatType, unary_operator(Float, '__pos__'))
+Float.method['operator-', ()] = (FloatType, unary_operator(Float, '__neg__'))
+
+Bool.method['operator init', ()] = (BoolType, operator_init(Bool, False))
+Bool.method['operator init', (BoolType,)] = (BoolType, operator_init_value_based(Bool))
+# 两边都已经求值了，&&和||就是按位的与和或
+Bool.method['operator&&', (BoolType,)] = (BoolType, binary_operator(Bool, '__and__'))
+Bool.method['operator||', (BoolType,)] = (BoolType, binary_operator(Bool, '__or__'))
+Bool.method['operator&', (BoolType,)] = (BoolType, binary_operator(Bool, '__and__'))
+Bool.method['operator|', (BoolType,)] = (BoolType, binary_operator(Bool, '__or__'))
+Bool.method['operator^', (BoolType,)] = (BoolType, binary_operator(Bool, '__xor__'))
+Bool.method['operator!', ()] = (BoolType, unary_operator(Bool, 'not_'))
+
+String.method['operator init', ()] = (StringType, operator_init(String, ""))
+String.method['operator init', (StringType,)] = (StringType, operator_init_value_based(String))
+
+for tp, tp_type in ((Float, FloatType), (Bool, BoolType), (String, StringType)):
+    for op, pyop in (('==', '__eq__'), ('!=', '__ne__'), ('>', '__gt__'), ('<', '__lt__'), ('>=', '__ge__'), ('<=', '__le__')):
+        tp.method['operator' + op, (tp_type,)] = (BoolType, binary_operator(Bool, pyop))
 
 std_scope = Scope(None)
 
-std_scope.funcs = {
-    'print Int': (BasicType('None'), printFn),
-    'print Float': (BasicType('None'), printFn),
-    'print String': (BasicType('None'), printFn),
-    'print Bool': (BasicType('None'), printFn),
-}
+for name in ('Int', 'Float', 'String', 'Bool'):
+    std_scope.defineFunc(('print', (BasicType(name),)), (NoneType, printFn))
 
 std_scope.types = {
     'Int': Int,
+    'Float': Float,
+    'Bool': Bool,
+    'String': String,
 }
+
+install_arrays(std_scope, {'Int': Int, 'Float': Float, 'Bool': Bool})
+install_strings(std_scope, {'Int': Int, 'Float': Float, 'Bool': Bool, 'String': String})
+install_io(std_scope, {'Bool': Bool, 'String': String})
@@ -25,6 +25,7 @@ class TokenType(Enum):
     XOR = 18
     NOT = 19
     INV = 20
+    ASSIGN = 21
     # Other symbols
     LPAREN = 100
     RPAREN = 101
@@ -67,10 +68,11 @@ op_map = {
     '&&': TokenType.AND,
     '||': TokenType.OR,
     '&': TokenType.BITAND,
-    '|': TokenType.OR,
+    '|': TokenType.BITOR,
     '^': TokenType.XOR,
     '!': TokenType.NOT,
     '~': TokenType.INV,
+    '=': TokenType.ASSIGN,
     '(': TokenType.LPAREN,
     ')': TokenType.RPAREN,
     '[': TokenType.LSQBR,
@@ -0,0 +1,63 @@
+"""
+数组速度测试：同一个计算分别用逐元素的while循环和Array的整体运算来写
+用法：python bench_array.py [模式...]
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from barray import numpy
+from brun import load, modes
+
+N = 20000
+
+LOOP = '''
+var i: Int = 0;
+var s: Int = 0;
+var c: Int = 0;
+while i < {n} {{
+    var t: Int = i * 3 + 1;
+    s = s + t;
+    if t > 100 {{ c = c + 1; }}
+    i = i + 1;
+}}
+print(s);
+print(c);
+'''.format(n=N)
+
+VECTOR = '''
+var t: Array[Int] = range({n}) * 3 + 1;
+print(sum(t));
+print(sum(t > 100));
+'''.format(n=N)
+
+
+def bench(code: str, mode: str, repeat: int = 5) -> tuple[float, str]:
+    best, out = float('inf'), ""
+    for _ in range(repeat):
+        tree, scope = load(code)
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            start = time.perf_counter()
+            modes[mode](tree, scope)
+            best = min(best, time.perf_counter() - start)
+        out = buf.getvalue()
+    return best, out
+
+
+def main(argv: list[str]):
+    names = argv or list(modes)
+    print("backend: {}".format("numpy" if numpy is not None else "array"))
+    print("{:>9} {:>12} {:>12} {:>9}".format("mode", "loop", "vector", "speedup"))
+    for mode in names:
+        loop, expect = bench(LOOP, mode)
+        vector, out = bench(VECTOR, mode)
+        if out != expect:
+            print("MISMATCH in {} mode".format(mode))
+            sys.exit(1)
+        print("{:>9} {:>11.4f}s {:>11.4f}s {:>8.1f}x".format(mode, loop, vector, loop / vector))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+"""
+执行速度测试：比较各执行模式
+用法：python bench_exec.py [-O] [模式...]
+加-O时先优化语法树，再和未优化的树解释器比较
+"""
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+
+from bopt import Optimizer
+from brun import load, modes
+
+FIB = '''
+func fib(n: Int): Int {
+    if n < 2 { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+var r: Int = fib(18);
+'''
+
+LOOP = '''
+var i: Int = 0;
+var s: Int = 0;
+while i < 100000 {
+    var t: Int = i * 3;
+    if t % 2 == 0 { s = s + t; } else { s = s - 1; }
+    i = i + 1;
+}
+'''
+
+CONTROL = '''
+var i: Int = 0;
+while i < 2000 {
+    i = i + 1;
+    if i % 3 == 0 { continue; }
+    if i == 1500 { break; }
+    var j: Int = 0;
+    while 1 { j = j + 1; if j > i % 5 { break; } }
+}
+func outer(a: Int): Int {
+    var k: Int = a * 2;
+    func inner(b: Int): Int { return b + k; }
+    return inner(a);
+}
+var r: Int = outer(5) + -~i;
+print(r);
+'''
+
+INVARIANT = '''
+var n: Int = 7;
+var i: Int = 0;
+var s: Int = 0;
+while i < 50000 {
+    s = s + (n * n + 3 * 4) - (n - 1);
+    if 1 == 0 { s = 0; } else if 2 > 1 { s = s + 1; } else { ; }
+    ;
+    {}
+    i = i + 1;
+}
+print(s);
+'''
+
+CALLS = '''
+func inc(x: Int): Int { return x + 1; }
+func add(a: Int, b: Int): Int { return a + b; }
+var i: Int = 0;
+var s: Int = 0;
+while i < 30000 {
+    s = add(s, inc(i));
+    i = inc(i);
+}
+'''
+
+programs = {'fib': FIB, 'loop': LOOP, 'control': CONTROL, 'invariant': INVARIANT, 'calls': CALLS}
+
+
+def validate(names: list[str], optimize: bool = False) -> bool:
+    """各模式在同一程序上的输出和全局变量必须与树解释器一致"""
+    ok = True
+    for prog, code in programs.items():
+        results = []
+        for i, mode in enumerate(['tree'] + names):
+            out = io.StringIO()
+            tree, scope = load(code, optimizer=Optimizer() if optimize and i else None)
+            with redirect_stdout(out):
+                modes[mode](tree, scope)
+            # 优化器外提的变量追加在后面，不参与比较
+            slots = scope.slots[:len(results[0][1])] if results else scope.slots
+            results.append((out.getvalue(), [getattr(v, 'val', v) for v in slots]))
+        for mode, result in zip(names, results[1:]):
+            if result != results[0]:
+                print("MISMATCH: {} in {} mode".format(prog, mode))
+                ok = False
+    return ok
+
+
+def bench(code: str, mode: str, repeat: int = 5, optimize: bool = False) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        tree, scope = load(code, optimizer=Optimizer() if optimize else None)
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            modes[mode](tree, scope)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv: list[str]):
+    optimize = '-O' in argv
+    names = [i for i in argv if i != '-O'] or list(modes)
+    if not validate(names, optimize):
+        sys.exit(1)
+    print("{:>9}".format("program") + "".join("{:>12}".format(i) for i in names))
+    for prog, code in programs.items():
+        base = bench(code, 'tree')
+        times = [bench(code, mode, optimize=optimize) for mode in names]
+        print("{:>9}".format(prog) + "".join("{:>11.3f}s".format(t) for t in times))
+        print("{:>9}".format("speedup") + "".join("{:>11.2f}x".format(base / t) for t in times))
+        if optimize:
+            opt = Optimizer()
+            load(code, optimizer=opt)
+            print("{:>9}".format("") + "  optimizer: " + opt.report())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,192 @@
+"""
+词法分析吞吐量测试：正则主模式 vs 逐字符扫描
+用法：python bench_lex.py [MB数]
+"""
+import sys
+import time
+
+from bdata import TokenType, op_map, keyword_map, escape_map
+from blex import Lexer, Token
+from berror import BLexerError
+
+
+class LegacyLexer:
+    # 旧版逐字符Lexer，仅作对照（补上了next()里漏掉的self.pos前进）
+    def __init__(self, code: str):
+        self.code = code
+        self.pos = 0
+        self.vpos = (1, 1)
+
+    def eof(self, n: int = 0):
+        return self.pos + n >= len(self.code)
+
+    def cur(self):
+        return self.code[self.pos]
+
+    def get(self, n: int = 1):
+        return self.code[self.pos: self.pos + n]
+
+    def next(self, n: int = 1):
+        for _ in range(n):
+            if self.eof():
+                break
+            if self.cur() == '\n':
+                self.vpos = (self.vpos[0] + 1, 1)
+            else:
+                self.vpos = (self.vpos[0], self.vpos[1] + 1)
+            self.pos += 1
+
+    def skip(self):
+        while not self.eof() and (self.cur() in ' \n\t' or
+                                  self.get(2) in ('//', '/*')):
+            if self.get(2) == '//':
+                while not self.eof() and self.cur() != '\n':
+                    self.next()
+            elif self.get(2) == '/*':
+                self.next(2)
+                while not self.eof() and self.get(2) != '*/':
+                    self.next()
+                if self.eof():
+                    raise BLexerError("unexpected EOF in a long comment", self.vpos)
+                self.next(2)
+            else:
+                self.next()
+
+    def get_token(self):
+        self.skip()
+
+        if self.eof():
+            return Token(TokenType.EOF, None, self.vpos)
+        elif self.cur().isdigit():
+            num = self.cur()
+            self.next()
+            while not self.eof() and (self.cur().isdigit() or
+                                      self.cur() == '.'):
+                num += self.cur()
+                self.next()
+            if num.count('.') == 1:
+                return Token(TokenType.CONST, float(num), self.vpos)
+            elif num.count('.') > 1:
+                raise BLexerError("too many dots in a number", self.vpos)
+            else:
+                return Token(TokenType.CONST, int(num), self.vpos)
+        elif self.cur().isalpha() or self.cur() == '_':
+            ident = self.cur()
+            self.next()
+            while not self.eof() and (
+                    self.cur().isalnum() or self.cur() == '_'):
+                ident += self.cur()
+                self.next()
+            if ident in keyword_map:
+                return Token(keyword_map[ident], ident, self.vpos)
+            elif ident == 'True':
+                return Token(TokenType.CONST, True, self.vpos)
+            elif ident == 'False':
+                return Token(TokenType.CONST, False, self.vpos)
+            elif ident == 'None':
+                return Token(TokenType.CONST, None, self.vpos)
+            else:
+                return Token(TokenType.IDENT, ident, self.vpos)
+        elif self.cur() in '\'"':
+            x = self.cur()
+            self.next()
+            string = ""
+            while not self.eof() and self.cur() != x:
+                if self.cur() == '\\':
+                    self.next()
+                    if self.eof():
+                        raise BLexerError("unexpected EOF in a string", self.vpos)
+                    elif self.cur() in escape_map:
+                        string += escape_map[self.cur()]
+                        self.next()
+                    elif self.cur() == 'x':
+                        self.next()
+                        string += chr(int(self.get(2), 16))
+                        self.next(2)
+                    elif self.cur() == 'u':
+                        self.next()
+                        string += chr(int(self.get(4), 16))
+                        self.next(4)
+                    else:
+                        raise BLexerError("wrong escape sequence", self.vpos)
+                else:
+                    string += self.cur()
+                    self.next()
+            if self.eof():
+                raise BLexerError("unexpected EOF in a string", self.vpos)
+            self.next()
+            return Token(TokenType.CONST, string, self.vpos)
+        elif not self.eof(2) and self.get(2) in op_map:
+            op = self.get(2)
+            self.next(2)
+            return Token(op_map[op], op, self.vpos)
+        elif self.cur() in op_map:
+            op = self.cur()
+            self.next()
+            return Token(op_map[op], op, self.vpos)
+        else:
+            raise BLexerError("unexpected character '{}'".format(self.cur()), self.vpos)
+
+
+CHUNK = '''// helper number {0}
+func helper_{0}(a: Int, b: Int): Int {{
+    /* long comment
+       spanning lines */
+    var s: Int;
+    while (a < b && s != {0}) {{
+        s = s + a * 2 - (b >> 1) % 7;
+        print("step\\t{0}\\n");
+    }}
+    if (s >= 100) {{ return s; }} else {{ return 3.25; }}
+}}
+'''
+
+
+def gen_source(size: int) -> str:
+    parts, total, i = [], 0, 0
+    while total < size:
+        chunk = CHUNK.format(i)
+        parts.append(chunk)
+        total += len(chunk)
+        i += 1
+    return ''.join(parts)
+
+
+def run_legacy(code: str) -> int:
+    lexer, n = LegacyLexer(code), 0
+    while lexer.get_token().tp != TokenType.EOF:
+        n += 1
+    return n
+
+
+def run_regex(code: str) -> int:
+    n = -1
+    for _ in Lexer(code).tokens():
+        n += 1
+    return n
+
+
+def bench(fn, code: str, repeat: int = 3) -> tuple[float, int]:
+    best, n = float('inf'), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = fn(code)
+        best = min(best, time.perf_counter() - start)
+    return best, n
+
+
+def main():
+    mb = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    code = gen_source(int(mb * 1024 * 1024))
+    size = len(code.encode()) / 1024 / 1024
+    print("source: {:.2f} MB".format(size))
+    results = {}
+    for name, fn in (('legacy', run_legacy), ('regex', run_regex)):
+        t, n = bench(fn, code)
+        results[name] = t
+        print("{:>8}: {:8.3f} s  {:8.2f} MB/s  {} tokens".format(name, t, size / t, n))
+    print("speedup: {:.1f}x".format(results['legacy'] / results['regex']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+对象构造吞吐量测试：属性布局模板 vs 旧版逐层deepcopy
+用法：python bench_new.py [对象数]
+"""
+import copy
+import sys
+import time
+
+from btype import TypeDetail, Value
+
+
+def legacy_getAttrs(tp: TypeDetail) -> dict:
+    # 旧版TypeDetail.getAttrs，仅作对照
+    res = {}
+    for i in tp.parents:
+        r = legacy_getAttrs(i)
+        for k, v in r.items():
+            res[k] = copy.deepcopy(v)
+    for k, v in tp.attrs.items():
+        res[k] = copy.deepcopy(v)
+    return res
+
+
+def legacy_new(tp: TypeDetail) -> Value:
+    return Value(tp, legacy_getAttrs(tp))
+
+
+def hierarchy(depth: int) -> TypeDetail:
+    """每层加三个不可变的属性，最底层有一个可变的列表属性"""
+    tp = TypeDetail('T0', {}, {'a0': 0, 'b0': "x", 'items': []}, [])
+    for i in range(1, depth + 1):
+        tp = TypeDetail('T{}'.format(i), {}, {'a{}'.format(i): i, 'b{}'.format(i): "y", 'c{}'.format(i): 1.5}, [tp])
+    return tp
+
+
+def rate(fn, tp: TypeDetail, n: int) -> float:
+    best = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn(tp)
+        best = min(best, time.perf_counter() - start)
+    return n / best
+
+
+def main(argv: list[str]):
+    n = int(argv[0]) if argv else 20000
+    for depth in (0, 1, 2, 4, 8):
+        tp = hierarchy(depth)
+        assert legacy_new(tp).val == tp.getAttrs()
+        old, new = rate(legacy_new, tp, n), rate(TypeDetail.new, tp, n)
+        print("depth {}: {:>6} attrs  legacy {:>10.0f}/s  shape {:>10.0f}/s  {:>6.1f}x".format(
+            depth, len(tp.shape().names), old, new, new / old))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,66 @@
+"""
+语法分析吞吐量测试：程序规模翻倍时耗时应该也只是翻倍
+用法：python bench_parse.py [最大MB数]
+"""
+import sys
+import time
+
+from blex import Lexer
+from bparser import Parser
+from bench_lex import gen_source
+
+
+def gen_long_expr(n: int) -> str:
+    return "var x: Int = " + " + ".join("x * {}".format(i) for i in range(n)) + ";\n"
+
+
+def gen_else_chain(n: int) -> str:
+    cases = " else ".join("if x == {0} {{ x = {0}; }}".format(i) for i in range(n))
+    return "var x: Int;\n" + cases + " else { x = 0; }\n"
+
+
+def run_lex(code: str) -> int:
+    n = 0
+    for _ in Lexer(code).tokens():
+        n += 1
+    return n
+
+
+def run_parse(code: str) -> int:
+    lexer = Lexer(code)
+    return len(Parser(lexer.tokens(), lexer.source).program().stmts)
+
+
+def bench(fn, code: str, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(title: str, gen, sizes):
+    print(title)
+    print("{:>10} {:>10} {:>10} {:>12} {:>12}".format("size", "tokens", "lex s", "lex+parse s", "us/token"))
+    for size in sizes:
+        code = gen(size)
+        tokens = run_lex(code)
+        lex, parse = bench(run_lex, code), bench(run_parse, code)
+        print("{:>10} {:>10} {:>10.3f} {:>12.3f} {:>12.3f}".format(
+            size, tokens, lex, parse, parse / tokens * 1e6))
+
+
+def main():
+    mb = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    sizes, size = [], int(mb * 1024 * 1024)
+    while size >= 64 * 1024 and len(sizes) < 5:
+        sizes.insert(0, size)
+        size //= 2
+    report("synthetic programs (bytes)", gen_source, sizes)
+    report("long expression (terms)", gen_long_expr, [5000, 10000, 20000, 40000])
+    report("else-if chain (cases)", gen_else_chain, [2000, 4000, 8000, 16000])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+深递归和尾递归测试：各执行模式能跑多深、跑多快
+尾递归在所有模式下都不占栈；非尾递归只有vm模式用自己的帧栈，其他模式超过Python的递归深度就报错
+用法：python bench_recursion.py [递归深度] [模式...]
+"""
+import sys
+import time
+
+from berror import BRecursionError
+from brun import load, modes
+
+DEEP = '''
+func sum(n: Int): Int {{
+    if n == 0 {{ return 0; }}
+    return n + sum(n - 1);
+}}
+var r: Int = sum({});
+'''
+
+TAIL = '''
+func loop(n: Int, acc: Int): Int {{
+    if n == 0 {{ return acc; }}
+    return loop(n - 1, acc + n);
+}}
+var r: Int = loop({}, 0);
+'''
+
+programs = {'deep': DEEP, 'tail': TAIL}
+
+
+def measure(code: str, mode: str, depth: int) -> str:
+    tree, scope = load(code.format(depth))
+    start = time.perf_counter()
+    try:
+        modes[mode](tree, scope)
+    except BRecursionError:
+        return "too deep"
+    t = time.perf_counter() - start
+    if scope.slots[-1].val != depth * (depth + 1) // 2:
+        return "WRONG"
+    return "{:.3f}s".format(t)
+
+
+def main(argv: list[str]):
+    depth = int(argv[0]) if argv else 100000
+    names = argv[1:] or list(modes)
+    print("depth {}".format(depth))
+    print("{:>6}".format("") + "".join("{:>16}".format(i) for i in names))
+    for prog, code in programs.items():
+        print("{:>6}".format(prog) + "".join("{:>16}".format(measure(code, mode, depth)) for mode in names))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,270 @@
+"""
+基准测试套件：对一组有代表性的程序分别计时词法分析、语法分析、check和执行
+用法：
+    python bench_suite.py run [-o 结果.json] [--warmup N] [--repeat N] [--mode 模式] [程序...]
+    python bench_suite.py compare 旧.json 新.json [--threshold 0.05] [--alpha 0.05]
+compare对每个程序的每个阶段做Welch t检验，显著变慢且超过阈值的算回归，有回归时返回1
+"""
+import gc
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Callable
+
+from bbuiltins import std_scope
+from berror import BException
+from blex import Lexer
+from bparser import Parser
+from brun import modes
+from btype import Scope
+
+FIB = '''
+func fib(n: Int): Int {
+    if n < 2 { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+var r: Int = fib(16);
+'''
+
+NESTED_LOOPS = '''
+var i: Int = 0;
+var s: Int = 0;
+while i < 120 {
+    var j: Int = 0;
+    while j < 120 {
+        if (i + j) % 3 == 0 { s = s + 1; }
+        j = j + 1;
+    }
+    i = i + 1;
+}
+'''
+
+ARITH = '''
+var i: Int = 0;
+var s: Int = 0;
+while i < 10000 {
+    s = (s + i * 3 - (i & 7) + (i << 2) - (i >> 1)) % 100003;
+    s = s ^ (i | 5);
+    i = i + 1;
+}
+'''
+
+STRINGS = '''
+var i: Int = 0;
+var s: String = "";
+while i < 3000 {
+    s = s + "ab";
+    i = i + 1;
+}
+'''
+
+BUILDER = '''
+var i: Int = 0;
+var sb: StringBuilder;
+while i < 3000 {
+    append(sb, toString(i));
+    append(sb, ",");
+    i = i + 1;
+}
+var s: String = toString(sb);
+'''
+
+OBJECTS = '''
+func size(sb: StringBuilder): Int { return len(sb); }
+func size(a: Array[Int]): Int { return len(a); }
+var i: Int = 0;
+var s: Int = 0;
+while i < 2000 {
+    var sb: StringBuilder;
+    append(sb, "item ");
+    append(sb, toString(i));
+    var a: Array[Int] = fill(4, i) * 2 + 1;
+    s = s + size(sb) + size(a) + get(a, 0) % 7;
+    i = i + 1;
+}
+'''
+
+SMALL_FUNCS = '''
+func inc(x: Int): Int { return x + 1; }
+func dec(x: Int): Int { return x - 1; }
+func add(a: Int, b: Int): Int { return a + b; }
+func twice(x: Int): Int { return add(x, x); }
+func clamp(x: Int): Int { if x > 1000 { return dec(x) % 1000; } return x; }
+var i: Int = 0;
+var s: Int = 0;
+while i < 5000 {
+    s = clamp(add(s, twice(inc(i))));
+    i = inc(i);
+}
+'''
+
+corpus = {
+    'fib': FIB,
+    'nested_loops': NESTED_LOOPS,
+    'arith': ARITH,
+    'strings': STRINGS,
+    'builder': BUILDER,
+    'objects': OBJECTS,
+    'small_funcs': SMALL_FUNCS,
+}
+
+PHASES = ('lex', 'parse', 'check', 'visit')
+
+
+def sample(fn: Callable[[], object]) -> float:
+    # 和timeit一样，计时期间关掉gc，减少抖动
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def measure(code: str, mode: str = 'tree') -> dict[str, float]:
+    """把一个程序从头跑一遍，每个阶段的输入都在计时外准备好"""
+    res = {}
+    lexer = Lexer(code)
+    tokens = []
+    res['lex'] = sample(lambda: tokens.extend(lexer.tokens()))
+    trees = []
+    res['parse'] = sample(lambda: trees.append(Parser(iter(tokens), lexer.source).program()))
+    tree, scope = trees[0], Scope(std_scope)
+    res['check'] = sample(lambda: tree.check(scope))
+    with redirect_stdout(io.StringIO()):
+        res['visit'] = sample(lambda: modes[mode](tree, scope))
+    return res
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        'mean': statistics.fmean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'min': min(samples),
+        'median': statistics.median(samples),
+    }
+
+
+def run(names: list[str], warmup: int = 2, repeat: int = 10, mode: str = 'tree') -> dict:
+    results = {}
+    for name in names:
+        code = corpus[name]
+        try:
+            for _ in range(warmup):
+                measure(code, mode)
+        except BException as e:
+            # 程序在这个模式下出错（比如语料是给更新的解释器写的）就跳过，不影响其他程序
+            results[name] = {'skipped': str(e)}
+            print("{:>14}  skipped: {}".format(name, e), file=sys.stderr)
+            continue
+        samples: dict[str, list[float]] = {phase: [] for phase in PHASES}
+        for _ in range(repeat):
+            for phase, t in measure(code, mode).items():
+                samples[phase].append(t)
+        results[name] = {phase: {'samples': samples[phase], **summarize(samples[phase])} for phase in PHASES}
+        print("{:>14}".format(name) + "".join("  {} {:>9.3f}ms".format(phase, results[name][phase]['median'] * 1000)
+                                              for phase in PHASES), file=sys.stderr)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': sys.implementation.name,
+            'platform': platform.platform(),
+            'mode': mode,
+            'warmup': warmup,
+            'repeat': repeat,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def critical(alpha: float, df: float) -> float:
+    """单侧t检验的临界值，用Cornish-Fisher展开从正态分位数近似"""
+    z = statistics.NormalDist().inv_cdf(1 - alpha)
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+def welch(old: list[float], new: list[float]) -> tuple[float, float]:
+    """Welch t统计量和自由度，t为正表示新的更慢"""
+    va, vb = statistics.variance(old) / len(old), statistics.variance(new) / len(new)
+    diff = statistics.fmean(new) - statistics.fmean(old)
+    if va + vb == 0:
+        return math.copysign(math.inf, diff) if diff else 0.0, math.inf
+    t = diff / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (len(old) - 1) + vb ** 2 / (len(new) - 1))
+    return t, df
+
+
+def compare(old: dict, new: dict, threshold: float = 0.05, alpha: float = 0.05) -> list[tuple[str, str, float]]:
+    """打印对比表，返回显著变慢的(程序, 阶段, 变化比例)"""
+    regressions = []
+    print("{:>14} {:>6} {:>12} {:>12} {:>9} {:>8}".format("program", "phase", "old ms", "new ms", "change", ""))
+    for name, phases in new['results'].items():
+        before = old['results'].get(name)
+        if before is None or 'skipped' in phases or 'skipped' in before:
+            continue
+        for phase in PHASES:
+            a, b = before[phase]['samples'], phases[phase]['samples']
+            if len(a) < 2 or len(b) < 2:
+                continue
+            change = statistics.fmean(b) / statistics.fmean(a) - 1
+            t, df = welch(a, b)
+            flag = ""
+            if change > threshold and t > critical(alpha, df):
+                flag = "SLOWER"
+                regressions.append((name, phase, change))
+            elif change < -threshold and -t > critical(alpha, df):
+                flag = "faster"
+            print("{:>14} {:>6} {:>12.3f} {:>12.3f} {:>+8.1f}% {:>8}".format(
+                name, phase, statistics.fmean(a) * 1000, statistics.fmean(b) * 1000, change * 100, flag))
+    return regressions
+
+
+def option(argv: list[str], name: str, default: str) -> str:
+    if name in argv:
+        i = argv.index(name)
+        val = argv[i + 1]
+        del argv[i: i + 2]
+        return val
+    return default
+
+
+def main(argv: list[str]) -> int:
+    if not argv or argv[0] not in ('run', 'compare'):
+        print(__doc__.strip())
+        return 2
+    cmd, argv = argv[0], argv[1:]
+    if cmd == 'run':
+        out = option(argv, '-o', '')
+        warmup, repeat = int(option(argv, '--warmup', '2')), int(option(argv, '--repeat', '10'))
+        mode = option(argv, '--mode', 'tree')
+        result = run(argv or list(corpus), warmup, repeat, mode)
+        text = json.dumps(result, indent=1)
+        if out:
+            with open(out, 'w', encoding='utf-8') as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+    threshold, alpha = float(option(argv, '--threshold', '0.05')), float(option(argv, '--alpha', '0.05'))
+    with open(argv[0], encoding='utf-8') as f:
+        old = json.load(f)
+    with open(argv[1], encoding='utf-8') as f:
+        new = json.load(f)
+    regressions = compare(old, new, threshold, alpha)
+    for name, phase, change in regressions:
+        print("regression: {} {} {:+.1f}%".format(name, phase, change * 100))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
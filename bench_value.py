@@ -0,0 +1,60 @@
+"""
+值表示的测试：每个Value占用的内存，以及算术密集的程序每秒执行多少次运算
+Value仍然是装箱的对象，这里量的是__slots__带来的大小和各模式少装箱带来的速度
+用法：python bench_value.py [模式...]
+"""
+import sys
+import time
+import tracemalloc
+
+from bbuiltins import Int
+from brun import load, modes
+from btype import Value
+
+N = 20000
+
+ARITH = '''
+var i: Int = 0;
+var s: Int = 0;
+while i < {} {{
+    s = (s + i * 3 - (i & 7)) % 1000;
+    i = i + 1;
+}}
+'''.format(N)
+
+# 每轮循环：i < N, i * 3, +, i & 7, -, %, i + 1
+OPS = N * 7
+
+
+def memory(n: int = 100000) -> float:
+    """每个Value对象（不含它引用的整数）占用的字节数"""
+    ints = list(range(10 ** 6, 10 ** 6 + n))
+    vals = [None] * n
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for i in range(n):
+        vals[i] = Value(Int, ints[i])
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / n
+
+
+def throughput(mode: str, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        tree, scope = load(ARITH)
+        start = time.perf_counter()
+        modes[mode](tree, scope)
+        best = min(best, time.perf_counter() - start)
+    return OPS / best
+
+
+def main(argv: list[str]):
+    names = argv or [i for i in modes if i != 'python']
+    print("bytes per Value: {:.1f}".format(memory()))
+    for mode in names:
+        print("{:>8}: {:>10.0f} ops/s".format(mode, throughput(mode)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,17 +1,29 @@
+from bsource import Source
+
+
 class BException(Exception):
-    def __init__(self, msg: str = "", pos: tuple[int, int] | None = None):
+    def __init__(self, msg: str = "", pos: int | None = None, source: Source | None = None):
         self.msg = msg
         self.pos = pos
+        self.source = source
+
+    def locate(self) -> tuple[int, int] | None:
+        if self.pos is None or self.source is None:
+            return None
+        return self.source.locate(self.pos)
 
     def __str__(self):
+        where = self.locate()
+        if where is not None:
+            where = "at line {}, column {}".format(*where)
+        elif self.pos is not None:
+            where = "at offset {}".format(self.pos)
         if not self.msg:
-            if self.pos:
-                return "{} at line {}, column {}.".format(
-                    type(self).__name__[1:], *self.pos)
+            if where:
+                return "{} {}.".format(type(self).__name__[1:], where)
             return "{}.".format(type(self).__name__[1:])
-        if self.pos:
-            return "{} at line {}, column {}: {}.".format(
-                type(self).__name__[1:], *self.pos, self.msg)
+        if where:
+            return "{} {}: {}.".format(type(self).__name__[1:], where, self.msg)
         return "{}: {}.".format(type(self).__name__[1:], self.msg)
 
 
@@ -29,3 +41,15 @@ class BNameError(BException):
 
 class BTypeError(BException):
     ...
+
+
+class BValueError(BException):
+    ...
+
+
+class BIOError(BException):
+    ...
+
+
+class BRecursionError(BException):
+    ...
@@ -0,0 +1,176 @@
+"""
+预编译模块缓存：把检查（和优化）过的语法树存成源文件旁边的.bfc文件
+下次启动时源码和解释器版本都没变就跳过词法、语法分析和检查
+文件用mmap打开，每个函数体单独存一段，第一次调用时才解码
+
+文件格式：
+    头部   magic(4) 版本(2) 保留(2) 键(32) 索引长度(4)
+    索引   marshal编码的(顶层槽数, 语法树各段的(偏移, 长度)列表)，第0段是顶层
+    各段   pickle编码的语法树，函数体换成段号，内置实现和类型换成名字
+
+信任模型：.bfc和旁边的源文件一样可信，能改它的人本来也能改源码
+读取时只允许还原语法树节点、类型和str，文件被换成别的pickle数据时不会执行任意代码，只会报错
+"""
+import hashlib
+import io
+import marshal
+import mmap
+import os
+import pickle
+import struct
+import sys
+from typing import Any
+
+from bast import *
+from berror import BIOError
+from bbuiltins import std_scope
+from bpy import resolve
+
+VERSION = 4
+
+MAGIC = b'BFC\0'
+HEADER = struct.Struct('<4sHH32sI')
+
+
+def cache_key(code: str, optimized: bool = False) -> bytes:
+    key = "{}\0{}\0{}\0{}".format(VERSION, sys.implementation.cache_tag, int(optimized), code)
+    return hashlib.sha256(key.encode()).digest()
+
+
+def bfc_path(name: str) -> str | None:
+    """缓存写在源文件旁边，a.bf对应a.bfc"""
+    if not os.path.isfile(name):
+        return None
+    return os.path.splitext(name)[0] + '.bfc'
+
+
+def builtins() -> dict[int, tuple[str, ...]]:
+    """内置函数、方法和类型到名字的映射，也就是检查时解析出的重载表"""
+    names: dict[int, tuple[str, ...]] = {}
+    for name, tp in std_scope.types.items():
+        names[id(tp)] = ('type', name)
+        for (method, params), (_, impl) in tp.methodTable().items():
+            names.setdefault(id(impl), ('method', name, method, *map(str, params)))
+    for (name, params), (_, impl) in std_scope.funcs.items():
+        names.setdefault(id(impl), ('func', name, *map(str, params)))
+    return names
+
+
+class Writer:
+    def __init__(self):
+        self.names = builtins()
+        self.segments: list[bytes] = []
+        self.bodies: set[int] = set()
+
+    def segment(self, obj: Any) -> int:
+        index = len(self.segments)
+        self.segments.append(b'')
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, pickle.HIGHEST_PROTOCOL)
+
+        def persistent_id(o: Any) -> Any:
+            if id(o) in self.names:
+                return self.names[id(o)]
+            if isinstance(o, Block) and id(o) in self.bodies:
+                # 函数体单独存一段，这里只留段号
+                return 'body', self.segment(o.stmts), o.pos, o.nslots, o.scoped
+            return None
+
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        self.segments[index] = buf.getvalue()
+        return index
+
+    def write(self, path: str, key: bytes, tree: Block, nslots: int):
+        self.bodies = {id(i.body) for i in funcdefs(tree)}
+        self.segment(tree)
+        offsets, offset = [], 0
+        for seg in self.segments:
+            offsets.append((offset, len(seg)))
+            offset += len(seg)
+        index = marshal.dumps((nslots, offsets))
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, key, len(index)))
+            f.write(index)
+            for seg in self.segments:
+                f.write(seg)
+        os.replace(tmp, path)
+
+
+def allowedClasses() -> dict[tuple[str, str], type]:
+    """.bfc里允许出现的类：语法树节点、类型、RunSignal和Rope还原成的str"""
+    classes: dict[tuple[str, str], type] = {('builtins', 'str'): str, ('btype', 'RunSignal'): RunSignal}
+    todo = [Stmt, Expr, Type]
+    while todo:
+        cls = todo.pop()
+        classes[cls.__module__, cls.__qualname__] = cls
+        todo.extend(cls.__subclasses__())
+    return classes
+
+
+class Unpickler(pickle.Unpickler):
+    allowed = allowedClasses()
+
+    def find_class(self, module: str, name: str) -> Any:
+        cls = self.allowed.get((module, name))
+        if cls is None:
+            raise pickle.UnpicklingError("'{}.{}' is not allowed in a .bfc file".format(module, name))
+        return cls
+
+
+class Module:
+    """打开的.bfc文件，语法树各段按需从mmap里解码"""
+
+    def __init__(self, data: mmap.mmap, nslots: int, offsets: list[tuple[int, int]], base: int):
+        self.data, self.nslots, self.offsets, self.base = data, nslots, offsets, base
+        self.decoded = 0
+
+    @classmethod
+    def open(cls, path: str, key: bytes) -> "Module | None":
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, version, _, file_key, size = HEADER.unpack_from(data)
+            if magic != MAGIC or version != VERSION or file_key != key:
+                data.close()
+                return None
+            nslots, offsets = marshal.loads(data[HEADER.size: HEADER.size + size])
+        except (struct.error, EOFError, ValueError, TypeError):
+            data.close()
+            return None
+        return cls(data, nslots, offsets, HEADER.size + size)
+
+    def segment(self, index: int) -> Any:
+        offset, size = self.offsets[index]
+        start = self.base + offset
+        unpickler = Unpickler(io.BytesIO(self.data[start: start + size]))
+        unpickler.persistent_load = self.persistent_load
+        self.decoded += 1
+        try:
+            return unpickler.load()
+        except pickle.UnpicklingError as e:
+            raise BIOError("invalid .bfc module: {}".format(e)) from None
+
+    def persistent_load(self, pid: tuple) -> Any:
+        if pid[0] == 'body':
+            _, index, pos, nslots, scoped = pid
+            return LazyBlock(pos, lambda: self.segment(index), nslots, scoped)
+        return resolve(pid)
+
+    def tree(self) -> Block:
+        return self.segment(0)
+
+
+def save(path: str, key: bytes, tree: Block, nslots: int):
+    """写不出来（比如树里有无法序列化的对象）就不缓存"""
+    try:
+        Writer().write(path, key, tree, nslots)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError):
+        try:
+            os.remove(path + '.tmp')
+        except OSError:
+            pass
@@ -0,0 +1,242 @@
+"""
+增量词法分析，给编辑器用
+源码按顶层语句切成若干段，每次编辑只重新扫描受影响的段，
+扫到与旧段边界重新对齐为止，其余段原样保留（只平移起始偏移）
+每段的Token、语法树和错误的位置都相对于段首，段平移以后照样能用，要绝对位置时再加上段首
+check()按顺序检查各段，只有文本变了、或者用到的全局变量和函数变了的段才重新检查
+"""
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from typing import Any, Callable, Iterator
+
+from bast import Stmt
+from bbuiltins import std_scope
+from bdata import TokenType
+from berror import BException, BLexerError
+from blex import Lexer, Token
+from bparser import Parser
+from bsource import Source
+from btype import Scope
+
+OPEN = {TokenType.LPAREN, TokenType.LSQBR, TokenType.BEGIN}
+CLOSE = {TokenType.RPAREN, TokenType.RSQBR, TokenType.END}
+
+
+class Segment:
+    """
+    一条顶层语句，tokens的pos相对于段首
+    段首的绝对偏移只记在Document.starts里，编辑后平移起来便宜
+    """
+
+    def __init__(self, start: int, end: int, tokens: list[Token], error: BLexerError | None = None):
+        # start只是切分时的位置，编辑后以Document.starts为准
+        self.start, self.size, self.tokens, self.error = start, end - start, tokens, error
+        self.key = ""
+        self.result: Any = None
+        self.checked: Checked | None = None
+
+    def abs_tokens(self, start: int) -> Iterator[Token]:
+        for tok in self.tokens:
+            yield Token(tok.tp, tok.val, tok.pos + start)
+
+
+def split_segments(lexer: Lexer, start: int) -> Iterator[Segment]:
+    # 深度为0时遇到';'或'}'结束一条语句，'}'后面紧跟else的不算
+    code = lexer.code
+    toks: list[Token] = []
+    depth, pending = 0, False
+    try:
+        for tok in lexer.tokens(start):
+            if pending:
+                pending = False
+                if tok.tp != TokenType.K_ELSE:
+                    yield _make_segment(toks, toks[-1].pos + 1)
+                    toks = []
+            if tok.tp == TokenType.EOF:
+                break
+            toks.append(tok)
+            if tok.tp in OPEN:
+                depth += 1
+            elif tok.tp in CLOSE:
+                depth = max(depth - 1, 0)
+                pending = depth == 0 and tok.tp == TokenType.END
+            elif depth == 0 and tok.tp == TokenType.SEMICOLON:
+                yield _make_segment(toks, tok.pos + 1)
+                toks = []
+    except BLexerError as e:
+        # 出错时把剩下的内容都算作一段，等用户把代码写完整
+        seg = _make_segment(toks, len(code), e.pos)
+        seg.error = BLexerError(e.msg, e.pos - seg.start)
+        yield seg
+        return
+    if toks:
+        yield _make_segment(toks, len(code))
+
+
+def _make_segment(toks: list[Token], end: int, start: int | None = None) -> Segment:
+    if toks:
+        start = toks[0].pos
+    return Segment(start, end, [Token(t.tp, t.val, t.pos - start) for t in toks])
+
+
+class Document:
+    def __init__(self, code: str, analyse: Callable[[Segment, int, "Document"], Any] | None = None):
+        self.code = code
+        self.analyse = analyse
+        self.segments: list[Segment] = []
+        self.starts: list[int] = []
+        self.stats = {'relexed': 0, 'analysed': 0, 'reused': 0, 'checked': 0}
+        self.scope = Scope(std_scope)
+        self._replace(0, 0, list(split_segments(Lexer(code), 0)), {})
+
+    def tokens(self) -> Iterator[Token]:
+        for seg, start in zip(self.segments, self.starts):
+            yield from seg.abs_tokens(start)
+        yield Token(TokenType.EOF, None, len(self.code))
+
+    def edit(self, start: int, end: int, text: str) -> list[Segment]:
+        """用text替换code[start:end]，返回重新分析过的段"""
+        self.code = self.code[:start] + text + self.code[end:]
+        delta = len(text) - (end - start)
+        # 从编辑位置所在段的前一段开始扫，'}'后面补上else时两段会合并
+        first = max(bisect_right(self.starts, start) - 2, 0)
+        scan_from = self.starts[first] if first else 0
+        new_end = end + delta
+        stop = len(self.segments)
+        new_segs = []
+        for seg in split_segments(Lexer(self.code), scan_from):
+            if seg.start >= new_end:
+                # 与某个旧段的起点重新对齐，后面的扫描结果必然不变
+                j = bisect_left(self.starts, seg.start - delta, first)
+                if j < len(self.starts) and self.starts[j] == seg.start - delta:
+                    stop = j
+                    break
+            new_segs.append(seg)
+        if delta:
+            self.starts[stop:] = [i + delta for i in self.starts[stop:]]
+        old: dict[str, list[Segment]] = {}
+        for seg in self.segments[first: stop]:
+            old.setdefault(seg.key, []).append(seg)
+        return self._replace(first, stop, new_segs, old)
+
+    def _replace(self, first: int, stop: int, new_segs: list[Segment], old: dict[str, list[Segment]]) -> list[Segment]:
+        # 被替换的旧段按源码文本复用分析和检查结果，每个旧段最多给一个新段用，语法树不会被两段共用
+        self.stats = {'relexed': 0, 'analysed': 0, 'reused': 0, 'checked': 0}
+        analysed = []
+        for seg in new_segs:
+            seg.key = self.code[seg.start: seg.start + seg.size]
+            self.stats['relexed'] += len(seg.tokens)
+            if old.get(seg.key):
+                prev = old[seg.key].pop(0)
+                seg.result, seg.checked = prev.result, prev.checked
+                self.stats['reused'] += 1
+            elif self.analyse:
+                seg.result = self.analyse(seg, seg.start, self)
+                self.stats['analysed'] += 1
+                analysed.append(seg)
+        self.segments[first: stop] = new_segs
+        self.starts[first: stop] = [seg.start for seg in new_segs]
+        return analysed
+
+    def check(self) -> list[int]:
+        """
+        按顺序检查各段的语法树（analyse要用parse_segment），返回重新检查了的段号
+        没改过的段在依赖没变时只把它定义的变量和函数重新放进全局作用域
+        """
+        scope = self.scope = Scope(std_scope)
+        rechecked = []
+        for i, seg in enumerate(self.segments):
+            done = seg.checked
+            if done is not None and done.base == len(scope.slots) and done.deps == bindings(scope, done.names):
+                done.replay(scope)
+                continue
+            seg.checked = Checked.run(seg, scope)
+            rechecked.append(i)
+        self.stats['checked'] = len(rechecked)
+        return rechecked
+
+    def offset(self, index: int, pos: int) -> int:
+        """第index段里的相对位置换成整个文档里的偏移"""
+        return self.starts[index] + pos
+
+    def errors(self) -> list[BException]:
+        """各段的词法、语法和检查错误，位置换成绝对偏移"""
+        source, res = Source(self.code), []
+        for i, seg in enumerate(self.segments):
+            # 有词法错误时parse_segment返回的就是它，不要报两次
+            errs = [seg.error, seg.result if isinstance(seg.result, BException) and seg.result is not seg.error else None,
+                    seg.checked and seg.checked.error]
+            for e in errs:
+                if e:
+                    pos = None if e.pos is None else self.offset(i, e.pos)
+                    res.append(type(e)(e.msg, pos, source))
+        return res
+
+
+def overloadKeys(scope: Scope, names: frozenset[str]) -> list[tuple]:
+    return [(name, params) for name in names for params in scope.overloads.get(name, ())]
+
+
+def bindings(scope: Scope, names: frozenset[str]) -> dict[str, Any]:
+    """names在全局作用域里的绑定：变量的槽号和类型，函数各个重载的返回类型和是否纯"""
+    res = {}
+    for name in names:
+        funcs = tuple((params, *scope.funcs[name, params][:1], getattr(scope.funcs[name, params][1], 'pure', None))
+                      for params in scope.overloads.get(name, ()))
+        res[name] = scope.slot_of.get(name), scope.variables.get(name), funcs
+    return res
+
+
+class Checked:
+    """
+    一段的检查结果
+    base和deps是检查前全局作用域的槽数和这段用到的名字的绑定，都没变时检查结果也不会变
+    vars和funcs是这段往全局作用域里定义的东西，跳过检查时原样放回去
+    """
+
+    def __init__(self, names: frozenset[str], base: int, deps: dict[str, Any]):
+        self.names, self.base, self.deps = names, base, deps
+        self.vars: list[tuple[str, Any]] = []
+        self.funcs: list[tuple[Any, Any]] = []
+        self.error: BException | None = None
+
+    @classmethod
+    def run(cls, seg: Segment, scope: Scope) -> "Checked":
+        # 段里的标识符包括局部变量，多算了只会多检查，不会漏
+        names = frozenset(tok.val for tok in seg.tokens if tok.tp == TokenType.IDENT)
+        done = cls(names, len(scope.slots), bindings(scope, names))
+        # 这段能定义的变量和函数一定在names里，只比较这些，不用拷贝整个全局作用域
+        variables = {name: scope.variables.get(name) for name in names}
+        funcs = {key: scope.funcs[key] for key in overloadKeys(scope, names)}
+        if isinstance(seg.result, list):
+            try:
+                for stmt in seg.result:
+                    stmt.check(scope)
+            except BException as e:
+                done.error = e
+        # names是集合，要按槽号排回声明的顺序，重放时槽号才和语法树里的一致
+        done.vars = sorted(((name, scope.variables[name]) for name in names
+                            if name in scope.variables and variables[name] is not scope.variables[name]),
+                           key=lambda var: scope.slot_of[var[0]])
+        done.funcs = [(key, scope.funcs[key]) for key in overloadKeys(scope, names) if funcs.get(key) is not scope.funcs[key]]
+        return done
+
+    def replay(self, scope: Scope):
+        for name, tp in self.vars:
+            scope.declare(name, tp)
+        for key, func in self.funcs:
+            scope.defineFunc(key, func)
+
+
+def parse_segment(seg: Segment, start: int, doc: Document) -> list[Stmt] | BException:
+    """
+    可以直接当作Document的analyse用，出错时返回异常而不是抛出
+    语法树按段内的相对位置解析，这样段平移后复用的结果不会过时
+    """
+    if seg.error:
+        return seg.error
+    eof = Token(TokenType.EOF, None, seg.size)
+    try:
+        return Parser(chain(seg.tokens, (eof,))).program().stmts
+    except BException as e:
+        return e
@@ -0,0 +1,134 @@
+"""
+输入输出
+print不再每次直接调Python的print，而是写进output：缓冲区大小为0时直接写出，否则攒够了一次写
+缓冲的内容在攒满、读标准输入、调用flush()和buffered()结束时写出
+文件按行惰性读取，lines(路径)打开一个File，readLine每次只读一行，处理多大的文件内存都不变
+readFile读整个文件，大文件用mmap映射后直接解码，不用先读进一份bytes
+"""
+import mmap
+import os
+import sys
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+from berror import BIOError
+from btype import *
+
+# 超过这个大小的文件用mmap读
+MMAP_AT = 1 << 20
+
+
+class Output:
+    def __init__(self, size: int = 0):
+        self.size = size
+        self.parts: list[str] = []
+        self.pending = 0
+        # 缓冲的内容要写到的流，缓冲期间sys.stdout被换掉时先把旧的写出去
+        self.stream: IO[str] | None = None
+
+    def write(self, s: str):
+        stream = sys.stdout
+        if not self.size:
+            stream.write(s)
+            return
+        if stream is not self.stream:
+            self.flush()
+            self.stream = stream
+        self.parts.append(s)
+        self.pending += len(s)
+        if self.pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        stream = self.stream or sys.stdout
+        if self.parts:
+            stream.write("".join(self.parts))
+            self.parts.clear()
+            self.pending = 0
+        stream.flush()
+
+    @contextmanager
+    def buffered(self, size: int) -> Iterator["Output"]:
+        """在这段时间里按size缓冲输出，结束（包括出错）时全部写出"""
+        old, self.size = self.size, size
+        try:
+            yield self
+        finally:
+            self.flush()
+            self.size, self.stream = old, None
+
+
+output = Output()
+
+
+class Stream:
+    """按行读取的文件，多读一行才知道是不是读完了"""
+    __slots__ = ('file', 'ahead')
+
+    def __init__(self, file: IO[str]):
+        self.file = file
+        self.ahead = file.readline()
+
+    def readLine(self) -> str:
+        line = self.ahead
+        if line:
+            self.ahead = self.file.readline()
+        return line[:-1] if line.endswith('\n') else line
+
+    def eof(self) -> bool:
+        return not self.ahead
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file, self.ahead = None, ""
+
+
+def openLines(path: str) -> Stream:
+    try:
+        return Stream(open(path, encoding='utf-8'))
+    except OSError as e:
+        raise BIOError("cannot open '{}': {}".format(path, e.strerror)) from None
+
+
+def readFile(path: str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < MMAP_AT:
+                return f.read().decode('utf-8')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return str(m, 'utf-8')
+    except OSError as e:
+        raise BIOError("cannot read '{}': {}".format(path, e.strerror)) from None
+    except UnicodeDecodeError:
+        raise BIOError("'{}' is not valid UTF-8".format(path)) from None
+
+
+def readStdin() -> str:
+    # 等输入之前先把提示之类的输出写出去
+    output.flush()
+    line = sys.stdin.readline()
+    return line[:-1] if line.endswith('\n') else line
+
+
+def stream(f: Value) -> Stream:
+    if f.val is None or f.val.file is None:
+        raise BIOError("file is not open")
+    return f.val
+
+
+def install(scope: Scope, elems: dict[str, TypeDetail]):
+    """注册File类型和输入输出的内置函数，elems是Bool/String的TypeDetail"""
+    Bool, String = elems['Bool'], elems['String']
+    File = TypeDetail('File', {}, {}, [])
+    scope.types['File'] = File
+    FileType, StringType, BoolType, NoneType = map(BasicType, ('File', 'String', 'Bool', 'None'))
+    File.method['operator init', ()] = (FileType, lambda this: Value(File, None))
+
+    scope.defineFunc(('lines', (StringType,)), (FileType, lambda path: Value(File, openLines(str(path.val)))))
+    scope.defineFunc(('readLine', (FileType,)), (StringType, lambda f: Value(String, stream(f).readLine())))
+    scope.defineFunc(('eof', (FileType,)), (BoolType, lambda f: Value(Bool, f.val is None or f.val.eof())))
+    scope.defineFunc(('close', (FileType,)), (NoneType, lambda f: stream(f).close()))
+    scope.defineFunc(('readLine', ()), (StringType, lambda: Value(String, readStdin())))
+    scope.defineFunc(('readFile', (StringType,)), (StringType, lambda path: Value(String, readFile(str(path.val)))))
+    scope.defineFunc(('flush', ()), (NoneType, lambda: output.flush()))
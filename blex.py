@@ -1,130 +1,103 @@
-from typing import Any, NamedTuple
+import re
+from typing import Any, Iterator, NamedTuple
 
 from bdata import TokenType, op_map, keyword_map, escape_map
 from berror import BLexerError
+from bsource import Source
 
 
 class Token(NamedTuple):
     tp: TokenType
     val: Any = None
-    pos: tuple[int, int] | None = None
+    pos: int | None = None
 
 
-class Lexer:
-    def __init__(self, code: str):
-        self.code = code
-        self.pos = 0
-        self.vpos = (1, 1)
+# 标识符 -> (类型, 值)，关键字和字面常量一次查表
+ident_map: dict[str, tuple[TokenType, Any]] = {
+    **{k: (v, k) for k, v in keyword_map.items()},
+    'True': (TokenType.CONST, True),
+    'False': (TokenType.CONST, False),
+    'None': (TokenType.CONST, None),
+}
 
-    def eof(self, n: int = 0):
-        return self.pos + n >= len(self.code)
 
-    def cur(self):
-        return self.code[self.pos]
+def _build_pattern() -> re.Pattern:
+    # 长的运算符必须排在前面，否则'<='会被拆成'<'和'='
+    ops = '|'.join(map(re.escape, sorted(op_map, key=len, reverse=True)))
+    return re.compile(r'''
+        (?:[ \t\n]+|//[^\n]*|/\*.*?\*/)*
+        (?:
+        (?P<IDENT>[^\W\d]\w*)
+      | (?P<NUM>\d[\d.]*)
+      | (?P<STR>"[^"\\]*(?:\\.[^"\\]*)*"|'[^'\\]*(?:\\.[^'\\]*)*')
+      | (?P<LCOMMENT>/\*)
+      | (?P<LSTR>["'])
+      | (?P<OP>{})
+      | (?P<ERR>.)
+      | (?P<EOF>\Z)
+        )
+    '''.format(ops), re.VERBOSE | re.DOTALL)
 
-    def get(self, n: int = 1):
-        return self.code[self.pos: self.pos + n]
 
-    def next(self, n: int = 1):
-        for _ in range(n):
-            if self.eof():
-                break
-            if self.cur() == '\n':
-                self.vpos = (self.vpos[0] + 1, 1)
-            else:
-                self.vpos = (self.vpos[0], self.vpos[1] + 1)
+master_pattern = _build_pattern()
+escape_pattern = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|.)', re.DOTALL)
 
-    def skip(self):
-        while not self.eof() and (self.cur() in ' \n\t' or
-                                  self.get(2) in ('//', '/*')):
-            if self.get(2) == '//':
-                while not self.eof() and self.cur() != '\n':
-                    self.next()
-            elif self.get(2) == '/*':
-                self.next(2)
-                while not self.eof() and self.get(2) != '*/':
-                    self.next()
-                if self.eof():
-                    raise BLexerError("unexpected EOF in a long comment", self.vpos)
-                self.next(2)
-            else:
-                self.next()
 
-    def get_token(self):
-        self.skip()
+def _unescape(m: re.Match) -> str:
+    seq = m.group(1)
+    if seq in escape_map:
+        return escape_map[seq]
+    if len(seq) > 1:
+        return chr(int(seq[1:], 16))
+    raise BLexerError("wrong escape sequence")
 
-        if self.eof():
-            return Token(TokenType.EOF, self.vpos)
-        elif self.cur().isdigit():
-            num = self.cur()
-            self.next()
-            while not self.eof() and (self.cur().isdigit() or
-                                      self.cur() == '.'):
-                num += self.cur()
-                self.next()
-            if num.count('.') == 1:
-                return Token(TokenType.CONST, float(num), self.vpos)
-            elif num.count('.') > 1:
-                raise BLexerError("too many dots in a number", self.vpos)
-            else:
-                return Token(TokenType.CONST, int(num), self.vpos)
-        elif self.cur().isalpha() or self.cur() == '_':
-            ident = self.cur()
-            self.next()
-            while not self.eof() and (
-                    self.cur().isalnum() or self.cur() == '_'):
-                ident += self.cur()
-                self.next()
-            if ident in keyword_map:
-                return Token(keyword_map[ident], self.vpos)
-            elif ident == 'True':
-                return Token(TokenType.CONST, True, self.vpos)
-            elif ident == 'False':
-                return Token(TokenType.CONST, False, self.vpos)
-            elif ident == 'None':
-                return Token(TokenType.CONST, None, self.vpos)
+
+class Lexer:
+    def __init__(self, code: str, name: str = "<string>"):
+        self.code = code
+        self.source = Source(code, name)
+        self._stream = self.tokens()
+        self.last: Token | None = None
+
+    def tokens(self, start: int = 0) -> Iterator[Token]:
+        """从start开始按需产生Token，最后一个是EOF"""
+        get_ident = ident_map.get
+        ident_tp = TokenType.IDENT
+        for m in master_pattern.finditer(self.code, start):
+            kind = m.lastgroup
+            pos = m.start(kind)
+            if kind == 'IDENT':
+                ident = m.group(kind)
+                tp, val = get_ident(ident, (ident_tp, ident))
+                yield Token(tp, val, pos)
+            elif kind == 'OP':
+                op = m.group(kind)
+                yield Token(op_map[op], op, pos)
+            elif kind == 'NUM':
+                num = m.group(kind)
+                dots = num.count('.')
+                if dots > 1:
+                    raise BLexerError("too many dots in a number", pos, self.source)
+                yield Token(TokenType.CONST, float(num) if dots else int(num), pos)
+            elif kind == 'STR':
+                body = m.group(kind)[1:-1]
+                if '\\' in body:
+                    try:
+                        body = escape_pattern.sub(_unescape, body)
+                    except BLexerError as e:
+                        raise BLexerError(e.msg, pos, self.source) from None
+                yield Token(TokenType.CONST, body, pos)
+            elif kind == 'EOF':
+                yield Token(TokenType.EOF, None, pos)
+                return
+            elif kind == 'LCOMMENT':
+                raise BLexerError("unexpected EOF in a long comment", pos, self.source)
+            elif kind == 'LSTR':
+                raise BLexerError("unexpected EOF in a string", pos, self.source)
             else:
-                return Token(TokenType.IDENT, ident, self.vpos)
-        elif self.cur() in '\'"':
-            x = self.cur()
-            self.next()
-            string = ""
-            while not self.eof() and self.cur() != x:
-                if self.cur() == '\\':
-                    self.next()
-                    if self.eof():
-                        raise BLexerError("unexpected EOF in a string", self.vpos)
-                    elif self.cur() in escape_map:
-                        string += escape_map[self.cur()]
-                        self.next()
-                    elif self.cur() == 'x':
-                        self.next()
-                        if self.eof(2):
-                            raise BLexerError("unexpected EOF in a string", self.vpos)
-                        string += chr(int(self.get(2), 16))
-                        self.next(2)
-                    elif self.cur() == 'u':
-                        self.next()
-                        if self.eof(4):
-                            raise BLexerError("unexpected EOF in a string", self.vpos)
-                        string += chr(int(self.get(4), 16))
-                        self.next(4)
-                    else:
-                        raise BLexerError("wrong escape sequence", self.vpos)
-                else:
-                    string += self.cur()
-                    self.next()
-            if self.eof():
-                raise BLexerError("unexpected EOF in a string", self.vpos)
-            self.next()
-            return Token(TokenType.CONST, string, self.vpos)
-        elif not self.eof(2) and self.get(2) in op_map:
-            op = self.get(2)
-            self.next(2)
-            return Token(op_map[op], op, self.vpos)
-        elif self.cur() in op_map:
-            op = self.cur()
-            self.next()
-            return Token(op_map[op], op, self.vpos)
-        else:
-            raise BLexerError("unexpected character '{}'".format(self.cur()), self.vpos)
+                raise BLexerError("unexpected character '{}'".format(m.group(kind)), pos, self.source)
+
+    def get_token(self) -> Token:
+        # 读到EOF之后一直返回EOF
+        self.last = next(self._stream, self.last)
+        return self.last
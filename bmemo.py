@@ -0,0 +1,83 @@
+"""
+纯函数的结果缓存，需要显式开启
+check时推断出的纯函数（见bast.isPure）结果只取决于参数的值，按参数值缓存返回值
+每个函数一个LRU缓存，超过容量时淘汰最久没用过的结果
+"""
+from collections import OrderedDict
+from typing import Any
+
+from bast import *
+
+# 缓存里可能存着None（没有返回值的函数），没找到要用单独的标记
+MISS = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.data: OrderedDict[tuple, Any] = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key: tuple) -> Any:
+        try:
+            val = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return MISS
+        self.data.move_to_end(key)
+        self.hits += 1
+        return val
+
+    def put(self, key: tuple, val: Any):
+        self.data[key] = val
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.data)}
+
+
+class MemoFunc:
+    """包装Func，参数值相同时直接返回缓存的结果"""
+    __slots__ = ('func', 'cache')
+
+    def __init__(self, func: Func, cache: LRUCache):
+        self.func, self.cache = func, cache
+
+    def __call__(self, *args: Value) -> Value:
+        return self.call(list(args))
+
+    def call(self, args: list[Value]) -> Value:
+        # 基本类型的值都可以哈希，取key要在call之前，call会往args后面补槽位
+        key = tuple(i.val for i in args)
+        res = self.cache.get(key)
+        if res is MISS:
+            res = self.func.call(args)
+            self.cache.put(key, res)
+        return res
+
+
+class Memoizer:
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.caches: dict[str, LRUCache] = {}
+
+    def install(self, tree: Block) -> Block:
+        """给语法树里所有的纯函数定义装上缓存，要在check之后、执行之前做"""
+        eachFuncDef(tree, self.wrap)
+        return tree
+
+    def wrap(self, node: FuncDef):
+        # 尾调用要在缓存结果前返回，缓存会让尾递归重新占用栈，这种函数不缓存
+        if node.pure and not node.tailcalls:
+            cache = LRUCache(self.maxsize)
+            self.caches[keyName((node.name, tuple(node.param_types)))] = cache
+            node.memo = lambda func: MemoFunc(func, cache)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {k: v.stats() for k, v in self.caches.items()}
+
+    def report(self) -> str:
+        return "; ".join("{}: {}".format(k, ", ".join("{} {}".format(n, c) for n, c in v.items()))
+                         for k, v in self.stats().items())
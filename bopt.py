@@ -0,0 +1,294 @@
+"""
+语法树优化，在check之后、执行之前做
+常量折叠：两边都是常量的内置运算直接算出结果
+死分支：条件为常量的If分支直接裁掉
+删除空语句、空块和return/break/continue之后的语句
+循环不变量外提：While里不依赖循环中被赋值变量的纯表达式提到循环前面算一次
+"""
+from typing import Any, Callable
+
+from bast import *
+
+const_types = {'int': 'Int', 'float': 'Float', 'bool': 'Bool', 'str': 'String'}
+
+# 外提后即使循环一次也不执行也会被求值，只提不会抛异常的运算
+safe_ops = {'__add__', '__sub__', '__mul__', '__eq__', '__ne__', '__gt__', '__lt__', '__ge__', '__le__',
+            '__and__', '__or__', '__xor__', '__pos__', '__neg__', '__invert__'}
+
+NOVALUE = object()
+
+
+def pyop(node: Expr) -> str | None:
+    # 只有带pyop标记的内置运算是纯的
+    return getattr(node.impl, 'pyop', None)
+
+
+class Optimizer:
+    def __init__(self):
+        self.scope: Scope | None = None
+        self.stats = {'folded': 0, 'pruned': 0, 'dropped': 0, 'hoisted': 0}
+        self.log: list[tuple[str, int | None]] = []
+        self.counter = 0
+
+    def optimize(self, tree: Block, scope: Scope) -> Block:
+        # scope是check用的全局作用域，顶层外提的变量在这里分配槽位
+        self.scope = scope
+        self.block(tree, scope.declare)
+        return tree
+
+    def report(self) -> str:
+        return ", ".join("{} {}".format(k, v) for k, v in self.stats.items())
+
+    def record(self, kind: str, node: Stmt | Expr, count: int = 1):
+        self.stats[kind] += count
+        self.log.append((kind, node.pos))
+
+    def nested(self, body: Block, alloc: Callable[[str, Type], int]):
+        # 有自己作用域的块，外提的变量追加在它的槽位后面，否则和外层一样
+        if body.scoped:
+            def alloc(name: str, tp: Type) -> int:
+                body.nslots += 1
+                return body.nslots - 1
+        self.block(body, alloc)
+
+    def block(self, block: Block, alloc: Callable[[str, Type], int]):
+        stmts = []
+        for i, stmt in enumerate(block.stmts):
+            stmts.extend(self.stmt(stmt, alloc))
+            if isinstance(stmt, (Return, Break, Continue)):
+                if i + 1 < len(block.stmts):
+                    self.record('dropped', block.stmts[i + 1], len(block.stmts) - i - 1)
+                break
+        block.stmts = stmts
+
+    def stmt(self, node: Stmt, alloc: Callable[[str, Type], int]) -> list[Stmt]:
+        if isinstance(node, Block):
+            # 裸块和外层共用作用域，直接展开
+            self.block(node, alloc)
+            if not node.stmts:
+                self.record('dropped', node)
+            return node.stmts
+        elif isinstance(node, NoOp):
+            self.record('dropped', node)
+            return []
+        elif isinstance(node, ExprStmt):
+            node.expr = self.expr(node.expr)
+            if isinstance(node.expr, (Const, Variable)):
+                self.record('dropped', node)
+                return []
+        elif isinstance(node, VarDecl):
+            node.vardecls = [(name, tp, None if val is None else self.expr(val)) for name, tp, val in node.vardecls]
+        elif isinstance(node, Return):
+            if node.val is not None:
+                node.val = self.expr(node.val)
+        elif isinstance(node, If):
+            return self.if_stmt(node, alloc)
+        elif isinstance(node, While):
+            node.cond = self.expr(node.cond)
+            cond = self.value(node.cond)
+            if cond is not NOVALUE and not cond:
+                self.record('pruned', node)
+                return []
+            self.nested(node.body, alloc)
+            return self.hoist(node, alloc) + [node]
+        elif isinstance(node, FuncDef):
+            self.nested(node.body, alloc)
+        return [node]
+
+    def if_stmt(self, node: If, alloc: Callable[[str, Type], int]) -> list[Stmt]:
+        cases = []
+        default = node.default
+        for cond, body in node.cases:
+            cond = self.expr(cond)
+            val = self.value(cond)
+            if val is NOVALUE:
+                self.nested(body, alloc)
+                cases.append((cond, body))
+                continue
+            self.record('pruned', cond)
+            if val:
+                # 后面的分支都不会执行了
+                default = body
+                break
+        else:
+            self.nested(default, alloc)
+            node.cases, node.default = cases, default
+            if not cases and not default.stmts:
+                return []
+            return [node]
+        self.nested(default, alloc)
+        node.cases, node.default = cases, default
+        return [node]
+
+    def value(self, node: Expr) -> Any:
+        """常量表达式的值，不是常量时返回NOVALUE"""
+        if isinstance(node, Const):
+            return node.val
+        if isinstance(node, BinaryOp) and pyop(node):
+            left, right = self.value(node.left), self.value(node.right)
+            if left is NOVALUE or right is NOVALUE:
+                return NOVALUE
+            try:
+                return node.impl(Value(node.left_tp, left), Value(node.right_tp, right)).val
+            except Exception:
+                # 比如除以0，留到运行时报错
+                return NOVALUE
+        if isinstance(node, UnaryOp) and pyop(node):
+            val = self.value(node.val)
+            if val is NOVALUE:
+                return NOVALUE
+            try:
+                return node.impl(Value(node.val_tp, val)).val
+            except Exception:
+                return NOVALUE
+        return NOVALUE
+
+    def expr(self, node: Expr) -> Expr:
+        if isinstance(node, BinaryOp):
+            node.left, node.right = self.expr(node.left), self.expr(node.right)
+            return self.fold(node)
+        elif isinstance(node, UnaryOp):
+            node.val = self.expr(node.val)
+            return self.fold(node)
+        elif isinstance(node, Assign):
+            node.val = self.expr(node.val)
+        elif isinstance(node, FuncCall):
+            node.args = [self.expr(i) for i in node.args]
+        return node
+
+    def fold(self, node: BinaryOp | UnaryOp) -> Expr:
+        val = self.value(node)
+        if val is NOVALUE or const_types.get(type(val).__name__) != str(node.tp):
+            return node
+        # 结果类型没有注册时Const没法求值，不折叠
+        if typeDetail(node.tp, self.scope) is None:
+            return node
+        self.record('folded', node)
+        return Const(node.pos, val)
+
+    def hoist(self, loop: While, alloc: Callable[[str, Type], int]) -> list[Stmt]:
+        assigned: set[tuple[int, int]] = set()
+        if not self.scan(loop.cond, 0, assigned) or not self.scan(loop.body, loop.body.scoped, assigned):
+            # 循环里调用了用户函数，外层变量随时可能被改
+            assigned = None
+        decls: list[Stmt] = []
+        hoisted: dict[Any, VarDecl] = {}
+
+        def replace(node: Expr, level: int) -> Expr:
+            if isinstance(node, (BinaryOp, UnaryOp)):
+                key = self.key(node, level, assigned)
+                if key is not None:
+                    if key not in hoisted:
+                        self.counter += 1
+                        name = "$inv{}".format(self.counter)
+                        decl = VarDecl(node.pos, [(name, node.tp, self.shift(node, level))])
+                        decl.slots.append(alloc(name, node.tp))
+                        decls.append(decl)
+                        self.record('hoisted', node)
+                        hoisted[key] = decl
+                    decl = hoisted[key]
+                    var = Variable(node.pos, decl.vardecls[0][0])
+                    var.depth, var.slot = level, decl.slots[0]
+                    return var
+            if isinstance(node, BinaryOp):
+                node.left, node.right = replace(node.left, level), replace(node.right, level)
+            elif isinstance(node, UnaryOp):
+                node.val = replace(node.val, level)
+            elif isinstance(node, Assign):
+                node.val = replace(node.val, level)
+            elif isinstance(node, FuncCall):
+                node.args = [replace(i, level) for i in node.args]
+            return node
+
+        def walk(node: Stmt, level: int):
+            if isinstance(node, Block):
+                for stmt in node.stmts:
+                    walk(stmt, level)
+            elif isinstance(node, ExprStmt):
+                node.expr = replace(node.expr, level)
+            elif isinstance(node, VarDecl):
+                node.vardecls = [(name, tp, None if val is None else replace(val, level))
+                                 for name, tp, val in node.vardecls]
+            elif isinstance(node, Return):
+                if node.val is not None:
+                    node.val = replace(node.val, level)
+            elif isinstance(node, If):
+                node.cases = [(replace(cond, level), body) for cond, body in node.cases]
+                for _, body in node.cases:
+                    walk(body, level + body.scoped)
+                walk(node.default, level + node.default.scoped)
+            elif isinstance(node, While):
+                node.cond = replace(node.cond, level)
+                walk(node.body, level + node.body.scoped)
+
+        loop.cond = replace(loop.cond, 0)
+        walk(loop.body, loop.body.scoped)
+        return decls
+
+    def scan(self, node: Stmt | Expr, level: int, assigned: set[tuple[int, int]]) -> bool:
+        """收集循环里被赋值的外层变量，遇到用户函数调用或定义时返回False"""
+        if isinstance(node, Block):
+            return all(self.scan(i, level, assigned) for i in node.stmts)
+        elif isinstance(node, ExprStmt):
+            return self.scan(node.expr, level, assigned)
+        elif isinstance(node, VarDecl):
+            return all(self.scan(val, level, assigned) for _, _, val in node.vardecls if val is not None)
+        elif isinstance(node, Return):
+            return node.val is None or self.scan(node.val, level, assigned)
+        elif isinstance(node, If):
+            return (all(self.scan(cond, level, assigned) and self.scan(body, level + body.scoped, assigned)
+                        for cond, body in node.cases)
+                    and self.scan(node.default, level + node.default.scoped, assigned))
+        elif isinstance(node, While):
+            return self.scan(node.cond, level, assigned) and self.scan(node.body, level + node.body.scoped, assigned)
+        elif isinstance(node, FuncDef):
+            return False
+        elif isinstance(node, Assign):
+            if node.depth >= level:
+                assigned.add((node.depth - level, node.slot))
+            return self.scan(node.val, level, assigned)
+        elif isinstance(node, (BinaryOp, UnaryOp, FuncCall)):
+            if node.impl is None:
+                return False
+            children = [node.left, node.right] if isinstance(node, BinaryOp) else \
+                [node.val] if isinstance(node, UnaryOp) else node.args
+            return all(self.scan(i, level, assigned) for i in children)
+        return True
+
+    def key(self, node: Expr, level: int, assigned: set[tuple[int, int]] | None) -> Any:
+        """循环不变的纯表达式返回结构相同即相等的键，否则返回None"""
+        if isinstance(node, Const):
+            return type(node.val), node.val
+        elif isinstance(node, Variable):
+            if assigned is None or node.depth < level or (node.depth - level, node.slot) in assigned:
+                return None
+            return node.depth - level, node.slot
+        elif isinstance(node, BinaryOp):
+            if pyop(node) not in safe_ops:
+                return None
+            left = self.key(node.left, level, assigned)
+            right = left and self.key(node.right, level, assigned)
+            return right and (node.op, left, right)
+        elif isinstance(node, UnaryOp):
+            if pyop(node) not in safe_ops:
+                return None
+            val = self.key(node.val, level, assigned)
+            return val and (node.op, val)
+        return None
+
+    def shift(self, node: Expr, level: int) -> Expr:
+        # 表达式挪到循环外面，变量的层数要减掉循环内的嵌套层数
+        if isinstance(node, Variable):
+            node.depth -= level
+        elif isinstance(node, BinaryOp):
+            self.shift(node.left, level)
+            self.shift(node.right, level)
+        elif isinstance(node, UnaryOp):
+            self.shift(node.val, level)
+        return node
+
+
+def optimize(tree: Block, scope: Scope) -> Optimizer:
+    opt = Optimizer()
+    opt.optimize(tree, scope)
+    return opt
@@ -0,0 +1,195 @@
+from typing import Iterable
+
+from bast import *
+from bdata import TokenType, prio_map
+from berror import BParserError
+from blex import Lexer, Token
+from bsource import Source
+
+unary_ops = {TokenType.ADD, TokenType.SUB, TokenType.NOT, TokenType.INV}
+
+
+class Parser:
+    """
+    递归下降 + 优先级爬升，只看一个Token，不回溯
+    Token按需从迭代器里取，不会先生成整个列表
+    """
+
+    def __init__(self, tokens: Iterable[Token], source: Source | None = None):
+        self.tokens = iter(tokens)
+        self.source = source
+        self.cur: Token = next(self.tokens)
+
+    def error(self, msg: str, tok: Token | None = None):
+        tok = tok or self.cur
+        if tok.tp == TokenType.EOF:
+            msg = "unexpected EOF"
+        return BParserError(msg, tok.pos, self.source)
+
+    def next(self) -> Token:
+        tok = self.cur
+        if tok.tp != TokenType.EOF:
+            self.cur = next(self.tokens)
+        return tok
+
+    def expect(self, tp: TokenType) -> Token:
+        if self.cur.tp != tp:
+            raise self.error("unexpected token '{}'".format(self.cur.val))
+        return self.next()
+
+    def match(self, tp: TokenType) -> bool:
+        if self.cur.tp == tp:
+            self.next()
+            return True
+        return False
+
+    def program(self) -> Block:
+        stmts = []
+        while self.cur.tp != TokenType.EOF:
+            stmts.append(self.stmt())
+        return Block(0, stmts)
+
+    def stmt(self) -> Stmt:
+        tp = self.cur.tp
+        if tp == TokenType.BEGIN:
+            return self.block()
+        elif tp == TokenType.K_VAR:
+            return self.vardecl()
+        elif tp == TokenType.K_IF:
+            return self.if_stmt()
+        elif tp == TokenType.K_WHILE:
+            pos = self.next().pos
+            cond = self.expr()
+            return While(pos, cond, self.block())
+        elif tp == TokenType.K_FUNC:
+            return self.funcdef()
+        elif tp == TokenType.K_RETURN:
+            pos = self.next().pos
+            val = None if self.cur.tp == TokenType.SEMICOLON else self.expr()
+            self.expect(TokenType.SEMICOLON)
+            return Return(pos, val)
+        elif tp == TokenType.K_BREAK:
+            pos = self.next().pos
+            self.expect(TokenType.SEMICOLON)
+            return Break(pos)
+        elif tp == TokenType.K_CONTINUE:
+            pos = self.next().pos
+            self.expect(TokenType.SEMICOLON)
+            return Continue(pos)
+        elif tp == TokenType.SEMICOLON:
+            return NoOp(self.next().pos)
+        pos = self.cur.pos
+        expr = self.expr()
+        self.expect(TokenType.SEMICOLON)
+        return ExprStmt(pos, expr)
+
+    def block(self) -> Block:
+        pos = self.expect(TokenType.BEGIN).pos
+        stmts = []
+        while self.cur.tp != TokenType.END:
+            if self.cur.tp == TokenType.EOF:
+                raise self.error("unexpected EOF")
+            stmts.append(self.stmt())
+        self.next()
+        return Block(pos, stmts)
+
+    def type(self) -> Type:
+        name = self.expect(TokenType.IDENT).val
+        # 泛型参数直接拼进类型名，Array[Int]和普通类型一样按名字查找
+        if self.match(TokenType.LSQBR):
+            name += "[{}]".format(self.type())
+            self.expect(TokenType.RSQBR)
+        return BasicType(name)
+
+    def vardecl(self) -> VarDecl:
+        pos = self.next().pos
+        vardecls = []
+        while True:
+            name = self.expect(TokenType.IDENT).val
+            self.expect(TokenType.COLON)
+            tp = self.type()
+            val = self.expr() if self.match(TokenType.ASSIGN) else None
+            vardecls.append((name, tp, val))
+            if not self.match(TokenType.COMMA):
+                break
+        self.expect(TokenType.SEMICOLON)
+        return VarDecl(pos, vardecls)
+
+    def if_stmt(self) -> If:
+        pos = self.next().pos
+        cases = [(self.expr(), self.block())]
+        default = None
+        while self.match(TokenType.K_ELSE):
+            if self.match(TokenType.K_IF):
+                cases.append((self.expr(), self.block()))
+            else:
+                default = self.block()
+                break
+        return If(pos, cases, default or Block(pos, []))
+
+    def funcdef(self) -> FuncDef:
+        pos = self.next().pos
+        name = self.expect(TokenType.IDENT).val
+        self.expect(TokenType.LPAREN)
+        params, param_types = [], []
+        if self.cur.tp != TokenType.RPAREN:
+            while True:
+                params.append(self.expect(TokenType.IDENT).val)
+                self.expect(TokenType.COLON)
+                param_types.append(self.type())
+                if not self.match(TokenType.COMMA):
+                    break
+        self.expect(TokenType.RPAREN)
+        ret_type = self.type() if self.match(TokenType.COLON) else None
+        return FuncDef(pos, name, params, param_types, ret_type, self.block())
+
+    def expr(self) -> Expr:
+        left = self.binary(0)
+        if self.cur.tp == TokenType.ASSIGN:
+            tok = self.next()
+            if not isinstance(left, Variable):
+                raise self.error("cannot assign to an expression", tok)
+            # 赋值右结合
+            return Assign(tok.pos, left.name, self.expr())
+        return left
+
+    def binary(self, min_prio: int) -> Expr:
+        left = self.unary()
+        while True:
+            tok = self.cur
+            prio = prio_map.get(tok.tp)
+            if prio is None or prio < min_prio:
+                return left
+            self.next()
+            left = BinaryOp(tok.pos, tok.val, left, self.binary(prio + 1))
+
+    def unary(self) -> Expr:
+        if self.cur.tp in unary_ops:
+            tok = self.next()
+            return UnaryOp(tok.pos, tok.val, self.unary())
+        return self.primary()
+
+    def primary(self) -> Expr:
+        tok = self.next()
+        if tok.tp == TokenType.CONST:
+            return Const(tok.pos, tok.val)
+        elif tok.tp == TokenType.IDENT:
+            if not self.match(TokenType.LPAREN):
+                return Variable(tok.pos, tok.val)
+            args = []
+            if self.cur.tp != TokenType.RPAREN:
+                args.append(self.expr())
+                while self.match(TokenType.COMMA):
+                    args.append(self.expr())
+            self.expect(TokenType.RPAREN)
+            return FuncCall(tok.pos, tok.val, args)
+        elif tok.tp == TokenType.LPAREN:
+            expr = self.expr()
+            self.expect(TokenType.RPAREN)
+            return expr
+        raise self.error("unexpected token '{}'".format(tok.val), tok)
+
+
+def parse(code: str, name: str = "<string>") -> Block:
+    lexer = Lexer(code, name)
+    return Parser(lexer.tokens(), lexer.source).program()
@@ -0,0 +1,173 @@
+"""
+按语法树节点统计的性能分析，只用于树解释器
+开启时把各节点类的visit和Func.call换成计时的版本，关闭后换回原样，不开启时没有任何开销
+每个节点按(类名, pos)记录执行次数，加速后换了类的节点仍算在原来的类名下、包含子节点的时间和只算自己的时间
+函数调用另外按调用栈汇总，可以导出火焰图工具用的折叠栈格式
+"""
+import time
+from typing import Any
+
+from bast import *
+from bsource import Source
+
+
+def nodeClasses() -> list[type]:
+    classes, todo = [], [Stmt, Expr]
+    while todo:
+        cls = todo.pop()
+        classes.append(cls)
+        todo.extend(cls.__subclasses__())
+    return classes
+
+
+class Record:
+    __slots__ = ('hits', 'incl', 'excl', 'active')
+
+    def __init__(self):
+        self.hits, self.incl, self.excl = 0, 0.0, 0.0
+        # 正在执行的层数，递归时只有最外层计入包含时间
+        self.active = 0
+
+
+class Profiler:
+    def __init__(self, source: Source | None = None):
+        self.source = source
+        self.nodes: dict[tuple[str, int | None], Record] = {}
+        self.funcs: dict[tuple[str, int | None], Record] = {}
+        self.stacks: dict[tuple[str, ...], float] = {}
+        # 每层正在执行的节点，记录子节点用掉的时间
+        self.children: list[float] = []
+        self.frames: list[str] = ["<module>"]
+        self.frame_children: list[float] = [0.0]
+        self.names: dict[int, tuple[str, int | None]] = {}
+        self.saved: list[tuple[type, str, Any]] = []
+        # 节点类 -> 记录里用的类名，Quick开头的类记在它的基类上
+        self.kinds: dict[type, str] = {}
+
+    def __enter__(self) -> "Profiler":
+        self.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.disable()
+
+    def attach(self, tree: Block):
+        """记下函数体对应的函数名，折叠栈里用函数名做帧"""
+        def name(node: FuncDef):
+            self.names[id(node.body)] = node.name, node.pos
+        eachFuncDef(tree, name)
+
+    def enable(self):
+        for cls in nodeClasses():
+            self.kinds[cls] = cls.__base__.__name__ if cls.__name__.startswith('Quick') else cls.__name__
+            if 'visit' in cls.__dict__:
+                self.patch(cls, 'visit', self.timed(cls.__dict__['visit']))
+        self.patch(Func, 'call', self.timedCall())
+
+    def disable(self):
+        while self.saved:
+            cls, name, orig = self.saved.pop()
+            setattr(cls, name, orig)
+
+    def patch(self, cls: type, name: str, fn: Callable):
+        self.saved.append((cls, name, cls.__dict__[name]))
+        setattr(cls, name, fn)
+
+    def timed(self, visit: Callable) -> Callable:
+        nodes, children, kinds, clock = self.nodes, self.children, self.kinds, time.perf_counter
+
+        def run(node, scope: Scope):
+            key = kinds[type(node)], node.pos
+            rec = nodes.get(key)
+            if rec is None:
+                rec = nodes[key] = Record()
+            rec.hits += 1
+            rec.active += 1
+            children.append(0.0)
+            start = clock()
+            try:
+                return visit(node, scope)
+            finally:
+                total = clock() - start
+                rec.excl += total - children.pop()
+                rec.active -= 1
+                if not rec.active:
+                    rec.incl += total
+                if children:
+                    children[-1] += total
+        return run
+
+    def timedCall(self) -> Callable:
+        """和Func.call一样的蹦床，每次尾调用换掉栈顶的帧"""
+        prof, clock = self, time.perf_counter
+
+        def call(func: Func, args: list) -> Any:
+            while True:
+                args += func.padding
+                name, pos = prof.names.get(id(func.body), ("<func>", None))
+                rec = prof.funcs.get((name, pos))
+                if rec is None:
+                    rec = prof.funcs[name, pos] = Record()
+                rec.hits += 1
+                rec.active += 1
+                prof.frames.append(name)
+                prof.frame_children.append(0.0)
+                start = clock()
+                try:
+                    ret = func.code(Scope(func.closure, slots=args))
+                finally:
+                    total = clock() - start
+                    excl = total - prof.frame_children.pop()
+                    rec.excl += excl
+                    stack = tuple(prof.frames)
+                    prof.stacks[stack] = prof.stacks.get(stack, 0.0) + excl
+                    prof.frames.pop()
+                    rec.active -= 1
+                    if not rec.active:
+                        rec.incl += total
+                    prof.frame_children[-1] += total
+                if not ret:
+                    return None
+                if ret.signal != RunSignal.TAILCALL:
+                    return ret.ret_value
+                func, args = ret.ret_value
+                if type(func) is not Func:
+                    return func(*args)
+        return call
+
+    def run(self, tree: Block, scope: Scope):
+        """在树解释器里执行并分析，顶层的时间算在<module>帧上"""
+        self.attach(tree)
+        start = time.perf_counter()
+        with self:
+            tree.visit(scope)
+        total = time.perf_counter() - start
+        stack = tuple(self.frames)
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + total - self.frame_children[0]
+        self.frame_children[0] = 0.0
+
+    def where(self, pos: int | None) -> str:
+        if pos is None:
+            return "?"
+        if self.source is None:
+            return str(pos)
+        return "{}:{}".format(*self.source.locate(pos))
+
+    def hotspots(self, limit: int | None = 20) -> list[tuple[str, str, Record]]:
+        """按自身时间从大到小排列的(位置, 名字, 记录)"""
+        rows = [(self.where(pos), kind, rec) for (kind, pos), rec in self.nodes.items()]
+        rows += [(self.where(pos), "func " + name, rec) for (name, pos), rec in self.funcs.items()]
+        rows.sort(key=lambda row: row[2].excl, reverse=True)
+        return rows[:limit]
+
+    def table(self, limit: int | None = 20) -> str:
+        lines = ["{:>10} {:<16} {:>10} {:>12} {:>12}".format("where", "node", "hits", "incl ms", "excl ms")]
+        for where, kind, rec in self.hotspots(limit):
+            lines.append("{:>10} {:<16} {:>10} {:>12.3f} {:>12.3f}".format(
+                where, kind, rec.hits, rec.incl * 1000, rec.excl * 1000))
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        """折叠栈格式：每行 帧;帧;帧 微秒数，可以直接交给flamegraph.pl、speedscope等"""
+        return "\n".join("{} {}".format(";".join(stack), round(t * 1e6))
+                         for stack, t in sorted(self.stacks.items()) if round(t * 1e6) > 0)
@@ -0,0 +1,340 @@
+"""
+把检查过的程序转译成Python源码，再用compile()得到code object
+Int之类的基本类型在生成的代码里不装箱，运算直接用Python原生运算符；
+其他情况调用内置实现，进出边界时再装箱/拆箱
+生成的code object可以用marshal缓存到磁盘
+"""
+import hashlib
+import marshal
+import os
+import re
+import sys
+from typing import Any
+
+from bast import *
+from bbuiltins import std_scope
+
+VERSION = 3
+
+native_types = {'Int', 'Float', 'Bool', 'String'}
+
+binary_ops = {
+    '__add__': '+', '__sub__': '-', '__mul__': '*', '__truediv__': '/', '__mod__': '%',
+    '__eq__': '==', '__ne__': '!=', '__gt__': '>', '__lt__': '<', '__ge__': '>=', '__le__': '<=',
+    '__lshift__': '<<', '__rshift__': '>>', '__and__': '&', '__or__': '|', '__xor__': '^',
+}
+
+unary_ops = {'__pos__': '+', '__neg__': '-', '__invert__': '~'}
+
+const_types = {'int': 'Int', 'float': 'Float', 'bool': 'Bool', 'str': 'String'}
+
+
+def isNative(tp: Type | None) -> bool:
+    return isinstance(tp, BasicType) and tp.name in native_types
+
+
+class Frame:
+    """对应运行时的一层Scope，func是它所属的Python函数"""
+
+    def __init__(self, func: "PyFunc"):
+        self.func = func
+        self.vars: dict[int, tuple[str, Type]] = {}
+        self.funcs: dict[FuncKey, str] = {}
+
+
+class PyFunc:
+    def __init__(self, name: str = "", params: list[str] | None = None):
+        self.nonlocals: set[str] = set()
+        self.loops = 0
+        self.name, self.params = name, params or []
+        # 函数体里有没有生成过自身尾调用（改写成循环）
+        self.self_tail = False
+
+
+class Generator:
+    def __init__(self):
+        self.lines: list[str] = []
+        self.indent = 1
+        self.frames: list[Frame] = []
+        self.func = PyFunc()
+        self.links: list[tuple[str, ...]] = []
+        self.link_index: dict[tuple[str, ...], int] = {}
+        self.counter = 0
+
+    def generate(self, tree: Block) -> tuple[str, list[tuple[int, str, str]]]:
+        top = Frame(self.func)
+        self.frames.append(top)
+        self.line("try:")
+        self.indent += 1
+        start = len(self.lines)
+        self.stmt(tree)
+        if len(self.lines) == start:
+            self.line("pass")
+        self.indent -= 1
+        self.line("finally:")
+        self.line("    __bf_export__(locals())")
+        header = "def __bf_main__(_L, _V, __bf_export__):"
+        exports = [(slot, name, str(tp)) for slot, (name, tp) in top.vars.items()]
+        return "\n".join([header] + self.lines) + "\n", exports
+
+    def line(self, text: str):
+        self.lines.append("    " * self.indent + text)
+
+    def fresh(self, prefix: str, name: str) -> str:
+        self.counter += 1
+        return "{}{}_{}".format(prefix, self.counter, re.sub(r'\W', '_', name))
+
+    def link(self, *desc: str) -> str:
+        if desc not in self.link_index:
+            self.link_index[desc] = len(self.links)
+            self.links.append(desc)
+        return "_L[{}]".format(self.link_index[desc])
+
+    def box(self, code: str, tp: Type) -> str:
+        if isNative(tp):
+            return "_V({}, {})".format(self.link('type', tp.name), code)
+        return code
+
+    def unbox(self, code: str, tp: Type) -> str:
+        if isNative(tp):
+            return "{}.val".format(code)
+        return code
+
+    def body(self, body: Block):
+        # 没有单独作用域的块不压帧，和运行时的Scope链保持一致
+        if body.scoped:
+            self.frames.append(Frame(self.func))
+        self.indent += 1
+        start = len(self.lines)
+        self.stmt(body)
+        if len(self.lines) == start:
+            self.line("pass")
+        self.indent -= 1
+        if body.scoped:
+            self.frames.pop()
+
+    def stmt(self, node: Stmt):
+        if isinstance(node, Block):
+            for stmt in node.stmts:
+                self.stmt(stmt)
+        elif isinstance(node, ExprStmt):
+            if isinstance(node.expr, Assign):
+                name, val = self.assign(node.expr)
+                self.line("{} = {}".format(name, val))
+            else:
+                self.line(self.expr(node.expr)[0])
+        elif isinstance(node, VarDecl):
+            frame = self.frames[-1]
+            for (name, tp, val), slot in zip(node.vardecls, node.slots):
+                if not isinstance(tp, BasicType):
+                    continue
+                if val is None:
+                    code = self.unbox("{}.new()".format(self.link('type', tp.name)), tp)
+                else:
+                    code = self.expr(val)[0]
+                pyname = frame.vars[slot][0] if slot in frame.vars else self.fresh('v', name)
+                frame.vars[slot] = (pyname, tp)
+                self.line("{} = {}".format(pyname, code))
+        elif isinstance(node, If):
+            if not node.cases:
+                # 优化器裁掉所有分支后只剩default
+                self.line("if True:")
+                self.body(node.default)
+                return
+            for i, (cond, body) in enumerate(node.cases):
+                self.line("{} {}:".format("elif" if i else "if", self.cond(cond)))
+                self.body(body)
+            if node.default.stmts:
+                self.line("else:")
+                self.body(node.default)
+        elif isinstance(node, While):
+            self.line("while {}:".format(self.cond(node.cond)))
+            self.func.loops += 1
+            self.body(node.body)
+            self.func.loops -= 1
+        elif isinstance(node, (Break, Continue)):
+            if not self.func.loops:
+                # 语义见bast.Break
+                self.line("return None")
+            else:
+                self.line("break" if isinstance(node, Break) else "continue")
+        elif isinstance(node, Return):
+            if node.tail and not self.func.loops and self.isSelfCall(node.val):
+                # 尾调用自己：重新绑定参数后回到函数体开头
+                params = self.func.params
+                if params:
+                    args = [self.expr(i)[0] for i in node.val.args]
+                    self.line("{} = {}".format(", ".join(params), ", ".join(args)))
+                self.line("continue")
+                self.func.self_tail = True
+            else:
+                self.line("return {}".format("None" if node.val is None else self.expr(node.val)[0]))
+        elif isinstance(node, FuncDef):
+            self.funcdef(node)
+        elif not isinstance(node, NoOp):
+            raise BTypeError("cannot transpile '{}'".format(type(node).__name__), node.pos)
+
+    def funcdef(self, node: FuncDef):
+        frame = self.frames[-1]
+        key = node.name, tuple(node.param_types)
+        pyname = frame.funcs.get(key) or self.fresh('f', node.name)
+        frame.funcs[key] = pyname
+        saved = self.func
+        params = [self.fresh('v', param) for param in node.params]
+        self.func = PyFunc(pyname, params)
+        inner = Frame(self.func)
+        for slot, (name, tp) in enumerate(zip(params, node.param_types)):
+            inner.vars[slot] = (name, tp)
+        self.line("def {}({}):".format(pyname, ", ".join(params)))
+        self.frames.append(inner)
+        self.indent += 1
+        start = len(self.lines)
+        # 先按包在while True里生成，没有自身尾调用时再去掉这一层缩进
+        self.indent += 1
+        self.stmt(node.body)
+        self.indent -= 1
+        if self.func.self_tail:
+            self.lines.insert(start, "    " * self.indent + "while True:")
+            self.line("    return None")
+        else:
+            self.lines[start:] = [line[4:] for line in self.lines[start:]]
+        if self.func.nonlocals:
+            self.lines.insert(start, "    " * self.indent + "nonlocal " + ", ".join(sorted(self.func.nonlocals)))
+        if len(self.lines) == start:
+            self.line("pass")
+        self.indent -= 1
+        self.frames.pop()
+        self.func = saved
+
+    def isSelfCall(self, node: FuncCall) -> bool:
+        return node.key is not None and self.frames[-1 - node.depth].funcs.get(node.key) == self.func.name
+
+    def cond(self, node: Expr) -> str:
+        code, tp = self.expr(node)
+        return code if isNative(tp) else code + ".val"
+
+    def variable(self, depth: int, slot: int) -> tuple[str, Type, Frame]:
+        frame = self.frames[-1 - depth]
+        return *frame.vars[slot], frame
+
+    def assign(self, node: Assign) -> tuple[str, str]:
+        val = self.expr(node.val)[0]
+        name, _, frame = self.variable(node.depth, node.slot)
+        if frame.func is not self.func:
+            self.func.nonlocals.add(name)
+        return name, val
+
+    def expr(self, node: Expr) -> tuple[str, Type]:
+        if isinstance(node, Const):
+            return repr(node.val), BasicType(const_types[type(node.val).__name__])
+        elif isinstance(node, Variable):
+            name, tp, _ = self.variable(node.depth, node.slot)
+            return name, tp
+        elif isinstance(node, Assign):
+            name, val = self.assign(node)
+            return "({} := {})".format(name, val), self.variable(node.depth, node.slot)[1]
+        elif isinstance(node, BinaryOp):
+            left, left_type = self.expr(node.left)
+            right, right_type = self.expr(node.right)
+            pyop = getattr(node.impl, 'pyop', None)
+            if pyop in binary_ops and isNative(left_type) and isNative(right_type) and isNative(node.tp):
+                return "({} {} {})".format(left, binary_ops[pyop], right), node.tp
+            if node.impl is None:
+                raise BTypeError("cannot transpile user-defined operator", node.pos)
+            name = "operator" + node.op
+            if node.left_tp.hasMethod((name, (right_type,))):
+                impl = self.link('method', node.left_tp.name, name, str(right_type))
+            else:
+                impl = self.link('func', name, str(left_type), str(right_type))
+            call = "{}({}, {})".format(impl, self.box(left, left_type), self.box(right, right_type))
+            return self.unbox(call, node.tp), node.tp
+        elif isinstance(node, UnaryOp):
+            val, val_type = self.expr(node.val)
+            pyop = getattr(node.impl, 'pyop', None)
+            if pyop in unary_ops and isNative(val_type) and isNative(node.tp):
+                return "({}{})".format(unary_ops[pyop], val), node.tp
+            if node.impl is None:
+                raise BTypeError("cannot transpile user-defined operator", node.pos)
+            name = "operator" + node.op
+            if node.val_tp.hasMethod((name, ())):
+                impl = self.link('method', node.val_tp.name, name)
+            else:
+                impl = self.link('func', name, str(val_type))
+            return self.unbox("{}({})".format(impl, self.box(val, val_type)), node.tp), node.tp
+        elif isinstance(node, FuncCall):
+            args = [self.expr(i) for i in node.args]
+            if node.key is not None:
+                pyname = self.frames[-1 - node.depth].funcs[node.key]
+                return "{}({})".format(pyname, ", ".join(code for code, _ in args)), node.tp
+            call = "{}({})".format(self.link('func', node.func, *(str(tp) for _, tp in args)), ", ".join(self.box(*i) for i in args))
+            return self.unbox(call, node.tp), node.tp
+        raise BTypeError("cannot transpile '{}'".format(type(node).__name__), node.pos)
+
+
+def resolve(desc: tuple[str, ...]) -> Any:
+    """链接表里都是字符串，能被marshal缓存：('type', 类型) ('method', 类型, 名称, 参数类型...) ('func', 名称, 参数类型...)"""
+    kind = desc[0]
+    if kind == 'type':
+        return std_scope.findType(desc[1])
+    elif kind == 'method':
+        return std_scope.findType(desc[1]).getMethod((desc[2], tuple(map(BasicType, desc[3:]))))[1]
+    return std_scope.findFunc((desc[1], tuple(map(BasicType, desc[2:]))))[1]
+
+
+class Program:
+    def __init__(self, code: Any, links: list[tuple[str, ...]], exports: list[tuple[int, str, str]]):
+        self.code, self.links, self.exports = code, links, exports
+
+    @classmethod
+    def generate(cls, tree: Block, name: str = "<string>") -> "Program":
+        source, exports = (gen := Generator()).generate(tree)
+        return cls(compile(source, "<bf:{}>".format(name), 'exec'), gen.links, exports)
+
+    @classmethod
+    def load(cls, path: str) -> "Program | None":
+        try:
+            with open(path, 'rb') as f:
+                version, code, links, exports = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != VERSION:
+            return None
+        return cls(code, links, exports)
+
+    def dump(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            marshal.dump((VERSION, self.code, self.links, self.exports), f)
+        os.replace(tmp, path)
+
+    def run(self, scope: Scope):
+        namespace: dict[str, Any] = {}
+        exec(self.code, namespace)
+        links = [resolve(i) for i in self.links]
+
+        def export(local: dict[str, Any]):
+            # 把顶层变量写回作用域，和其他执行模式保持一致
+            for slot, name, tp in self.exports:
+                if slot >= len(scope.slots):
+                    scope.slots.extend([None] * (slot + 1 - len(scope.slots)))
+                val = local.get(name)
+                if tp in native_types and name in local:
+                    val = Value(std_scope.findType(tp), val)
+                scope.slots[slot] = val
+
+        namespace['__bf_main__'](links, Value, export)
+
+
+def cache_path(code: str, name: str, cache_dir: str | None = None, optimized: bool = False) -> str | None:
+    """按源码、解释器版本和Python版本的哈希决定缓存文件名"""
+    if cache_dir is None:
+        if not os.path.isfile(name):
+            return None
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(name)), '__bfcache__')
+    key = "{}\0{}\0{}\0{}".format(VERSION, sys.implementation.cache_tag, int(optimized), code)
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest()[:32] + '.bfpy')
+
+
+def run_python(tree: Block, scope: Scope):
+    Program.generate(tree).run(scope)
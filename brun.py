@@ -0,0 +1,199 @@
+"""
+运行Butterfly程序
+用法：python brun.py 文件 [--mode tree|closure|vm|python] [-O] [--memo 容量] [--report]
+      [--profile] [--collapsed 输出文件] [--buffer 字节数]
+输出到终端时默认不缓冲，否则默认按64KB缓冲，--buffer 0关闭缓冲
+"""
+import sys
+from typing import Callable
+
+import bfc
+from bast import Block, quick_stats
+from bbuiltins import std_scope
+from bio import output
+from bmemo import Memoizer
+from bopt import Optimizer
+from bprof import Profiler
+from bpy import Program, cache_path, run_python
+from berror import BException, BIOError, BRecursionError
+from blex import Lexer
+from bparser import Parser
+from bsource import Source
+from btype import Scope
+from bvm import run_vm
+
+
+def run_tree(tree: Block, scope: Scope):
+    tree.visit(scope)
+
+
+def run_closure(tree: Block, scope: Scope):
+    tree.compile(scope)(scope)
+
+
+# 非尾递归太深时Python栈会溢出，换成Butterfly的运行时错误
+too_deep = "maximum recursion depth exceeded, use a loop or a tail call for deep recursion"
+
+
+def guarded(runner: Callable[[Block, Scope], None]) -> Callable[[Block, Scope], None]:
+    def run(tree: Block, scope: Scope):
+        try:
+            runner(tree, scope)
+        except RecursionError:
+            raise BRecursionError(too_deep) from None
+    return run
+
+
+modes: dict[str, Callable[[Block, Scope], None]] = {
+    'tree': guarded(run_tree),
+    'closure': guarded(run_closure),
+    'vm': guarded(run_vm),
+    'python': guarded(run_python),
+}
+
+
+def load(code: str, name: str = "<string>", optimizer: Optimizer | None = None,
+         memoizer: Memoizer | None = None) -> tuple[Block, Scope]:
+    """词法、语法分析并检查，返回语法树和检查时用的全局作用域"""
+    lexer = Lexer(code, name)
+    try:
+        tree = Parser(lexer.tokens(), lexer.source).program()
+        scope = Scope(std_scope)
+        tree.check(scope)
+    except BException as e:
+        e.source = e.source or lexer.source
+        raise
+    if optimizer is not None:
+        optimizer.optimize(tree, scope)
+    if memoizer is not None:
+        memoizer.install(tree)
+    return tree, scope
+
+
+def load_compiled(code: str, name: str = "<string>", optimizer: Optimizer | None = None) -> tuple[Block, Scope]:
+    """源文件旁边有匹配的.bfc时直接读出语法树，否则照常加载后写一份"""
+    path = bfc.bfc_path(name)
+    if path is None:
+        return load(code, name, optimizer)
+    key = bfc.cache_key(code, optimizer is not None)
+    module = bfc.Module.open(path, key)
+    if module is not None:
+        try:
+            return module.tree(), Scope(std_scope, module.nslots)
+        except BIOError:
+            # 顶层读不出来就当作没有缓存，重新生成一份覆盖掉
+            pass
+    tree, scope = load(code, name, optimizer)
+    bfc.save(path, key, tree, len(scope.slots))
+    return tree, scope
+
+
+def run_cached(code: str, name: str = "<string>", cache_dir: str | None = None,
+               optimizer: Optimizer | None = None) -> Scope:
+    """转译成Python执行，缓存命中时跳过词法、语法分析和检查"""
+    path = cache_path(code, name, cache_dir, optimizer is not None)
+    program = Program.load(path) if path else None
+    if program is None:
+        tree, scope = load(code, name, optimizer)
+        program = Program.generate(tree, name)
+        if path:
+            try:
+                program.dump(path)
+            except OSError:
+                pass
+    else:
+        scope = Scope(std_scope)
+    try:
+        program.run(scope)
+    except RecursionError:
+        raise BRecursionError(too_deep) from None
+    return scope
+
+
+def run(code: str, mode: str = 'tree', name: str = "<string>", cache_dir: str | None = None,
+        optimizer: Optimizer | None = None, memoizer: Memoizer | None = None,
+        profiler: Profiler | None = None) -> Scope:
+    if mode == 'python':
+        if memoizer is not None:
+            raise ValueError("--memo is not supported in python mode")
+        try:
+            return run_cached(code, name, cache_dir, optimizer)
+        except BException as e:
+            e.source = e.source or Source(code, name)
+            raise
+    tree, scope = load_compiled(code, name, optimizer)
+    # --report只报告这一次运行的加速情况
+    quick_stats.update(dict.fromkeys(quick_stats, 0))
+    if memoizer is not None:
+        # 缓存里存的是没装缓存的树，每次运行时再装
+        memoizer.install(tree)
+    try:
+        if profiler is not None:
+            # 性能分析只支持树解释器
+            profiler.source = profiler.source or Source(code, name)
+            profiler.run(tree, scope)
+        else:
+            modes[mode](tree, scope)
+    except BException as e:
+        e.source = e.source or Source(code, name)
+        raise
+    return scope
+
+
+def main(argv: list[str]):
+    mode = 'tree'
+    optimizer = Optimizer() if '-O' in argv else None
+    report = '--report' in argv
+    profiler = Profiler() if '--profile' in argv or '--collapsed' in argv else None
+    argv = [i for i in argv if i not in ('-O', '--report', '--profile')]
+    collapsed = None
+    if '--collapsed' in argv:
+        i = argv.index('--collapsed')
+        collapsed = argv[i + 1]
+        del argv[i: i + 2]
+    memoizer = None
+    if '--memo' in argv:
+        i = argv.index('--memo')
+        memoizer = Memoizer(int(argv[i + 1]))
+        del argv[i: i + 2]
+    buffer = 0 if sys.stdout.isatty() else 1 << 16
+    if '--buffer' in argv:
+        i = argv.index('--buffer')
+        buffer = int(argv[i + 1])
+        del argv[i: i + 2]
+    if '--mode' in argv:
+        i = argv.index('--mode')
+        mode = argv[i + 1]
+        del argv[i: i + 2]
+    if len(argv) != 1 or mode not in modes:
+        print("usage: python brun.py FILE [--mode {}] [-O] [--memo SIZE] [--report] [--profile] [--collapsed OUT] [--buffer BYTES]".format('|'.join(modes)))
+        return 2
+    if mode == 'python' and memoizer is not None:
+        # 转译成的Python代码里没有缓存的钩子
+        print("{}: --memo is not supported in python mode".format(argv[0]), file=sys.stderr)
+        return 2
+    with open(argv[0], encoding='utf-8') as f:
+        code = f.read()
+    try:
+        with output.buffered(buffer):
+            run(code, mode, argv[0], optimizer=optimizer, memoizer=memoizer, profiler=profiler)
+    except BException as e:
+        print("{}: {}".format(argv[0], e), file=sys.stderr)
+        return 1
+    if report and optimizer is not None:
+        print("optimizer: {}".format(optimizer.report()), file=sys.stderr)
+    if report and mode == 'tree' and profiler is None:
+        print("quickening: {}".format(", ".join("{} {}".format(k, v) for k, v in quick_stats.items())),
+              file=sys.stderr)
+    if report and memoizer is not None:
+        print("memo: {}".format(memoizer.report()), file=sys.stderr)
+    if profiler is not None:
+        print(profiler.table(), file=sys.stderr)
+        if collapsed:
+            with open(collapsed, 'w', encoding='utf-8') as f:
+                f.write(profiler.collapsed() + "\n")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
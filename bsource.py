@@ -0,0 +1,26 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+
+class Source:
+    """
+    源代码及其行首偏移表
+    Token和AST节点只记录整数偏移，(行, 列)在报错或性能分析时才按需计算
+    """
+
+    def __init__(self, code: str, name: str = "<string>"):
+        self.code, self.name = code, name
+        self._line_starts: list[int] | None = None
+
+    @property
+    def line_starts(self) -> list[int]:
+        if self._line_starts is None:
+            lines = self.code.split('\n')
+            lines.pop()
+            self._line_starts = list(accumulate((len(i) + 1 for i in lines), initial=0))
+        return self._line_starts
+
+    def locate(self, offset: int) -> tuple[int, int]:
+        starts = self.line_starts
+        line = bisect_right(starts, offset)
+        return line, offset - starts[line - 1] + 1
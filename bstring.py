@@ -0,0 +1,117 @@
+"""
+String和StringBuilder
+String的值是Python的str，或者拼接出来的Rope：多段共用一个列表，读的时候才拼成一个str
+s = s + x这样在末尾追加时，只要s是这个列表最新的一段就直接append，不拷贝前面的内容
+所以循环追加N段总共是线性的时间和内存
+StringBuilder就是一个可变的片段列表，toString时一次拼起来
+"""
+from typing import Any
+
+from btype import *
+
+# 两边加起来不超过这个长度就直接拼成str，短字符串没必要用Rope
+SMALL = 64
+
+
+class Rope:
+    """parts[:count]拼起来的字符串，parts可能被后来追加的Rope共用，不能改前count段"""
+    __slots__ = ('parts', 'count', 'length', 'flat')
+
+    def __init__(self, parts: list[str], count: int, length: int):
+        self.parts, self.count, self.length = parts, count, length
+        self.flat: str | None = None
+
+    def append(self, s: str) -> "Rope":
+        parts = self.parts
+        if len(parts) != self.count:
+            # 别的Rope已经在这个列表后面追加过了，只能复制一份
+            parts = parts[:self.count]
+        parts.append(s)
+        return Rope(parts, self.count + 1, self.length + len(s))
+
+    def flatten(self) -> str:
+        if self.flat is None:
+            self.flat = "".join(self.parts[:self.count])
+        return self.flat
+
+    def __str__(self) -> str:
+        return self.flatten()
+
+    def __repr__(self) -> str:
+        return repr(self.flatten())
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __hash__(self) -> int:
+        return hash(self.flatten())
+
+    def __eq__(self, other: Any) -> bool:
+        return self.flatten() == str(other)
+
+    def __ne__(self, other: Any) -> bool:
+        return self.flatten() != str(other)
+
+    def __lt__(self, other: Any) -> bool:
+        return self.flatten() < str(other)
+
+    def __gt__(self, other: Any) -> bool:
+        return self.flatten() > str(other)
+
+    def __le__(self, other: Any) -> bool:
+        return self.flatten() <= str(other)
+
+    def __ge__(self, other: Any) -> bool:
+        return self.flatten() >= str(other)
+
+    def __reduce__(self):
+        return str, (self.flatten(),)
+
+
+def concat(a: Any, b: Any) -> str | Rope:
+    if type(b) is Rope:
+        b = b.flatten()
+    if not b:
+        return a
+    if type(a) is Rope:
+        return a.append(b)
+    if len(a) + len(b) <= SMALL:
+        return a + b
+    return Rope([a, b], 2, len(a) + len(b))
+
+
+def install(scope: Scope, elems: dict[str, TypeDetail]):
+    """注册String的拼接、StringBuilder和相关的内置函数，elems是Int/Float/Bool/String的TypeDetail"""
+    Int, String = elems['Int'], elems['String']
+    Builder = TypeDetail('StringBuilder', {}, {}, [])
+    scope.types['StringBuilder'] = Builder
+    StringType, BuilderType, IntType, NoneType = map(BasicType, ('String', 'StringBuilder', 'Int', 'None'))
+
+    # 拼接不能翻译成Python的+，不然又变回平方的了
+    add = lambda a, b: Value(String, concat(a.val, b.val))
+    add.pure = True
+    String.method['operator+', (StringType,)] = (StringType, add)
+
+    length = lambda s: Value(Int, len(s.val))
+    length.pure = True
+    scope.defineFunc(('len', (StringType,)), (IntType, length))
+    for name in ('Int', 'Float', 'Bool'):
+        conv = lambda x: Value(String, str(x.val))
+        conv.pure = True
+        scope.defineFunc(('toString', (BasicType(name),)), (StringType, conv))
+
+    Builder.method['operator init', ()] = (BuilderType, lambda this: Value(Builder, []))
+
+    def append(sb: Value, s: Value):
+        sb.val.append(str(s.val))
+
+    def build(sb: Value) -> Value:
+        parts = sb.val
+        if len(parts) > 1:
+            # 拼好的结果留下来，再toString或继续追加时不用重拼
+            parts[:] = ["".join(parts)]
+        return Value(String, parts[0] if parts else "")
+
+    scope.defineFunc(('append', (BuilderType, StringType)), (NoneType, append))
+    scope.defineFunc(('toString', (BuilderType,)), (StringType, build))
+    scope.defineFunc(('len', (BuilderType,)), (IntType, lambda sb: Value(Int, sum(map(len, sb.val)))))
@@ -1,10 +1,114 @@
 import copy
-from typing import Any, Callable
-from bast import Block, Scope
-from berror import BTypeError
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, TYPE_CHECKING
+from berror import BNameError, BTypeError
+
+if TYPE_CHECKING:
+    from bast import Block
+
+# 运行时的作用域大多只用到slots，几个表先共用这个只读的空表，第一次写入时再创建
+EMPTY: Any = MappingProxyType({})
+
+
+class Scope:
+    __slots__ = ('parent', 'slots', 'slot_of', 'variables', 'types', 'funcs', 'overloads')
+
+    def __init__(self, parent: "Scope | None" = None, size: int = 0, slots: list | None = None):
+        self.parent = parent
+        # 运行时变量按(depth, slot)存取，检查时由declare分配槽号
+        # 调用函数时直接传入填好参数的slots，不再另外拷贝
+        self.slots: list = [None] * size if slots is None else slots
+        self.slot_of: dict[str, int] = EMPTY
+        self.variables: dict[str, Any] = EMPTY
+        self.types: dict[str, "TypeDetail"] = EMPTY
+        self.funcs: dict["FuncKey", "FuncDetail"] = EMPTY
+        # 函数名到各个重载参数类型的索引，精确匹配失败时用来找能隐式转换的重载
+        self.overloads: dict[str, list[tuple["Type", ...]]] = EMPTY
+
+    def defineFunc(self, key: "FuncKey", func: "FuncDetail"):
+        if self.funcs is EMPTY:
+            self.funcs, self.overloads = {}, {}
+        if key not in self.funcs:
+            self.overloads.setdefault(key[0], []).append(key[1])
+        self.funcs[key] = func
+
+    def declare(self, name: str, tp: "Type") -> int:
+        if self.variables is EMPTY:
+            self.slot_of, self.variables = {}, {}
+        self.variables[name] = tp
+        if name not in self.slot_of:
+            self.slot_of[name] = len(self.slots)
+            self.slots.append(None)
+        return self.slot_of[name]
+
+    def resolve(self, name: str) -> tuple[int, int, "Type"]:
+        scope, depth = self, 0
+        while scope:
+            if name in scope.slot_of:
+                return depth, scope.slot_of[name], scope.variables[name]
+            scope, depth = scope.parent, depth + 1
+        raise BNameError("undefined variable '{}'".format(name))
+
+    def findVar(self, name: str):
+        if name in self.variables:
+            return self.variables[name]
+        elif self.parent:
+            return self.parent.findVar(name)
+        else:
+            raise BNameError("undefined variable '{}'".format(name))
+
+    def lookupFunc(self, key: "FuncKey") -> tuple[int, "FuncDetail"]:
+        scope, depth = self, 0
+        while scope:
+            func = scope.funcs.get(key)
+            if func is not None:
+                return depth, func
+            scope, depth = scope.parent, depth + 1
+        found = self.convertFunc(key)
+        if found is None:
+            raise BNameError("undefined function '{}'".format(keyName(key)))
+        return found
+
+    def convertFunc(self, key: "FuncKey") -> "tuple[int, FuncDetail] | None":
+        """没有完全匹配的重载时，找实参能通过parents隐式转换过去的，里层作用域优先"""
+        name, types = key
+        details = []
+        for tp in types:
+            try:
+                details.append(tp.getDetail(self))
+            except BNameError:
+                details.append(None)
+        scope, depth = self, 0
+        while scope:
+            params = bestOverload(details, scope.overloads.get(name, ()))
+            if params is not None:
+                return depth, scope.funcs[name, params]
+            scope, depth = scope.parent, depth + 1
+        return None
+
+    def findFunc(self, key: "FuncKey") -> "FuncDetail":
+        return self.lookupFunc(key)[1]
+
+    def findType(self, name: str):
+        if name in self.types:
+            return self.types[name]
+        elif self.parent:
+            return self.parent.findType(name)
+        else:
+            raise BNameError("undefined type '{}'".format(name))
+
+    def setVar(self, name: str, value):
+        if name in self.variables:
+            self.variables[name] = value
+        elif self.parent:
+            self.parent.setVar(name, value)
+        else:
+            raise BNameError("undefined variable '{}'".format(name))
 
 
 class Type:
+    __slots__ = ()
+
     def __eq__(self, _) -> bool:
         ...
 
@@ -19,11 +123,26 @@ class Type:
 
 
 class BasicType(Type):
-    def __init__(self, name: str):
-        self.name = name
+    """按名字驻留，同名的BasicType是同一个对象，比较和哈希都只看身份"""
+    __slots__ = ('name',)
+    interned: dict[str, "BasicType"] = {}
 
-    def __eq__(self, other) -> bool:
-        return isinstance(other, BasicType) and self.name == other.name
+    def __new__(cls, name: str) -> "BasicType":
+        tp = cls.interned.get(name)
+        if tp is None:
+            tp = cls.interned[name] = super().__new__(cls)
+            tp.name = name
+        return tp
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self):
+        # 反序列化时也要经过__new__，拿到驻留的那一个
+        return BasicType, (self.name,)
+
+    def __str__(self) -> str:
+        return self.name
 
     def getDetail(self, scope: Scope) -> "TypeDetail":
         return scope.findType(self.name)
@@ -39,65 +158,285 @@ class BasicType(Type):
         return isinstance(other, ListType) and self.base == other.base'''
 
 
+class TrackedDict(dict):
+    """TypeDetail的method和attrs用的字典，任何修改都会让所有类型缓存的方法表和属性布局失效"""
+
+    def _changed(self):
+        TypeDetail.epoch += 1
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        res = super().setdefault(key, default)
+        self._changed()
+        return res
+
+    def pop(self, *args):
+        res = super().pop(*args)
+        self._changed()
+        return res
+
+    def popitem(self):
+        res = super().popitem()
+        self._changed()
+        return res
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
+immutable_types = (int, float, bool, str, bytes, type(None), frozenset)
+
+
+def isImmutable(val: Any) -> bool:
+    if type(val) in immutable_types:
+        return True
+    if type(val) is tuple:
+        return all(isImmutable(i) for i in val)
+    # Value创建后不会被修改，对象的字段数组是可变的
+    return type(val) is Value and type(val.val) is not list and isImmutable(val.val)
+
+
+class Shape:
+    """
+    对象的属性布局：属性名到下标的映射，以及默认值模板
+    实例的字段就是按模板填好的列表，只有可变的默认值需要拷贝
+    """
+    __slots__ = ('names', 'index', 'template', 'mutable')
+
+    def __init__(self, attrs: dict):
+        self.names = tuple(attrs)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.template = tuple(attrs.values())
+        self.mutable = tuple(i for i, val in enumerate(self.template) if not isImmutable(val))
+
+    def instantiate(self) -> list:
+        fields = list(self.template)
+        for i in self.mutable:
+            fields[i] = copy.deepcopy(fields[i])
+        return fields
+
+
 class TypeDetail:
+    __slots__ = ('name', '_type', '_method', '_attrs', '_parents', '_table', '_overloads', '_shape', '_init',
+                 '_epoch')
+    # 任意类型的method/attrs/parents变化时加一，子类缓存了父类的内容，所以全部失效
+    epoch = 0
+
     def __init__(self, name: str, methods: dict[str, "FuncDetail"], attrs: dict, parents: list["TypeDetail"]):
-        # method的格式： 名称 参数类型列表 : (返回值, 主体)
-        # 可恶，为什么时隔一年半还要用这种方式实现重载！
+        # method的格式： (名称, 参数类型元组) : (返回值, 主体)，参数不含this
         # parents：继承一切+隐式转换
         self.name, self.method, self.attrs, self.parents = name, methods, attrs, parents
+        self._type = BasicType(name)
+        self._epoch = -1
+
+    @property
+    def method(self) -> TrackedDict:
+        return self._method
+
+    @method.setter
+    def method(self, methods: dict["FuncKey", "FuncDetail"]):
+        self._method = TrackedDict(methods)
+        TypeDetail.epoch += 1
+
+    @property
+    def attrs(self) -> TrackedDict:
+        return self._attrs
+
+    @attrs.setter
+    def attrs(self, attrs: dict):
+        self._attrs = TrackedDict(attrs)
+        TypeDetail.epoch += 1
+
+    @property
+    def parents(self) -> list["TypeDetail"]:
+        # 原地修改列表不会被发现，要换父类请整个赋值
+        return self._parents
+
+    @parents.setter
+    def parents(self, parents: list["TypeDetail"]):
+        self._parents = parents
+        TypeDetail.epoch += 1
+
+    def _refresh(self):
+        table = {}
+        for tp in reversed(self.mro()):
+            table.update(tp._method)
+        self._table = table
+        overloads = {}
+        for name, params in table:
+            overloads.setdefault(name, []).append(params)
+        self._overloads = overloads
+        self._shape = Shape(self.layout())
+        # 和以前一样只认自己定义的构造函数
+        self._init = self._method.get(("operator init", ()))
+        self._epoch = TypeDetail.epoch
+
+    def layout(self) -> dict:
+        """所有属性及默认值（不拷贝），父类在前，后面的覆盖前面的"""
+        res = {}
+        for i in self._parents:
+            res.update(i.layout())
+        res.update(self._attrs)
+        return res
+
+    def shape(self) -> Shape:
+        if self._epoch != TypeDetail.epoch:
+            self._refresh()
+        return self._shape
 
     def new(self) -> "Value":
-        newobj = Value(self, self.getAttrs())
+        if self._epoch != TypeDetail.epoch:
+            self._refresh()
+        newobj = Value(self, self._shape.instantiate())
         # 什么？self.attrs某一项没有初值？去找解释器！
-        if "operator init " in self.method:
-            return self.method["operator init "][1](newobj)
+        if self._init is not None:
+            return self._init[1](newobj)
         return newobj
-    
+
     def getAttrs(self) -> dict:
-        res = {}
-        for i in self.parents:
-            r = i.getAttrs()
-            for k, v in r.items():
-                res[k] = copy.deepcopy(v)
-        for k, v in self.attrs.items():
-            res[k] = copy.deepcopy(v)
+        shape = self.shape()
+        return dict(zip(shape.names, shape.instantiate()))
+
+    def mro(self) -> list["TypeDetail"]:
+        """线性化的继承顺序：自己在前，然后按parents深度优先，重复的只保留第一次"""
+        res, seen = [], set()
+
+        def walk(tp: TypeDetail):
+            if id(tp) in seen:
+                return
+            seen.add(id(tp))
+            res.append(tp)
+            for i in tp.parents:
+                walk(i)
+        walk(self)
         return res
 
-    def hasMethod(self, name: str):
-        if name in self.method:
-            return True
-        for i in self.parents:
-            if i.hasMethod(name):
-                return True
-        return False
-    
-    def getMethod(self, name: str):
-        if name in self.method:
-            return self.method[name]
-        for i in self.parents:
-            if i.hasMethod(name):
-                return i.getMethod(name)
-        raise BTypeError(f"undefined method '{name}'")
-    
-    def toType(self):
-        return self.name
+    def methodTable(self) -> dict["FuncKey", "FuncDetail"]:
+        """扁平的方法表，包含继承来的方法，method改动后下次访问时重建"""
+        if self._epoch != TypeDetail.epoch:
+            self._refresh()
+        return self._table
+
+    def findMethod(self, key: "FuncKey", details: "list[TypeDetail | None] | None" = None) -> "FuncDetail | None":
+        """details是实参的TypeDetail，给出时精确匹配失败还会找能隐式转换的重载"""
+        method = self.methodTable().get(key)
+        if method is None and details is not None:
+            params = bestOverload(details, self._overloads.get(key[0], ()))
+            if params is not None:
+                return self._table[key[0], params]
+        return method
+
+    def hasMethod(self, key: "FuncKey"):
+        return key in self.methodTable()
+
+    def getMethod(self, key: "FuncKey"):
+        method = self.methodTable().get(key)
+        if method is None:
+            raise BTypeError(f"undefined method '{keyName(key)}'")
+        return method
+
+    def toType(self) -> BasicType:
+        return self._type
+
+
+def conversionCost(src: "TypeDetail | None", dst: Type) -> int | None:
+    """src隐式转换成dst要沿parents走几步，转换不了返回None"""
+    if src is None:
+        return None
+    for i, tp in enumerate(src.mro()):
+        if tp._type is dst:
+            return i
+    return None
+
+
+def bestOverload(details: "list[TypeDetail | None]", candidates: Iterable[tuple[Type, ...]]) -> tuple[Type, ...] | None:
+    """在候选的参数类型里找总转换步数最少的一个"""
+    best, best_cost = None, None
+    for params in candidates:
+        if len(params) != len(details):
+            continue
+        cost = 0
+        for src, dst in zip(details, params):
+            step = conversionCost(src, dst)
+            if step is None:
+                break
+            cost += step
+        else:
+            if best_cost is None or cost < best_cost:
+                best, best_cost = params, cost
+    return best
 
 
 class Value:
+    # 运行时最多的对象，不要__dict__；创建后不会再修改，可以共享
+    # 变量槽里存的总是装箱的Value，只有closure、vm模式里基本类型运算的中间结果和python模式不装箱
+    __slots__ = ('tp', 'val')
+
     def __init__(self, tp: TypeDetail, val: Any):
         self.tp, self.val = tp, val
 
 
+class RunSignal:
+    # break/continue用单例，return每个节点一个，返回值在传回Func之前不会被覆盖
+    # TAILCALL的ret_value是(函数, 参数)，由Func.__call__接着调用，不占Python栈
+    __slots__ = ('signal', 'ret_value')
+    RETURN, BREAK, CONTINUE, TAILCALL = 0, 1, 2, 3
+
+    def __init__(self, signal, ret_value=None):
+        self.signal, self.ret_value = signal, ret_value
+
+
 class Func:
-    def __init__(self, params: list[str], body: Block, closure: Scope):
+    __slots__ = ('params', 'body', 'closure', 'code', 'padding', 'pure')
+
+    def __init__(self, params: list[str], body: "Block", closure: Scope, code: Callable | None = None):
         self.params, self.body, self.closure = params, body, closure
+        # code是编译好的函数体，没有就解释执行
+        self.code = code or body.visit
+        # 参数占函数作用域的前len(params)个槽，后面是局部变量
+        self.padding = [None] * (body.nslots - len(params))
+        self.pure = False
 
     def __call__(self, *args):
-        new_scope = Scope(self.closure)
-        new_scope.variables = dict(zip(self.params, args))
-        ret = self.body.visit(new_scope)
-        if ret:
-            return ret
+        return self.call(list(args))
+
+    def call(self, args: list) -> Any:
+        """
+        args是调用方新建的参数列表，直接补齐成函数作用域的slots
+        只有尾调用在这里循环；非尾调用每层仍占几个Python栈帧，太深时由brun报BRecursionError
+        不占Python栈的深递归只有vm模式
+        """
+        func = self
+        while True:
+            args += func.padding
+            ret = func.code(Scope(func.closure, slots=args))
+            if not ret:
+                return None
+            if ret.signal != RunSignal.TAILCALL:
+                return ret.ret_value
+            # 尾调用：在这里循环，不再嵌套一层Python调用
+            func, args = ret.ret_value
+            if type(func) is not Func:
+                return func(*args)
 
 
 FuncDetail = tuple[Type, Callable]
+# 重载的键：(名称, 参数类型元组)，类型是驻留的BasicType，哈希和比较都很快
+FuncKey = tuple[str, tuple[Type, ...]]
+
+
+def keyName(key: FuncKey) -> str:
+    """报错时显示的名字，和以前拼接的字符串键一样"""
+    return key[0] + " " + " ".join(map(str, key[1]))
@@ -0,0 +1,491 @@
+"""
+字节码编译器和栈式虚拟机
+指令预先解码成元组：操作码在第0项，后面是参数和已解析的实现、类型守卫，执行时不再查表
+If/While/break/continue/return全部编译成跳转，不再生成RunSignal
+内置基本类型运算的操作数是局部变量或常量时合并成一条指令，直接对原始值运算；条件跳转同样合并
+"""
+from operator import attrgetter
+from typing import Any
+
+from bast import *
+
+(HALT, CONST, LOAD_LOCAL, LOAD, STORE_LOCAL, STORE, POP,
+ BINARY, UNARY, CALL, JUMP, JUMP_IF_FALSE, ENTER, LEAVE,
+ NEW, MAKE_FUNC, RETURN, RETURN_NONE,
+ STORE_LOCAL_POP, STORE_POP, BINARY_CONST, TAIL_CALL,
+ BINARY_LC, BINARY_LL, BINARY_SC, BINARY_RAW, UNARY_RAW,
+ JUMP_LC, JUMP_LL, JUMP_SC, JUMP_RAW, MAKE_SCOPE, ENTER_TOP,
+ LOAD_PARENT, STORE_PARENT_POP) = range(35)
+
+opnames = ['HALT', 'CONST', 'LOAD_LOCAL', 'LOAD', 'STORE_LOCAL', 'STORE', 'POP',
+           'BINARY', 'UNARY', 'CALL', 'JUMP', 'JUMP_IF_FALSE', 'ENTER', 'LEAVE',
+           'NEW', 'MAKE_FUNC', 'RETURN', 'RETURN_NONE',
+           'STORE_LOCAL_POP', 'STORE_POP', 'BINARY_CONST', 'TAIL_CALL',
+           'BINARY_LC', 'BINARY_LL', 'BINARY_SC', 'BINARY_RAW', 'UNARY_RAW',
+           'JUMP_LC', 'JUMP_LL', 'JUMP_SC', 'JUMP_RAW', 'MAKE_SCOPE', 'ENTER_TOP',
+           'LOAD_PARENT', 'STORE_PARENT_POP']
+
+# 合并的运算指令 -> 对应的条件跳转指令
+jump_of = {BINARY_LC: JUMP_LC, BINARY_LL: JUMP_LL, BINARY_SC: JUMP_SC, BINARY_RAW: JUMP_RAW}
+
+get_tp = attrgetter('tp')
+
+
+class Code:
+    def __init__(self, name: str, nslots: int = 0):
+        self.name, self.nslots = name, nslots
+        # 编译时是可以回填的列表，finish()后变成元组
+        self.insts: list[Any] = []
+
+    def emit(self, op: int, *args: Any) -> int:
+        self.insts.append([op, *args])
+        return len(self.insts) - 1
+
+    def patch(self, at: int, target: int | None = None):
+        # 跳转目标总是指令的最后一项
+        self.insts[at][-1] = len(self.insts) if target is None else target
+
+    def finish(self) -> "Code":
+        self.insts = [tuple(i) for i in self.insts]
+        return self
+
+    def dis(self) -> str:
+        lines = []
+        for pc, ins in enumerate(self.insts):
+            args = " ".join(type(i).__name__ if callable(i) or isinstance(i, (Expr, TypeDetail)) else repr(i)
+                            for i in ins[1:])
+            lines.append("{:5} {:<16}{}".format(pc, opnames[ins[0]], args))
+        return "\n".join(lines)
+
+
+class VMFunc(Func):
+    """由虚拟机执行的函数，在虚拟机内调用时不占用Python栈"""
+    __slots__ = ('bytecode', 'entry')
+
+    def __init__(self, params: list[str], body: Block, closure: Scope, bytecode: Code | None,
+                 entry: list | None = None):
+        super().__init__(params, body, closure, lambda scope: execute(self.bytecode or self.load(), scope, True))
+        self.bytecode = bytecode
+        # 函数体还没解码时是MAKE_FUNC的表项，第一次调用时编译并写回表项
+        self.entry = entry
+
+    def load(self) -> Code:
+        _, node, bytecode = self.entry
+        if bytecode is None:
+            bytecode = self.entry[2] = Compiler(self.closure).function(node)
+        self.bytecode = bytecode
+        return bytecode
+
+    def call(self, args: list) -> Any:
+        args += self.padding
+        return self.code(Scope(self.closure, slots=args))
+
+
+class Loop:
+    def __init__(self, start: int, depth: int):
+        self.start, self.depth = start, depth
+        self.breaks: list[int] = []
+
+
+class Compiler:
+    def __init__(self, scope: Scope):
+        # scope只用来在编译时查常量的类型
+        self.scope = scope
+        self.code: Code | None = None
+        self.depth, self.loops = 0, []
+
+    def compile(self, tree: Block, name: str = "<module>") -> Code:
+        code = Code(name)
+        self.code, self.depth, self.loops = code, 0, []
+        self.stmt(tree)
+        code.emit(HALT)
+        return code.finish()
+
+    def function(self, node: FuncDef) -> Code:
+        saved = self.code, self.depth, self.loops
+        code = Code(node.name, node.body.nslots)
+        self.code, self.depth, self.loops = code, 0, []
+        self.stmt(node.body)
+        code.emit(RETURN_NONE)
+        self.code, self.depth, self.loops = saved
+        return code.finish()
+
+    def nested(self, body: Block):
+        if not body.scoped:
+            self.stmt(body)
+            return
+        self.code.emit(ENTER, body.nslots)
+        self.depth += 1
+        self.stmt(body)
+        self.depth -= 1
+        self.code.emit(LEAVE, 1)
+
+    def stmt(self, node: Stmt):
+        code = self.code
+        if isinstance(node, Block):
+            for stmt in node.stmts:
+                self.stmt(stmt)
+        elif isinstance(node, ExprStmt):
+            if isinstance(node.expr, Assign):
+                # 赋值语句的值用不到，存完直接弹出
+                self.expr(node.expr.val)
+                self.store(node.expr, True)
+            else:
+                self.expr(node.expr)
+                code.emit(POP)
+        elif isinstance(node, VarDecl):
+            for (name, tp, val), slot in zip(node.vardecls, node.slots):
+                if not isinstance(tp, BasicType):
+                    continue
+                if val is None:
+                    code.emit(NEW, tp.name)
+                else:
+                    self.expr(val)
+                code.emit(STORE_LOCAL_POP, slot)
+        elif isinstance(node, If):
+            ends = []
+            for cond, body in node.cases:
+                skip = self.branch(cond)
+                self.nested(body)
+                ends.append(code.emit(JUMP, 0))
+                code.patch(skip)
+            self.nested(node.default)
+            for at in ends:
+                code.patch(at)
+        elif isinstance(node, While):
+            scoped = node.body.scoped
+            if scoped:
+                # 和树解释器一样，每次执行循环只建一个循环体作用域，放在栈上各轮复用
+                code.emit(MAKE_SCOPE, node.body.nslots)
+            loop = Loop(len(code.insts), self.depth)
+            self.loops.append(loop)
+            exit_jump = self.branch(node.cond)
+            if scoped:
+                code.emit(ENTER_TOP)
+                self.depth += 1
+                self.stmt(node.body)
+                self.depth -= 1
+                code.emit(LEAVE, 1)
+            else:
+                self.stmt(node.body)
+            code.emit(JUMP, loop.start)
+            code.patch(exit_jump)
+            for at in loop.breaks:
+                code.patch(at)
+            if scoped:
+                code.emit(POP)
+            self.loops.pop()
+        elif isinstance(node, (Break, Continue)):
+            if not self.loops:
+                # 语义见bast.Break
+                code.emit(RETURN_NONE)
+                return
+            loop = self.loops[-1]
+            if self.depth > loop.depth:
+                code.emit(LEAVE, self.depth - loop.depth)
+            if isinstance(node, Break):
+                loop.breaks.append(code.emit(JUMP, 0))
+            else:
+                code.emit(JUMP, loop.start)
+        elif isinstance(node, Return):
+            if node.tail:
+                for arg in node.val.args:
+                    self.expr(arg)
+                call = node.val
+                code.emit(TAIL_CALL, call.impl, tuple(call.arg_tps), len(call.args), call)
+            elif node.val is None:
+                code.emit(RETURN_NONE)
+            else:
+                self.expr(node.val)
+                code.emit(RETURN)
+        elif isinstance(node, FuncDef):
+            key = node.name, tuple(node.param_types)
+            if isinstance(node.body, LazyBlock) and not node.body.loaded:
+                # 还没解码的函数体等到第一次调用时再编译，编译结果写回这个表项
+                code.emit(MAKE_FUNC, [key, node, None])
+            else:
+                code.emit(MAKE_FUNC, [key, node, self.function(node)])
+        elif not isinstance(node, NoOp):
+            raise BTypeError("cannot compile '{}'".format(type(node).__name__), node.pos)
+
+    def const(self, node: Expr) -> Value | None:
+        if not isinstance(node, Const):
+            return None
+        try:
+            return node.visit(self.scope)
+        except BNameError:
+            return None
+
+    def local(self, node: Expr) -> int | None:
+        return node.slot if isinstance(node, Variable) and node.depth == 0 else None
+
+    def raw(self, node: BinaryOp) -> int | None:
+        """内置基本类型运算按操作数的来源合并成一条指令，发出指令并返回它的下标"""
+        if not hasattr(node.impl, 'pyfn') or node.left_tp is None or node.right_tp is None:
+            return None
+        code, pyfn, box = self.code, node.impl.pyfn, node.impl.box
+        left, right = self.local(node.left), self.const(node.right)
+        if right is not None and right.tp is not node.right_tp:
+            right = None
+        if left is not None and right is not None:
+            return code.emit(BINARY_LC, left, right.val, pyfn, box, node.left_tp, node, right)
+        other = self.local(node.right)
+        if left is not None and other is not None:
+            return code.emit(BINARY_LL, left, other, pyfn, box, node.left_tp, node.right_tp, node)
+        self.expr(node.left)
+        if right is not None:
+            return code.emit(BINARY_SC, right.val, pyfn, box, node.left_tp, node, right)
+        self.expr(node.right)
+        return code.emit(BINARY_RAW, pyfn, box, node.left_tp, node.right_tp, node)
+
+    def branch(self, cond: Expr) -> int:
+        """条件为假时跳走，返回要回填的跳转指令"""
+        if isinstance(cond, BinaryOp):
+            at = self.raw(cond)
+            if at is not None:
+                # 运算和跳转合并：不装箱结果，最后一项是跳转目标
+                ins = self.code.insts[at]
+                ins[0] = jump_of[ins[0]]
+                ins.remove(cond.impl.box)
+                ins.append(0)
+                return at
+        self.expr(cond)
+        return self.code.emit(JUMP_IF_FALSE, 0)
+
+    def expr(self, node: Expr):
+        code = self.code
+        if isinstance(node, Const):
+            try:
+                code.emit(CONST, node.visit(self.scope))
+            except BNameError as e:
+                e.pos = node.pos
+                raise
+        elif isinstance(node, Variable):
+            if node.depth == 0:
+                code.emit(LOAD_LOCAL, node.slot)
+            elif node.depth == 1:
+                # 循环体里访问循环外的变量最常见
+                code.emit(LOAD_PARENT, node.slot)
+            else:
+                code.emit(LOAD, node.depth, node.slot)
+        elif isinstance(node, Assign):
+            self.expr(node.val)
+            self.store(node, False)
+        elif isinstance(node, BinaryOp):
+            if self.raw(node) is not None:
+                return
+            self.expr(node.left)
+            right = self.const(node.right)
+            if right is not None:
+                # 右操作数是常量时直接放进指令
+                code.emit(BINARY_CONST, node.impl, node.left_tp, node.right_tp, node, right)
+                return
+            self.expr(node.right)
+            code.emit(BINARY, node.impl, node.left_tp, node.right_tp, node)
+        elif isinstance(node, UnaryOp):
+            self.expr(node.val)
+            if hasattr(node.impl, 'pyfn') and node.val_tp is not None:
+                code.emit(UNARY_RAW, node.impl.pyfn, node.impl.box, node.val_tp, node)
+            else:
+                code.emit(UNARY, node.impl, node.val_tp, node)
+        elif isinstance(node, FuncCall):
+            for arg in node.args:
+                self.expr(arg)
+            code.emit(CALL, node.impl, tuple(node.arg_tps), len(node.args), node)
+        else:
+            raise BTypeError("cannot compile '{}'".format(type(node).__name__), node.pos)
+
+    def store(self, node: Assign, discard: bool):
+        if node.depth == 0:
+            self.code.emit(STORE_LOCAL_POP if discard else STORE_LOCAL, node.slot)
+        elif node.depth == 1 and discard:
+            self.code.emit(STORE_PARENT_POP, node.slot)
+        else:
+            self.code.emit(STORE_POP if discard else STORE, node.depth, node.slot)
+
+
+def execute(code: Code, scope: Scope, is_func: bool = False) -> Any:
+    stack: list[Any] = []
+    push, pop = stack.append, stack.pop
+    # 调用用户函数时压入(代码, pc, 作用域, 栈底)，返回时把栈截回栈底，丢掉循环留下的作用域
+    frames: list[tuple[Code, int, Scope, int]] = []
+    insts = code.insts
+    pc = base = 0
+    while True:
+        ins = insts[pc]
+        op = ins[0]
+        pc += 1
+        # 按执行频率排列
+        if op == LOAD_LOCAL:
+            push(scope.slots[ins[1]])
+        elif op == BINARY_LC:
+            _, slot, rv, pyfn, box, left_tp, node, right = ins
+            left = scope.slots[slot]
+            push(box(pyfn(left.val, rv)) if left.tp is left_tp else node.dispatch(scope, left, right))
+        elif op == STORE_LOCAL_POP:
+            scope.slots[ins[1]] = pop()
+        elif op == LOAD_PARENT:
+            push(scope.parent.slots[ins[1]])
+        elif op == STORE_PARENT_POP:
+            scope.parent.slots[ins[1]] = pop()
+        elif op == JUMP_LC:
+            _, slot, rv, pyfn, left_tp, node, right, target = ins
+            left = scope.slots[slot]
+            if not (pyfn(left.val, rv) if left.tp is left_tp else node.dispatch(scope, left, right).val):
+                pc = target
+        elif op == JUMP:
+            pc = ins[1]
+        elif op == CONST:
+            push(ins[1])
+        elif op == CALL:
+            _, impl, arg_tps, n, node = ins
+            args = stack[len(stack) - n:]
+            del stack[len(stack) - n:]
+            func = impl or boundFunc(node, scope) if tuple(map(get_tp, args)) == arg_tps else None
+            if type(func) is VMFunc:
+                # 在虚拟机内部调用，只压帧栈
+                frames.append((code, pc, scope, base))
+                code = func.bytecode or func.load()
+                insts = code.insts
+                args += func.padding
+                scope = Scope(func.closure, slots=args)
+                pc, base = 0, len(stack)
+            else:
+                push(node.dispatch(scope, args) if func is None else func(*args))
+        elif op == RETURN or op == RETURN_NONE:
+            ret = pop() if op == RETURN else None
+            if not frames:
+                return ret if is_func else None
+            del stack[base:]
+            code, pc, scope, base = frames.pop()
+            insts = code.insts
+            push(ret)
+        elif op == BINARY_LL:
+            _, a, b, pyfn, box, left_tp, right_tp, node = ins
+            slots = scope.slots
+            left, right = slots[a], slots[b]
+            if left.tp is left_tp and right.tp is right_tp:
+                push(box(pyfn(left.val, right.val)))
+            else:
+                push(node.dispatch(scope, left, right))
+        elif op == BINARY_SC:
+            _, rv, pyfn, box, left_tp, node, right = ins
+            left = stack[-1]
+            stack[-1] = box(pyfn(left.val, rv)) if left.tp is left_tp else node.dispatch(scope, left, right)
+        elif op == JUMP_SC:
+            _, rv, pyfn, left_tp, node, right, target = ins
+            left = pop()
+            if not (pyfn(left.val, rv) if left.tp is left_tp else node.dispatch(scope, left, right).val):
+                pc = target
+        elif op == BINARY_RAW:
+            _, pyfn, box, left_tp, right_tp, node = ins
+            right = pop()
+            left = stack[-1]
+            if left.tp is left_tp and right.tp is right_tp:
+                stack[-1] = box(pyfn(left.val, right.val))
+            else:
+                stack[-1] = node.dispatch(scope, left, right)
+        elif op == JUMP_LL:
+            _, a, b, pyfn, left_tp, right_tp, node, target = ins
+            slots = scope.slots
+            left, right = slots[a], slots[b]
+            if left.tp is left_tp and right.tp is right_tp:
+                if not pyfn(left.val, right.val):
+                    pc = target
+            elif not node.dispatch(scope, left, right).val:
+                pc = target
+        elif op == JUMP_RAW:
+            _, pyfn, left_tp, right_tp, node, target = ins
+            right = pop()
+            left = pop()
+            if left.tp is left_tp and right.tp is right_tp:
+                if not pyfn(left.val, right.val):
+                    pc = target
+            elif not node.dispatch(scope, left, right).val:
+                pc = target
+        elif op == LOAD:
+            frame = scope
+            for _ in range(ins[1]):
+                frame = frame.parent
+            push(frame.slots[ins[2]])
+        elif op == STORE_POP:
+            frame = scope
+            for _ in range(ins[1]):
+                frame = frame.parent
+            frame.slots[ins[2]] = pop()
+        elif op == ENTER_TOP:
+            scope = stack[-1]
+        elif op == LEAVE:
+            for _ in range(ins[1]):
+                scope = scope.parent
+        elif op == JUMP_IF_FALSE:
+            if not pop().val:
+                pc = ins[1]
+        elif op == BINARY or op == BINARY_CONST:
+            _, impl, left_tp, right_tp, node, *const = ins
+            right = const[0] if const else pop()
+            left = pop()
+            if left.tp is left_tp and right.tp is right_tp:
+                impl = impl or boundFunc(node, scope)
+                if impl is not None:
+                    push(impl(left, right))
+                    continue
+            push(node.dispatch(scope, left, right))
+        elif op == UNARY_RAW:
+            _, pyfn, box, val_tp, node = ins
+            val = stack[-1]
+            stack[-1] = box(pyfn(val.val)) if val.tp is val_tp else node.dispatch(scope, val)
+        elif op == UNARY:
+            _, impl, val_tp, node = ins
+            val = pop()
+            if val.tp is val_tp:
+                impl = impl or boundFunc(node, scope)
+                if impl is not None:
+                    push(impl(val))
+                    continue
+            push(node.dispatch(scope, val))
+        elif op == STORE_LOCAL:
+            scope.slots[ins[1]] = stack[-1]
+        elif op == STORE:
+            frame = scope
+            for _ in range(ins[1]):
+                frame = frame.parent
+            frame.slots[ins[2]] = stack[-1]
+        elif op == POP:
+            pop()
+        elif op == ENTER:
+            scope = Scope(scope, ins[1])
+        elif op == MAKE_SCOPE:
+            push(Scope(scope, ins[1]))
+        elif op == TAIL_CALL:
+            _, impl, arg_tps, n, node = ins
+            args = stack[len(stack) - n:]
+            del stack[base:]
+            func = impl or boundFunc(node, scope) if tuple(map(get_tp, args)) == arg_tps else None
+            if type(func) is VMFunc:
+                # 尾调用直接顶替当前帧
+                code = func.bytecode or func.load()
+                insts = code.insts
+                args += func.padding
+                scope = Scope(func.closure, slots=args)
+                pc = 0
+                continue
+            ret = node.dispatch(scope, args) if func is None else func(*args)
+            if not frames:
+                return ret if is_func else None
+            code, pc, scope, base = frames.pop()
+            insts = code.insts
+            push(ret)
+        elif op == NEW:
+            push(scope.findType(ins[1]).new())
+        elif op == MAKE_FUNC:
+            entry = ins[1]
+            key, node, bytecode = entry
+            func = VMFunc(node.params, node.body, scope, bytecode, entry)
+            scope.defineFunc(key, (node.ret_type, node.memo(func) if node.memo else func))
+        elif op == HALT:
+            return None
+
+
+def run_vm(tree: Block, scope: Scope):
+    execute(Compiler(scope).compile(tree), scope)
@@ -0,0 +1,32 @@
+"""
+数组的测试：逐元素运算出错要抛Butterfly的错误，归约的结果要对
+"""
+import pytest
+
+from berror import BValueError
+from brun import run
+
+REDUCE = '''
+var a: Array[Int] = range(10) * 3 - 4;
+var s: Int = sum(a);
+var lo: Int = min(a);
+var hi: Int = max(a);
+var n: Int = sum(a > 0);
+var f: Float = sum(a / 2);
+'''
+
+
+@pytest.mark.parametrize('mode', ['tree', 'closure', 'vm'])
+def test_reductions(mode: str):
+    slots = run(REDUCE, mode).slots
+    assert [v.val for v in slots[1:]] == [95, -4, 23, 8, 47.5]
+
+
+@pytest.mark.parametrize('code', [
+    'var a: Array[Float] = range(3) / 0;',
+    'var a: Array[Float] = fill(3, 1.5) / 0.0;',
+    'var a: Array[Int] = fill(2, 4611686018427387904) * 4;',
+])
+def test_errors_are_butterfly_errors(code: str):
+    with pytest.raises(BValueError):
+        run(code)
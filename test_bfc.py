@@ -0,0 +1,77 @@
+"""
+.bfc缓存的测试：文件里只允许语法树节点和类型，别的pickle数据不能被执行
+"""
+import marshal
+import os
+import pickle
+
+import bfc
+from bmemo import Memoizer
+from bprof import Profiler
+from brun import run
+
+CODE = '''
+func f(x: Int): Int { return x * 2; }
+var r: Int = f(21);
+'''
+
+
+class Evil:
+    def __init__(self, path: str):
+        self.path = path
+
+    def __reduce__(self):
+        return os.remove, (self.path,)
+
+
+def forge(path: str, key: bytes, obj: object):
+    seg = pickle.dumps(obj)
+    index = marshal.dumps((1, [(0, len(seg))]))
+    with open(path, 'wb') as f:
+        f.write(bfc.HEADER.pack(bfc.MAGIC, bfc.VERSION, 0, key, len(index)) + index + seg)
+
+
+def test_cache_round_trip(tmp_path):
+    src = tmp_path / 'a.bf'
+    src.write_text(CODE, encoding='utf-8')
+    assert run(CODE, name=str(src)).slots[-1].val == 42
+    assert (tmp_path / 'a.bfc').exists()
+    assert run(CODE, name=str(src)).slots[-1].val == 42
+
+
+def test_forged_cache_is_not_executed(tmp_path):
+    src, marker = tmp_path / 'a.bf', tmp_path / 'marker'
+    src.write_text(CODE, encoding='utf-8')
+    marker.write_text('')
+    forge(str(tmp_path / 'a.bfc'), bfc.cache_key(CODE), Evil(str(marker)))
+    # 读不出来就重新分析源码，并覆盖掉伪造的文件
+    assert run(CODE, name=str(src)).slots[-1].val == 42
+    assert marker.exists()
+    module = bfc.Module.open(str(tmp_path / 'a.bfc'), bfc.cache_key(CODE))
+    assert module is not None and module.tree() is not None
+
+
+LAZY = '''
+func unused(x: Int): Int { return x + 1; }
+func outer(n: Int): Int {
+    func sq(x: Int): Int { return x * x; }
+    return sq(n) + sq(n);
+}
+var r: Int = outer(7);
+'''
+
+
+def test_hooks_keep_bodies_lazy(tmp_path):
+    src = tmp_path / 'a.bf'
+    src.write_text(LAZY, encoding='utf-8')
+    run(LAZY, name=str(src))
+    for hook in (Memoizer(16).install, Profiler().attach):
+        module = bfc.Module.open(str(tmp_path / 'a.bfc'), bfc.cache_key(LAZY))
+        hook(module.tree())
+        assert module.decoded == 1
+    memoizer, profiler = Memoizer(16), Profiler()
+    scope = run(LAZY, name=str(src), memoizer=memoizer, profiler=profiler)
+    assert scope.slots[-1].val == 98
+    # outer的函数体解码时才给里面的sq装上缓存
+    assert memoizer.stats()['sq Int'] == {'hits': 1, 'misses': 1, 'evictions': 0, 'size': 1}
+    assert {name for name, _ in profiler.funcs} == {'outer', 'sq'}
@@ -0,0 +1,150 @@
+"""
+检查阶段和运行时作用域的测试：变量解析成(层数, 槽号)，重载记在节点上，不声明变量的块不建作用域，调用不拷贝参数
+"""
+import bast
+from bast import *
+from brun import load, modes, run
+
+NESTED = '''
+var a: Int = 1;
+var b: Int = 2;
+func f(x: Int): Int {
+    var y: Int = x + a;
+    if y > 0 {
+        var a: Int = y;
+        return a + b;
+    }
+    return y;
+}
+var c: Int = f(3);
+'''
+
+
+def variables(node: Any) -> list[Variable]:
+    res = []
+    if isinstance(node, Variable):
+        res.append(node)
+    if isinstance(node, (Stmt, Expr)):
+        for val in vars(node).values():
+            res += variables(val)
+    elif isinstance(node, (list, tuple)):
+        for i in node:
+            res += variables(i)
+    return res
+
+
+def test_resolve_depth_and_slot():
+    tree, scope = load(NESTED)
+    assert dict(scope.slot_of) == {'a': 0, 'b': 1, 'c': 2}
+    func = tree.stmts[2]
+    found = {(v.name, v.pos): (v.depth, v.slot) for v in variables(func.body)}
+    pos = NESTED.index
+    # 函数作用域里x是0号、y是1号槽，全局的a在外面一层
+    assert found['x', pos('x + a')] == (0, 0)
+    assert found['a', pos('a;\n    if')] == (1, 0)
+    # if里的a遮住了全局的a，b要往外走两层
+    assert found['a', pos('a + b')] == (0, 0)
+    assert found['b', pos('b;\n    }')] == (2, 1)
+    assert func.body.nslots == 2
+
+
+def test_resolved_program_runs():
+    assert [v.val for v in run(NESTED).slots] == [1, 2, 6]
+
+
+def test_overloads_bound_on_nodes():
+    tree, scope = load('func g(x: Int): Int { return x; }\nvar v: Int = g(1) + 2;\nprint(v);')
+    (_, _, val), = tree.stmts[1].vardecls
+    assert val.impl.pyop == '__add__' and val.left_tp is scope.findType('Int')
+    # 用户函数运行时才创建，只记下层数和键
+    assert val.left.impl is None and val.left.depth == 0 and val.left.key == ('g', (BasicType('Int'),))
+    assert tree.stmts[2].expr.impl is not None
+
+
+def test_type_guard_falls_back_to_dispatch():
+    Float = load('')[1].findType('Float')
+    for mode in ('tree', 'vm'):
+        scope = run('func add(x: Int, y: Int): Int { return x + y; }', mode)
+        add = scope.funcs['add', (BasicType('Int'), BasicType('Int'))][1]
+        # 守卫发现实参不是Int，按实际类型重新找到Float的+
+        res = add(Value(Float, 1.5), Value(Float, 2.0))
+        assert res.tp is Float and res.val == 3.5
+
+
+BLOCKS = '''
+var i: Int = 0;
+var s: Int = 0;
+while i < 10 {
+    if i % 2 == 0 { s = s + i; }
+    var t: Int = i;
+    i = t + 1;
+}
+'''
+
+
+def test_blocks_without_declarations_are_not_scoped():
+    tree, _ = load(BLOCKS)
+    loop = tree.stmts[2]
+    if_body = loop.body.stmts[0].cases[0][1]
+    assert loop.body.scoped and loop.body.nslots == 1
+    assert not if_body.scoped and if_body.nslots == 0
+    # if里没有自己的作用域，s就在循环体外面一层
+    assign = if_body.stmts[0].expr
+    assert (assign.depth, assign.slot) == (1, 1)
+
+
+def test_loop_body_scope_created_once(monkeypatch):
+    created = []
+
+    class Counting(Scope):
+        __slots__ = ()
+
+        def __init__(self, *args, **kwargs):
+            created.append(1)
+            super().__init__(*args, **kwargs)
+    monkeypatch.setattr(bast, 'Scope', Counting)
+    for mode in ('tree', 'closure'):
+        tree, scope = load(BLOCKS)
+        created.clear()
+        modes[mode](tree, scope)
+        assert scope.slots[1].val == 20 and len(created) == 1
+
+
+def test_return_signal_not_clobbered_by_recursion():
+    code = 'func f(n: Int): Int { if n == 0 { return 0; } return n + f(n - 1); }\nvar r: Int = f(50);'
+    for mode in ('tree', 'closure'):
+        assert run(code, mode).slots[0].val == 1275
+
+
+def test_scope_tables_created_on_first_write():
+    scope = Scope(None, 2)
+    assert scope.funcs is EMPTY and scope.variables is EMPTY and scope.slots == [None, None]
+    scope.declare('x', BasicType('Int'))
+    assert scope.variables is not EMPTY and scope.slot_of == {'x': 2} and scope.funcs is EMPTY
+    assert dict(EMPTY) == {}
+
+
+def test_call_arguments_become_slots():
+    frames = []
+    body = Block(0, [])
+    body.nslots = 3
+    func = Func(['a'], body, None, lambda scope: frames.append(scope.slots))
+    args = [1]
+    func.call(args)
+    # 参数列表补齐局部变量的槽位后直接当作函数作用域的slots
+    assert frames[0] is args and args == [1, None, None]
+
+
+CALLS = '''
+func zero(): Int { return 7; }
+func one(x: Int): Int { return x + 1; }
+func two(x: Int, y: Int): Int { return x * y; }
+func three(x: Int, y: Int, z: Int): Int { return x + y + z; }
+var s: Int = 0;
+var i: Int = 0;
+while i < 20 { s = s + two(one(i), 2) + three(i, zero(), 1) + len(toString(i)); i = i + 1; }
+'''
+
+
+def test_call_specialisations_match_tree():
+    assert run(CALLS, 'closure').slots[0].val == run(CALLS, 'tree').slots[0].val == 800
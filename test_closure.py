@@ -0,0 +1,75 @@
+"""
+闭包编译模式的测试：和树解释器的输出、全局变量一致，编译只做一次
+"""
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from brun import load, modes
+
+PROGRAMS = {
+    'control': '''
+var i: Int = 0;
+var s: Int = 0;
+while i < 30 {
+    i = i + 1;
+    if i % 3 == 0 { continue; } else if i > 25 { break; }
+    if i % 2 == 0 { s = s + i; } else { s = s - 1; print(s); }
+}
+print(s);
+''',
+    'nested': '''
+var g: Int = 10;
+func outer(a: Int): Int {
+    var b: Int = a * 2;
+    func inner(c: Int): Int {
+        if c > 0 { var d: Int = c + b + g; return d; }
+        return 0;
+    }
+    return inner(a) + inner(0 - a);
+}
+print(outer(3));
+g = 20;
+print(outer(4));
+''',
+    'blocks': '''
+var x: Int = 1;
+{ x = x + 1; }
+{ x = x * 3; x = x - 1; }
+{ x = x + 1; x = x + 2; x = x + 3; }
+if x > 0 { print(x); }
+if x < 0 { print(0); } else { print(-x); }
+''',
+    'recursion': '''
+func fib(n: Int): Int { if n < 2 { return n; } return fib(n - 1) + fib(n - 2); }
+func count(n: Int, acc: Int): Int { if n == 0 { return acc; } return count(n - 1, acc + 1); }
+print(fib(15));
+print(count(5000, 0));
+''',
+}
+
+
+def execute(code: str, mode: str) -> tuple[str, list]:
+    tree, scope = load(code)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        modes[mode](tree, scope)
+    return out.getvalue(), [None if v is None else v.val for v in scope.slots]
+
+
+@pytest.mark.parametrize('name', PROGRAMS)
+def test_matches_tree(name: str):
+    assert execute(PROGRAMS[name], 'closure') == execute(PROGRAMS[name], 'tree')
+
+
+def test_compiled_once():
+    tree, scope = load(PROGRAMS['control'])
+    code = tree.compile(scope)
+    with redirect_stdout(io.StringIO()):
+        code(scope)
+    first = scope.slots[1].val
+    scope.slots[:] = [None] * len(scope.slots)
+    with redirect_stdout(io.StringIO()):
+        code(scope)
+    assert scope.slots[1].val == first
@@ -0,0 +1,69 @@
+"""
+增量分析的测试：平移后位置要对，改了函数签名要重新检查调用它的段
+"""
+import os
+import subprocess
+import sys
+
+from bincr import Document, parse_segment
+
+CODE = '''var a: Int = 1;
+func f(x: Int): Int { return x + a; }
+var b: Int = f(2);
+var c: Int = 3;
+'''
+
+
+def test_positions_follow_shift():
+    doc = Document(CODE, parse_segment)
+    doc.check()
+    doc.edit(0, 0, "\n\n\n\n")
+    assert doc.stats['analysed'] == 0
+    assert [doc.offset(i, seg.result[0].pos) for i, seg in enumerate(doc.segments)] == doc.starts
+    assert [doc.code[i] for i in doc.starts] == ['v', 'f', 'v', 'v']
+
+
+def test_error_positions_are_absolute():
+    doc = Document(CODE + "var d: Int = ;\n", parse_segment)
+    doc.edit(0, 0, "\n\n")
+    (err,) = doc.errors()
+    assert doc.code[err.pos] == ';'
+    assert err.locate() == (7, 14)
+
+
+def test_signature_change_rechecks_callers():
+    doc = Document(CODE, parse_segment)
+    assert doc.check() == [0, 1, 2, 3]
+    i = doc.code.index("x: Int)") + 3
+    doc.edit(i, i + 3, "Bool")
+    # b没声明成功，c的槽号跟着变了，也要重新检查
+    assert doc.check() == [1, 2, 3]
+    assert len(doc.errors()) == 2
+
+
+def test_body_edit_keeps_callers():
+    doc = Document(CODE, parse_segment)
+    doc.check()
+    i = doc.code.index("x + a")
+    doc.edit(i, i + 5, "a + x")
+    assert doc.check() == [1]
+    assert doc.errors() == []
+
+
+REPLAY = '''
+import sys
+from bincr import Document, parse_segment
+doc = Document("var a: Int = 1, zz: Int = 2;\\nvar b: Int = a;\\n", parse_segment)
+doc.check()
+doc.edit(len(doc.code), len(doc.code), "var c: Int = zz;\\n")
+doc.check()
+print(dict(doc.scope.slot_of))
+'''
+
+
+def test_replay_keeps_declaration_order():
+    # 重放的顺序不能依赖字符串的哈希
+    for seed in range(5):
+        out = subprocess.run([sys.executable, '-c', REPLAY], capture_output=True, text=True, check=True,
+                             env={**os.environ, 'PYTHONHASHSEED': str(seed)}).stdout
+        assert out == "{'a': 0, 'zz': 1, 'b': 2, 'c': 3}\n"
@@ -0,0 +1,85 @@
+"""
+输入输出的测试：缓冲输出何时写出，File逐行读，readFile读小文件和mmap读大文件
+"""
+import io
+import sys
+
+import pytest
+
+import bio
+from berror import BIOError
+from bio import Output, Stream, readFile
+from brun import run
+
+
+class Counting(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def write(self, s: str) -> int:
+        self.writes += 1
+        return super().write(s)
+
+
+def test_buffered_output(monkeypatch):
+    out, stream = Output(), Counting()
+    monkeypatch.setattr(sys, 'stdout', stream)
+    with out.buffered(10):
+        out.write("abc\n")
+        out.write("def\n")
+        assert stream.getvalue() == ""
+        out.write("ghi\n")
+        # 攒够10个字符一次写出
+        assert stream.getvalue() == "abc\ndef\nghi\n" and stream.writes == 1
+        out.write("x\n")
+    assert stream.getvalue().endswith("x\n") and out.size == 0
+    out.write("y\n")
+    assert stream.writes == 3
+
+
+def test_unbuffered_writes_through(monkeypatch):
+    out, stream = Output(), io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', stream)
+    out.write("a")
+    assert stream.getvalue() == "a"
+
+
+def test_stream_lines(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text("one\ntwo\nthree", encoding='utf-8')
+    stream = Stream(open(path, encoding='utf-8'))
+    lines = []
+    while not stream.eof():
+        lines.append(stream.readLine())
+    stream.close()
+    assert lines == ["one", "two", "three"] and stream.file is None
+
+
+def test_read_file(tmp_path, monkeypatch):
+    small, big = tmp_path / 's.txt', tmp_path / 'b.txt'
+    small.write_text("小文件", encoding='utf-8')
+    big.write_text("行\n" * 100, encoding='utf-8')
+    monkeypatch.setattr(bio, 'MMAP_AT', 64)
+    assert readFile(str(small)) == "小文件"
+    assert readFile(str(big)) == "行\n" * 100
+    with pytest.raises(BIOError):
+        readFile(str(tmp_path / 'missing.txt'))
+
+
+def test_file_builtins(tmp_path, capsys):
+    path = tmp_path / 'a.txt'
+    path.write_text("1\n22\n333\n", encoding='utf-8')
+    code = '''
+var f: File = lines("{}");
+var n: Int = 0;
+while !eof(f) {{ n = n + len(readLine(f)); }}
+close(f);
+print(n);
+print(len(readFile("{}")));
+'''.format(path, path)
+    for mode in ('tree', 'closure', 'vm', 'python'):
+        run(code, mode)
+        assert capsys.readouterr().out == "6\n9\n"
+    with pytest.raises(BIOError):
+        run('var f: File; readLine(f);')
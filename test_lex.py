@@ -0,0 +1,44 @@
+"""
+词法分析的测试：一遍扫描的结果、位置和出错时的报告
+"""
+import pytest
+
+from bdata import TokenType
+from berror import BLexerError
+from blex import Lexer
+
+
+def values(code: str) -> list:
+    return [tok.val for tok in Lexer(code).tokens()]
+
+
+def test_tokens_and_positions():
+    code = 'var x: Int = 12; // 注释\n/* 多行\n注释 */ x <= 3.5'
+    toks = list(Lexer(code).tokens())
+    assert [t.val for t in toks] == ['var', 'x', ':', 'Int', '=', 12, ';', 'x', '<=', 3.5, None]
+    assert toks[-1].tp == TokenType.EOF
+    assert [code[t.pos] for t in toks[:-1]] == ['v', 'x', ':', 'I', '=', '1', ';', 'x', '<', '3']
+
+
+def test_constants_and_escapes():
+    assert values(r'True False None "a\tb\x41中" ' + "'q'") == [True, False, None, 'a\tbA中', 'q', None]
+
+
+def test_tokens_are_lazy():
+    # 后面的错误要等读到那里才报
+    stream = Lexer('a b $').tokens()
+    assert next(stream).val == 'a' and next(stream).val == 'b'
+    with pytest.raises(BLexerError):
+        next(stream)
+
+
+@pytest.mark.parametrize('code, where', [
+    ('x = 1.2.3;', (1, 5)),
+    ('x = "abc', (1, 5)),
+    ('\n  /* never closed', (2, 3)),
+    ('a\n b # c', (2, 4)),
+])
+def test_errors_are_located(code: str, where: tuple[int, int]):
+    with pytest.raises(BLexerError) as e:
+        list(Lexer(code).tokens())
+    assert e.value.locate() == where
@@ -0,0 +1,74 @@
+"""
+纯函数结果缓存的测试：返回可变对象的函数不能缓存，没有返回值的函数也要能命中
+"""
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+import brun
+from bbuiltins import Int
+from bmemo import LRUCache, MemoFunc, Memoizer
+from btype import Value
+
+ALIAS = '''
+func make(): StringBuilder { var sb: StringBuilder; return sb; }
+var a: StringBuilder = make();
+append(a, "x");
+var b: StringBuilder = make();
+print(toString(b));
+'''
+
+VOID = '''
+func work(n: Int) { var x: Int = n * 2; }
+work(3);
+work(3);
+work(4);
+'''
+
+
+def run(code: str, memoizer: Memoizer | None = None, mode: str = 'tree') -> str:
+    tree, scope = brun.load(code, memoizer=memoizer)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        brun.modes[mode](tree, scope)
+    return out.getvalue()
+
+
+def test_mutable_result_not_memoized():
+    for mode in ('tree', 'closure', 'vm'):
+        memoizer = Memoizer(16)
+        assert run(ALIAS, memoizer, mode) == run(ALIAS, mode=mode) == "\n"
+        assert memoizer.caches == {}
+
+
+def test_void_result_hits():
+    memoizer = Memoizer(16)
+    run(VOID, memoizer)
+    assert memoizer.stats() == {'work Int': {'hits': 1, 'misses': 2, 'evictions': 0, 'size': 2}}
+
+
+class Counting:
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, args: list) -> None:
+        self.calls += 1
+        return None
+
+
+def test_stored_none_is_a_hit():
+    func = Counting()
+    memo = MemoFunc(func, LRUCache(16))
+    for _ in range(3):
+        assert memo(Value(Int, 1)) is None
+    assert func.calls == 1
+
+
+def test_python_mode_rejects_memo(tmp_path, capsys):
+    with pytest.raises(ValueError):
+        brun.run(VOID, 'python', memoizer=Memoizer(16))
+    src = tmp_path / 'a.bf'
+    src.write_text(VOID, encoding='utf-8')
+    assert brun.main([str(src), '--mode', 'python', '--memo', '16']) == 2
+    assert "--memo" in capsys.readouterr().err
@@ -0,0 +1,95 @@
+"""
+优化器的测试：折叠、裁剪、删除和外提的结果，以及-O前后各模式的输出一致
+"""
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from bast import *
+from bopt import Optimizer
+from brun import load, modes
+
+
+def optimize(code: str) -> tuple[Block, Optimizer]:
+    opt = Optimizer()
+    tree, _ = load(code, optimizer=opt)
+    return tree, opt
+
+
+def output(code: str, mode: str, optimizer: Optimizer | None = None) -> str:
+    tree, scope = load(code, optimizer=optimizer)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        modes[mode](tree, scope)
+    return out.getvalue()
+
+
+def test_fold():
+    tree, opt = optimize('var x: Int = 2 * 3 + 1; var y: Bool = -x < 0;')
+    (_, _, val), = tree.stmts[0].vardecls
+    assert isinstance(val, Const) and val.val == 7
+    assert opt.stats['folded'] == 2
+
+
+def test_fold_keeps_runtime_errors():
+    tree, opt = optimize('var x: Int = 1 / 0;')
+    assert isinstance(tree.stmts[0].vardecls[0][2], BinaryOp)
+    assert opt.stats['folded'] == 0
+
+
+def test_prune_and_drop():
+    tree, opt = optimize('''
+if 1 > 2 { print(1); } else if 2 > 1 { print(2); } else { print(3); }
+while 1 == 2 { print(4); }
+func f(): Int { return 1; print(5); print(6); }
+''')
+    assert [type(i).__name__ for i in tree.stmts] == ['If', 'FuncDef']
+    (if_stmt, func) = tree.stmts
+    assert if_stmt.cases == [] and len(if_stmt.default.stmts) == 1
+    assert len(func.body.stmts) == 1
+    assert opt.stats['pruned'] == 3 and opt.stats['dropped'] == 2
+
+
+def test_hoist_invariant():
+    tree, opt = optimize('''
+var n: Int = 5;
+var i: Int = 0;
+var s: Int = 0;
+while i < n * n { s = s + (n * 2 - 1); i = i + 1; }
+''')
+    decls = [i for i in tree.stmts if isinstance(i, VarDecl) and i.vardecls[0][0].startswith('$inv')]
+    assert len(decls) == 2 and isinstance(tree.stmts[-1], While)
+    assert opt.stats['hoisted'] == 2
+
+
+def test_no_hoist_of_assigned_or_across_calls():
+    _, opt = optimize('''
+var n: Int = 5;
+var i: Int = 0;
+while i < n * 2 { n = n - 1; i = i + 1; }
+func g(): Int { return 1; }
+var k: Int = 0;
+while k < i * 2 { k = k + g(); }
+''')
+    assert opt.stats['hoisted'] == 0
+
+
+PROGRAM = '''
+var n: Int = 7;
+var i: Int = 0;
+var s: Int = 0;
+while i < n * 3 {
+    var t: Int = i * (n + 1) - 2 * 4;
+    if 3 > 4 { s = 0; } else if t % 2 == 0 { s = s + t; } else { s = s - (n * n); }
+    i = i + 1;
+}
+func f(x: Int): Int { if 1 == 1 { return x * (2 + 3); } return 0; }
+print(s);
+print(f(s));
+'''
+
+
+@pytest.mark.parametrize('mode', ['tree', 'closure', 'vm', 'python'])
+def test_optimized_output_matches(mode: str):
+    assert output(PROGRAM, mode, Optimizer()) == output(PROGRAM, mode) == output(PROGRAM, 'tree')
@@ -0,0 +1,57 @@
+"""
+语法分析和检查的测试：优先级、结合性、出错位置，以及没有返回类型的函数里的return;
+"""
+import pytest
+
+from bast import *
+from berror import BException, BParserError
+from blex import Lexer
+from bparser import Parser
+from brun import load, run
+
+
+def parse(code: str) -> Block:
+    lexer = Lexer(code)
+    return Parser(lexer.tokens(), lexer.source).program()
+
+
+def shape(node: Expr) -> Any:
+    if isinstance(node, BinaryOp):
+        return node.op, shape(node.left), shape(node.right)
+    if isinstance(node, Assign):
+        return '=', node.name, shape(node.val)
+    if isinstance(node, Variable):
+        return node.name
+    return node.val
+
+
+def test_precedence_and_associativity():
+    (stmt,) = parse('a = b = 1 + 2 * 3 - 4 < 5;').stmts
+    assert shape(stmt.expr) == ('=', 'a', ('=', 'b', ('<', ('-', ('+', 1, ('*', 2, 3)), 4), 5)))
+
+
+def test_error_position():
+    with pytest.raises(BParserError) as e:
+        parse('var x: Int = 1;\nfunc f( { }')
+    assert e.value.locate() == (2, 9)
+
+
+VOID = '''
+func f(n: Int) {
+    if n > 1 { print(1); return; }
+    print(2);
+}
+f(3);
+f(0);
+'''
+
+
+@pytest.mark.parametrize('mode', ['tree', 'closure', 'vm', 'python'])
+def test_bare_return_in_void_function(mode: str, capsys):
+    run(VOID, mode)
+    assert capsys.readouterr().out == "1\n2\n"
+
+
+def test_bare_return_needs_void_function():
+    with pytest.raises(BException):
+        load('func f(n: Int): Int { if n > 1 { return; } return n; }')
@@ -0,0 +1,29 @@
+"""
+性能分析的测试：加速换了类的节点不能拆成两行，加速统计每次运行重新计数
+"""
+from bast import QUICKEN_AT, quick_stats
+from bprof import Profiler
+from brun import run
+
+LOOP = '''
+var i: Int = 0;
+while i < 100 { i = i + 1; }
+'''
+
+
+def test_quickened_nodes_keep_one_row():
+    profiler = Profiler()
+    run(LOOP, profiler=profiler)
+    kinds = [kind for kind, pos in profiler.nodes]
+    assert not [k for k in kinds if k.startswith('Quick')]
+    add = profiler.nodes['BinaryOp', LOOP.index('i + 1') + 2]
+    assert add.hits == 100
+    assert quick_stats['quickened'] > 0
+
+
+def test_quick_stats_per_run():
+    run(LOOP)
+    first = dict(quick_stats)
+    run(LOOP)
+    assert quick_stats == first
+    assert first['quickened'] > 0 and QUICKEN_AT < 100
@@ -0,0 +1,53 @@
+"""
+转译成Python的测试：基本类型运算不装箱，marshal缓存命中时跳过分析
+"""
+import os
+
+import pytest
+
+import brun
+from bbuiltins import Int
+from bpy import Generator, Program, cache_path
+
+CODE = '''
+func fib(n: Int): Int { if n < 2 { return n; } return fib(n - 1) + fib(n - 2); }
+var r: Int = fib(15);
+var s: String = "a" + "b";
+'''
+
+
+def test_native_arithmetic():
+    tree, _ = brun.load('var x: Int = 1; var y: Int = x * 3 + 2;')
+    source, _ = Generator().generate(tree)
+    assert "= ((v1_x * 3) + 2)" in source
+    assert "_L[" not in source and "_V(" not in source
+
+
+def test_exports_are_boxed():
+    scope = brun.run(CODE, 'python')
+    assert scope.slots[0].tp is Int and scope.slots[0].val == 610
+    assert str(scope.slots[1].val) == "ab"
+
+
+def test_cache_hit_skips_analysis(tmp_path, monkeypatch):
+    path = cache_path(CODE, "<string>", str(tmp_path))
+    brun.run(CODE, 'python', cache_dir=str(tmp_path))
+    assert os.path.exists(path)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("source analysed on a cache hit")
+    monkeypatch.setattr(brun, 'load', fail)
+    assert brun.run(CODE, 'python', cache_dir=str(tmp_path)).slots[0].val == 610
+    # -O的程序用不同的缓存
+    with pytest.raises(AssertionError):
+        brun.run(CODE, 'python', cache_dir=str(tmp_path), optimizer=brun.Optimizer())
+
+
+def test_bad_cache_is_regenerated(tmp_path):
+    path = cache_path(CODE, "<string>", str(tmp_path))
+    os.makedirs(tmp_path, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'not marshal')
+    assert Program.load(path) is None
+    assert brun.run(CODE, 'python', cache_dir=str(tmp_path)).slots[0].val == 610
+    assert Program.load(path) is not None
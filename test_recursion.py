@@ -0,0 +1,26 @@
+"""
+深递归的测试：Python栈溢出要变成Butterfly的运行时错误，不能直接抛出RecursionError
+"""
+import pytest
+
+from berror import BRecursionError
+from brun import run
+
+DEEP = '''
+func sum(n: Int): Int {
+    if n == 0 { return 0; }
+    return n + sum(n - 1);
+}
+var r: Int = sum(100000);
+'''
+
+
+@pytest.mark.parametrize('mode', ['tree', 'closure', 'python'])
+def test_deep_recursion_is_a_runtime_error(mode: str, tmp_path):
+    with pytest.raises(BRecursionError) as e:
+        run(DEEP, mode, cache_dir=str(tmp_path))
+    assert "tail call" in str(e.value)
+
+
+def test_vm_runs_deep_recursion():
+    assert run(DEEP, 'vm').slots[-1].val == 100000 * 100001 // 2
@@ -0,0 +1,60 @@
+"""
+字符串的测试：Rope追加共用片段列表不改旧值，StringBuilder和各种转换
+"""
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from brun import load, modes
+from bstring import SMALL, Rope, concat
+
+
+def test_small_concat_is_plain_str():
+    assert concat("ab", "cd") == "abcd" and type(concat("ab", "cd")) is str
+
+
+def test_rope_append_shares_and_forks():
+    a = concat("x" * SMALL, "y")
+    assert type(a) is Rope and len(a) == SMALL + 1
+    b = concat(a, "1")
+    c = concat(b, "2")
+    # b是列表最新的一段，c直接追加在同一个列表后面
+    assert c.parts is b.parts
+    # 从b再追加一次就要复制，不能改c已经用到的部分
+    d = concat(b, "3")
+    assert d.parts is not c.parts
+    assert str(a) == "x" * SMALL + "y"
+    assert str(c).endswith("y12") and str(d).endswith("y13") and str(b).endswith("y1")
+    assert c == str(c) and c != d and hash(c) == hash(str(c))
+
+
+def test_concat_flattens_right_rope():
+    a = concat("x" * SMALL, "y")
+    assert concat("z", a) == "z" + str(a)
+    assert concat(a, "") is a
+
+
+PROGRAM = '''
+var s: String = "";
+var i: Int = 0;
+while i < 200 { s = s + toString(i % 10); i = i + 1; }
+var sb: StringBuilder;
+append(sb, "n=");
+append(sb, toString(len(s)));
+append(sb, toString(1.5));
+append(sb, toString(1 < 2));
+print(toString(sb));
+print(len(sb));
+print(s == s + "");
+'''
+
+
+@pytest.mark.parametrize('mode', ['tree', 'closure', 'vm', 'python'])
+def test_strings_in_all_modes(mode: str):
+    tree, scope = load(PROGRAM)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        modes[mode](tree, scope)
+    assert out.getvalue() == "n=2001.5True\n12\nTrue\n"
+    assert str(scope.slots[0].val) == "0123456789" * 20
@@ -0,0 +1,86 @@
+"""
+类型的测试：扁平化的方法表、属性布局和BasicType驻留
+"""
+import pickle
+
+from btype import *
+
+
+def method(name: str):
+    return lambda this: name
+
+
+def test_method_table_follows_mro():
+    a = TypeDetail('A', {('f', ()): (None, method('A.f')), ('g', ()): (None, method('A.g'))}, {}, [])
+    b = TypeDetail('B', {('f', ()): (None, method('B.f'))}, {}, [])
+    c = TypeDetail('C', {}, {}, [b, a])
+    assert [tp.name for tp in c.mro()] == ['C', 'B', 'A']
+    assert c.getMethod(('f', ()))[1](None) == 'B.f'
+    assert c.hasMethod(('g', ())) and not c.hasMethod(('h', ()))
+    assert c.findMethod(('h', ())) is None
+
+
+def test_method_table_invalidation():
+    a = TypeDetail('A', {}, {}, [])
+    c = TypeDetail('C', {}, {}, [a])
+    assert not c.hasMethod(('f', ()))
+    # 改父类的方法表，子类缓存的表要重建
+    a.method[('f', ())] = (None, method('A.f'))
+    assert c.hasMethod(('f', ()))
+    del a.method[('f', ())]
+    assert not c.hasMethod(('f', ()))
+    b = TypeDetail('B', {('f', ()): (None, method('B.f'))}, {}, [])
+    c.parents = [b]
+    assert c.hasMethod(('f', ()))
+
+
+def test_shape_layout_and_defaults():
+    a = TypeDetail('A', {}, {'x': 1, 'items': []}, [])
+    b = TypeDetail('B', {}, {'x': 2, 'y': (1, 2)}, [a])
+    shape = b.shape()
+    assert shape.names == ('x', 'items', 'y') and shape.template == (2, [], (1, 2))
+    # 只有可变的默认值要拷贝
+    assert shape.mutable == (1,)
+    first, second = b.new(), b.new()
+    assert first.val == [2, [], (1, 2)]
+    assert first.val[1] is not second.val[1] and first.val[2] is second.val[2]
+    assert b.getAttrs() == {'x': 2, 'items': [], 'y': (1, 2)}
+
+
+def test_shape_invalidation():
+    a = TypeDetail('A', {}, {'x': 1}, [])
+    b = TypeDetail('B', {}, {}, [a])
+    assert b.new().val == [1]
+    a.attrs['z'] = 3
+    assert b.new().val == [1, 3]
+
+
+def test_init_runs_on_new():
+    def init(this: Value) -> Value:
+        this.val[0] = 42
+        return this
+    a = TypeDetail('A', {('operator init', ()): (None, init)}, {'x': 0}, [])
+    assert a.new().val == [42]
+
+
+def test_basic_types_are_interned():
+    assert BasicType('Int') is BasicType('Int')
+    assert pickle.loads(pickle.dumps(BasicType('Int'))) is BasicType('Int')
+    assert {(BasicType('Int'), BasicType('Bool')): 1}[BasicType('Int'), BasicType('Bool')] == 1
+
+
+def test_overload_lookup_and_conversion():
+    scope = Scope()
+    a = TypeDetail('A', {}, {}, [])
+    b = TypeDetail('B', {}, {}, [a])
+    c = TypeDetail('C', {}, {}, [b])
+    scope.types = {'A': a, 'B': b, 'C': c}
+    A, B, C = map(BasicType, 'ABC')
+    scope.defineFunc(('f', (A,)), (None, 'f(A)'))
+    scope.defineFunc(('f', (B,)), (None, 'f(B)'))
+    inner = Scope(scope)
+    assert inner.lookupFunc(('f', (A,))) == (1, (None, 'f(A)'))
+    # 没有f(C)，选转换步数最少的f(B)
+    assert inner.findFunc(('f', (C,))) == (None, 'f(B)')
+    assert scope.overloads == {'f': [(A,), (B,)]}
+    assert keyName(('f', (A, B))) == 'f A B'
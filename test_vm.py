@@ -0,0 +1,55 @@
+"""
+虚拟机的测试：合并指令、循环作用域复用和帧栈要和树解释器的结果一样
+"""
+import io
+from contextlib import redirect_stdout
+
+from brun import load, modes
+from bvm import Compiler, opnames
+
+LOOPS = '''
+func find(n: Int): Int {
+    var i: Int = 0;
+    while i < n {
+        var j: Int = i * i;
+        if j > 50 { return i; }
+        i = i + 1;
+    }
+    return 0 - 1;
+}
+var k: Int = 0;
+var s: Int = 0;
+while k < 10 {
+    var t: Int = k % 3;
+    k = k + 1;
+    if t == 0 { continue; }
+    while 1 == 1 {
+        var u: Int = t + find(k * 3);
+        s = s + u;
+        break;
+    }
+    if s > 100 { break; }
+}
+print(s);
+print(find(4));
+print(find(100));
+'''
+
+
+def run(code: str, mode: str) -> str:
+    tree, scope = load(code)
+    out = io.StringIO()
+    with redirect_stdout(out):
+        modes[mode](tree, scope)
+    return out.getvalue()
+
+
+def test_control_flow_matches_tree():
+    assert run(LOOPS, 'vm') == run(LOOPS, 'tree')
+
+
+def test_fused_instructions():
+    tree, scope = load('var i: Int = 0; while i < 10 { i = i + 1; }')
+    ops = [opnames[ins[0]] for ins in Compiler(scope).compile(tree).insts]
+    assert 'JUMP_LC' in ops and 'BINARY_LC' in ops
+    assert 'BINARY' not in ops and 'JUMP_IF_FALSE' not in ops